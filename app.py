@@ -1,74 +1,560 @@
+import instrumentation
+
+# startup phases and callback latencies, served at /_metrics; the heavy libraries are
+# imported here one at a time so each gets its own timing
+metrics = instrumentation.Registry()
+boot = instrumentation.Boot(metrics)
+boot.import_modules("numpy","pandas","scipy.stats","plotly.graph_objs","dash","dash_core_components","dash_html_components","dash_table")
+
 import os
+import collections
 import dash
 import plotly.graph_objs as go
 import dash_core_components as dcc
 import dash_html_components as html
 import pandas as pd
 import numpy as np
-from scipy import stats 
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_table
 from plotly import tools
+from flask import Response, abort, jsonify, request
+from figure_cache import FigureCache
+from jobs import JobQueue
+from dataplane import Plane
+from recompute import Graph
+from downsample import downsample, visible_range
+import backtest
+import correlation_engine
+import frontier
+import fundamentals
+import precompressed
+from table_query import IndexedTable
+from regressions import linregress_frame, regression_table
+import resampling
+import screener
+from recessions import recessions
+import regimes
+
+boot.phase("imports")
+
+THRESHOLD = 10
+WINDOW = 30
+# months between hi-IIE stretches that still count as one period
+REGIME_GAP = 3
+TABLE_PAGE_SIZE = 20
+# background job processes per web worker; the resampled significance is split into as many jobs
+JOB_PROCESSES = int(os.environ.get("JOB_PROCESSES",2))
+# backtest grid: share of the portfolio moved into the tilt in hi-IIE years x the slider settings
+BACKTEST_AMOUNTS = np.linspace(0,1,21)
+BACKTEST_THRESHOLDS = range(0,51,5)
+BACKTEST_WINDOWS = range(12,61,6)
+# fundamentals fits with fewer quarters than this are not drawn
+MIN_QUARTERS = 3
+table_columns = ["asset-class","energy","inflation","interest","stdev","avg-return","median-return"]
+# permutation p-values of the correlations, table column -> regression indicator
+table_p_columns = collections.OrderedDict([("energy-p","energy"),("inflation-p","inflation"),("interest-p","prime")])
+
+# datasets are read-only views onto the shared data plane; see dataplane.py
+plane = Plane()
+datasets = plane.load()
+boot.phase("datasets")
+
+# sector rollups of the company filings, brought up to date with archive/metrics at startup; see fundamentals.py
+sector_store = fundamentals.SectorStore("quarterly")
+sector_store.update()
+boot.phase("fundamentals")
+
+# regression graphs, in layout order: indicator -> (graph id, title label, x-axis title, annotation x per regime)
+regression_panels = collections.OrderedDict([
+    ("prime", ("sector-vs-interest","Interest Rate","Interest Rate",dict(iie=20,not_iie=12))),
+    ("inflation", ("sector-vs-inflation","Inflation Rate","Inflation Rate",dict(iie=12,not_iie=5))),
+    ("energy", ("sector-vs-oil","Relative Energy Price","Energy Price as % of {}-month Rolling Avg",dict(iie=55,not_iie=55))),
+])
+regression_indicators = list(regression_panels)
+# regime -> (title prefix, graph id suffix)
+regression_regimes = collections.OrderedDict([
+    ("iie", ("Hi-IIE","")),
+    ("not_iie", ("Not-Hi-IIE","-other")),
+])
 
 
-indicators = pd.read_csv("data/indicators-hi-iie.csv",index_col=0).round(2)
-indicators_not_iie = pd.read_csv("data/indicators-not-hi-iie.csv",index_col=0).round(2)
-indicators_not_iie["oil_diff%_rolling_30"]*=100
-sectors = pd.read_csv("data/all-sectors-vs-sp500-iie.csv",index_col=0).round(2)
-sectors_not_iie = pd.read_csv("data/all-sectors-vs-sp500-not-iie.csv",index_col=0).round(2)
-correlations = pd.read_csv('data/correlation-analysis-all-sectors-vs-sp500.csv',index_col=0).round(2)
-correlations_not_iie = pd.read_csv('data/correlation-analysis-all-sectors-vs-sp500-not-iie.csv',index_col=0).round(2)
-
-# graph for difference between
-temp1 = (correlations-correlations_not_iie).round(2).drop("Austria")
-temp1["balanced"] = ((temp1.median_return+temp1.avg_return)/2).round(2)
-# graph for frontier in hi-IIE years
-temp2 = correlations.round(2)
-temp2["balanced"] = ((temp2.median_return+temp2.avg_return)/2).round(2)
-# graph for frontier in low-IIE years
-temp3 = correlations_not_iie.drop(['Austria',"Indonesia","Mexico"]).round(2)
-temp3["balanced"] = ((temp3.median_return+temp3.avg_return)/2).round(2)
-# table 1
-table_correlations = pd.read_csv("data/correlation-analysis-all-sectors-vs-sp500.csv").round(2)
-table_correlations.columns = ["asset-class","energy","inflation","interest","stdev","avg-return","median-return"]
-# table 2
-table_correlations_not_iie = pd.read_csv("data/correlation-analysis-all-sectors-vs-sp500-not-iie.csv").round(2)
-table_correlations_not_iie.columns = ["asset-class","energy","inflation","interest","stdev","avg-return","median-return"]
-# subplots graph - selecting indicators
-from recessions import recessions
-indicators_all = pd.read_csv('data/indicators - oil, rollingdiff%, prime, inflation.csv',index_col=0)
-recessions_fig = tools.make_subplots(rows=3,cols=1,shared_xaxes=False)
-trace1 = go.Scatter(x = indicators_all.index,
-                    y = indicators_all.inflation,
-                    name="inflation",
-                    yaxis="y1")
-trace2 = go.Scatter(x = indicators_all.index,
-                    y = indicators_all.prime,
-                    name = 'interest',
-                    yaxis="y2")
-trace3 = go.Scatter(x=indicators_all.index,
-                    y=indicators_all['oil_diff%_rolling_30'],
-                    name='energy % of rolling avg',
-                    yaxis="y3")
-recessions_fig.append_trace(trace1,1,1)
-recessions_fig.append_trace(trace2,2,1)
-recessions_fig.append_trace(trace3,3,1)
-recessions_fig['layout'].update(
-    height=675,
-    title = "Periods of High Interest, Inflation, & Energy",
-    yaxis = dict(title = 'Inflation'),
-    yaxis2 = dict(title = "Interest Rate"),
-    yaxis3 = dict(title = "Energy Price"),
-    legend = dict(orientation="h"),
-    shapes = recessions
-)
+def published(threshold, window):
+    return (threshold, window) == (THRESHOLD, WINDOW)
+
+
+def published_years():
+    return frozenset(pd.to_datetime(datasets["sectors"].index).year)
+
+
+def regime_years(threshold, window):
+    if published(threshold, window):
+        return published_years()
+    return regimes.detect(threshold/100.,window,gap=REGIME_GAP).years
+
+
+# everything below the sliders, re-derived only where a slider change reaches it
+analysis = Graph()
+
+
+@analysis.node("window")
+def annual_indicators(window):
+    frame = datasets["indicators_all"][["oil","prime","inflation"]].copy()
+    frame["energy"] = datasets["oil_annual"]["diff%_rolling_{}".format(window)].reindex(frame.index)*100
+    return frame
+
+
+@analysis.node("threshold","window")
+def hi_iie_years(threshold, window):
+    return regime_years(threshold, window)
+
+
+# unrounded hi-IIE and other years, for the statistics
+@analysis.node("hi_iie_years","annual_indicators")
+def raw_split(hi_iie_years, annual_indicators):
+    all_sectors = datasets["all_sectors"]
+    hi_indicators, lo_indicators = regimes.split(annual_indicators.loc[all_sectors.index],hi_iie_years)
+    hi_sectors, lo_sectors = regimes.split(all_sectors,hi_iie_years)
+    return hi_indicators, lo_indicators, hi_sectors, lo_sectors
+
+
+# rounded as displayed, for the regression graphs
+@analysis.node("threshold","window","raw_split")
+def split(threshold, window, raw_split):
+    if published(threshold, window):
+        return tuple(datasets[name] for name in ["indicators","indicators_not_iie","sectors","sectors_not_iie"])
+    return tuple(frame.round(2) for frame in raw_split)
+
+
+@analysis.node("raw_split")
+def correlation_frames(raw_split):
+    hi_indicators, lo_indicators, hi_sectors, lo_sectors = raw_split
+    return (
+        correlation_engine.summary(hi_sectors,hi_indicators).round(2),
+        correlation_engine.summary(lo_sectors,lo_indicators).round(2),
+    )
+
+
+@analysis.node("correlation_frames")
+def frontier_frames(correlation_frames):
+    correlations, correlations_not_iie = correlation_frames
+    # graph for difference between
+    temp1 = (correlations-correlations_not_iie).round(2).drop("Austria")
+    temp1["balanced"] = ((temp1.median_return+temp1.avg_return)/2).round(2)
+    # graph for frontier in hi-IIE years
+    temp2 = correlations.round(2)
+    temp2["balanced"] = ((temp2.median_return+temp2.avg_return)/2).round(2)
+    # graph for frontier in low-IIE years
+    temp3 = correlations_not_iie.drop(['Austria',"Indonesia","Mexico"]).round(2)
+    temp3["balanced"] = ((temp3.median_return+temp3.avg_return)/2).round(2)
+    return temp1, temp2, temp3
+
+
+# mean-variance frontiers of the plotted asset classes (or just `assets`), hi-IIE then other years
+@analysis.node("assets","raw_split","frontier_frames")
+def efficient_frontiers(assets, raw_split, frontier_frames):
+    hi_indicators, lo_indicators, hi_sectors, lo_sectors = raw_split
+    frontiers = []
+    for returns, frame in [(hi_sectors,frontier_frames[1]),(lo_sectors,frontier_frames[2])]:
+        columns = [col for col in frame.index if not assets or col in assets]
+        frontiers.append(frontier.efficient_frontier(returns[columns],frame.balanced))
+    return tuple(frontiers)
+
+
+# the correlation tables are paged, sorted and filtered here rather than in the browser
+@analysis.node("correlation_frames")
+def correlation_tables(correlation_frames):
+    return indexed_tables(correlation_frames)
+
+
+# the same with the permutation p-values filled in
+@analysis.node("correlation_frames","significance")
+def robust_correlation_tables(correlation_frames, significance):
+    return indexed_tables(correlation_frames,significance)
+
+
+def indexed_tables(correlation_frames, significance=None):
+    tables = []
+    for frame, regime in zip(correlation_frames,regression_regimes):
+        table = frame.reset_index()
+        table.columns = table_columns
+        for column, indicator in table_p_columns.items():
+            if significance is None:
+                table[column] = np.nan
+            else:
+                table[column] = significance.p_value[regime][indicator].reindex(frame.index).round(3).values
+        tables.append(IndexedTable(table))
+    return tables
+
+
+# every sector vs indicator fit, looked up by the regression callbacks
+@analysis.node("split")
+def regressions(split):
+    hi_indicators, lo_indicators, hi_sectors, lo_sectors = split
+    return regression_table({
+        "iie": (hi_indicators[regression_indicators],hi_sectors),
+        "not_iie": (lo_indicators[regression_indicators],lo_sectors),
+    })
+
+
+# block-bootstrap intervals and permutation p-values for the same fits; these take seconds, so background
+# jobs compute them a chunk of sectors each and keep them on disk (see compute_significance). the node
+# only reads them back, it never computes them in a request; raw_split ties it to the data they are of
+@analysis.node("threshold","window","raw_split")
+def significance(threshold, window, raw_split):
+    table = stored_significance(threshold,window)
+    if table is None:
+        raise LookupError("no resampled significance for threshold {} window {} yet".format(threshold,window))
+    return table
+
+
+def significance_key(threshold, window, chunk):
+    return dict(
+        threshold=threshold,
+        window=window,
+        data_version=plane.data_version,
+        draws=resampling.DRAWS,
+        seed=resampling.SEED,
+        confidence=resampling.CONFIDENCE,
+        chunk=chunk,
+        chunks=JOB_PROCESSES)
+
+
+def stored_significance(threshold, window):
+    """The resampled significance from the disk cache, or None until every chunk's job has written it."""
+    tables = [resampling.load(significance_key(threshold,window,chunk)) for chunk in range(JOB_PROCESSES)]
+    if any(table is None for table in tables):
+        return None
+    return pd.concat(tables).sort_index()
+
+
+def load_significance(threshold, window):
+    """The resampled significance for these settings if the jobs have finished it, else None."""
+    if not analysis.cached("significance",threshold=threshold,window=window):
+        table = stored_significance(threshold,window)
+        if table is None:
+            return None
+        analysis.seed("significance",table,threshold=threshold,window=window)
+    return analysis.get("significance",threshold=threshold,window=window)
+
+
+# monthly inflation, prime rate and energy vs its rolling average behind the period chart
+@analysis.node("window")
+def monthly_indicators(window):
+    flags = regimes.monthly_flags(regimes.THRESHOLD,window)
+    return flags[["inflation","interest","energy_diff"]]
+
+
+# quarter means of the monthly indicators for the sector fundamentals; a quarter is hi-IIE
+# (hi = 1) when at least half of its months are
+@analysis.node("threshold","window")
+def quarterly_indicators(threshold, window):
+    flags = regimes.monthly_flags(regimes.THRESHOLD,window)
+    monthly = pd.DataFrame(dict(
+        prime=flags.interest,
+        inflation=flags.inflation,
+        energy=flags.energy_diff*100,
+        hi=regimes.detect(threshold/100.,window,gap=REGIME_GAP).flags.astype(float)))
+    quarterly = monthly.groupby(monthly.index.to_period("Q")).mean()
+    quarterly.index = quarterly.index.astype(str)
+    quarterly["hi"] = (quarterly.hi >= .5).astype(float)
+    return quarterly
+
+
+# year-over-year growth of one sector aggregate, as it is regressed on the indicators
+@analysis.node("tag","how")
+def fundamental_growth(tag, how):
+    return fundamentals.growth(sector_store.frame(tag,how),sector_store.frequency)
+
+
+# subplots graph - selecting indicators, downsampled to the zoomed x range
+@analysis.node("threshold","window","x_range","monthly_indicators")
+def periods_figure(threshold, window, x_range, monthly_indicators):
+    start, end = x_range or (None, None)
+    figure = tools.make_subplots(rows=3,cols=1,shared_xaxes=True,print_grid=False)
+    for row, (column, name) in enumerate([("inflation","inflation"),("interest","interest"),("energy_diff","energy % of rolling avg")]):
+        series = downsample(monthly_indicators[column],start=start,end=end)
+        figure.append_trace(go.Scattergl(x=series.index,y=series.values,name=name,mode="lines"),row+1,1)
+    figure['layout'].update(
+        height=675,
+        title = "Periods of High Interest, Inflation, & Energy",
+        xaxis = dict(range=list(x_range)) if x_range else dict(autorange=True),
+        yaxis = dict(title = 'Inflation'),
+        yaxis2 = dict(title = "Interest Rate"),
+        yaxis3 = dict(title = "Energy Price"),
+        legend = dict(orientation="h"),
+        shapes = recessions if published(threshold, window) else regimes.detect(threshold/100.,window,gap=REGIME_GAP).shapes
+    )
+    return figure
+
+
+@analysis.node("frontier_frames")
+def differences_figure(frontier_frames):
+    temp1 = frontier_frames[0]
+    return go.Figure(
+        data = [
+            go.Scatter(
+                x=temp1.clip(-20,20,axis=0).stdev_,
+                y=temp1.clip(-20,20,axis=0).avg_return,
+                mode="markers",
+                text=["{}, {}, {}".format(col,temp1.loc[col,"stdev_"],temp1.loc[col,"avg_return"]) for col in temp1.index],
+                marker=dict(size=15),
+                hoverinfo='text'
+            )
+        ],
+        layout = go.Layout(
+            title="Return vs S&P500 and Risk: Difference Between Hi-IIE & Non-Hi-IIE Periods",
+            titlefont=dict(size=15),
+            hovermode="closest",
+            xaxis=dict(title="Difference in Volatility of Returns"),
+            yaxis=dict(title="Difference in Avg Returns vs S&P 500"),
+            height=600,
+            shapes=[        
+                {
+                    'type': 'rect',
+                    'xref': 'x',
+                    'yref': 'y',
+                    'x0': -20,
+                    'y0': 0,
+                    'x1': 0,
+                    'y1': 20,
+                    'fillcolor': 'green',
+                    'opacity': .3,
+                    'line': {
+                        'width': 0,
+                    }
+                },
+                {
+                    'type': 'rect',
+                    'xref': 'x',
+                    'yref': 'y',
+                    'x0': 0,
+                    'y0': 0,
+                    'x1': 20,
+                    'y1': 20,
+                    'fillcolor': 'green',
+                    'opacity': .085,
+                    'line': {
+                        'width': 0,
+                    }
+                },
+                {
+                    'type': 'rect',
+                    'xref': 'x',
+                    'yref': 'y',
+                    'x0': 0,
+                    'y0': -13.5,
+                    'x1': 20,
+                    'y1': 0,
+                    'fillcolor': 'red',
+                    'opacity': .3,
+                    'line': {
+                        'width': 0,
+                    }
+                },
+                {
+                    'type': 'rect',
+                    'xref': 'x',
+                    'yref': 'y',
+                    'x0': -20,
+                    'y0': -13.5,
+                    'x1': 0,
+                    'y1': 0,
+                    'fillcolor': 'red',
+                    'opacity': .085,
+                    'line': {
+                        'width': 0,
+                    }
+                }
+            ]
+        )
+    )
+
+
+def frontier_traces(efficient):
+    if efficient is None:
+        return []
+    # the curve is cut where the points are capped
+    shown = efficient.volatility <= 30
+    point = efficient.tangency
+    weights = efficient.weights.iloc[point]
+    weights = weights[weights >= .005].sort_values(ascending=False)
+    return [
+        go.Scatter(
+            x=efficient.volatility[shown].round(2),
+            y=efficient.returns[shown].round(2),
+            mode="lines",
+            name="Efficient frontier",
+            hoverinfo='x+y'
+        ),
+        go.Scatter(
+            x=[round(efficient.volatility[point],2)],
+            y=[round(efficient.returns[point],2)],
+            mode="markers",
+            name="Tangency portfolio",
+            text=["Tangency portfolio, {}, {}<br>{}".format(
+                round(efficient.volatility[point],2),
+                round(efficient.returns[point],2),
+                "<br>".join("{}: {:.0%}".format(col,weight) for col, weight in weights.items()))],
+            marker=dict(size=20,symbol="star"),
+            hoverinfo='text'
+        ),
+    ]
+
+
+def frontier_figure(frame, title, efficient):
+    return go.Figure(
+        data = [
+            go.Scatter(
+                x=frame.stdev_.clip_upper(30,axis=0),
+                y=frame.balanced.clip_upper(30,axis=0),
+                mode="markers",
+                name="Asset classes",
+                text=["{}, {}, {}".format(col,frame.loc[col,"stdev_"],frame.loc[col,"balanced"]) for col in frame.index],
+                marker=dict(size=15),
+                hoverinfo='text'
+            ),
+        ] + frontier_traces(efficient),
+        layout = go.Layout(
+            title=title,
+            hovermode="closest",
+            xaxis=dict(title="Volatility"),
+            yaxis=dict(title="Return vs S&P 500"),
+            height=600,
+            shapes=[
+                {
+                    'type': 'rect',
+                    'xref': 'paper',
+                    'yref': 'y',
+                    'x0': 0,
+                    'y0': 0,
+                    'x1': 1,
+                    'y1': 30,
+                    'fillcolor': 'green',
+                    'opacity': .085,
+                    'line': {
+                        'width': 0,
+                    }
+                },
+                {
+                    'type': 'rect',
+                    'xref': 'paper',
+                    'yref': 'y',
+                    'x0': 0,
+                    'y0': -12,
+                    'x1': 1,
+                    'y1': 0,
+                    'fillcolor': 'red',
+                    'opacity': .085,
+                    'line': {
+                        'width': 0,
+                    }
+                },
+            ] # end of shapes
+        ), # end of go.Layout
+    ) # end of go.Figure
+
+
+def frontier_summary(frame, correlations):
+    return """**Returns** : 
+* Median-Balanced Average: **{}** 
+* Average: {}
+* Median: {}
+
+**Volatility**
+* Median-Balanced Average: **{}** 
+* Average: {}
+* Median: {}
+""".format(
+        round(frame.balanced.mean(),2),
+        round(correlations.avg_return.mean(),2),
+        round(correlations.avg_return.median(),2),
+        round((correlations.stdev_.mean()+correlations.stdev_.median())/2,2),
+        round(correlations.stdev_.mean(),2),
+        round(correlations.stdev_.median(),2),
+    )
+
+
+@analysis.node("frontier_frames","efficient_frontiers")
+def high_iie_figure(frontier_frames, efficient_frontiers):
+    return frontier_figure(frontier_frames[1],"Return vs Volatility - Frontier During High-IIE Periods",efficient_frontiers[0])
+
+
+@analysis.node("frontier_frames","efficient_frontiers")
+def not_high_iie_figure(frontier_frames, efficient_frontiers):
+    return frontier_figure(frontier_frames[2],"Return and Risk - Frontier During Non-High-IIE Periods",efficient_frontiers[1])
+
+
+@analysis.node("frontier_frames","correlation_frames")
+def high_iie_summary(frontier_frames, correlation_frames):
+    return frontier_summary(frontier_frames[1],correlation_frames[0])
+
+
+@analysis.node("frontier_frames","correlation_frames")
+def not_high_iie_summary(frontier_frames, correlation_frames):
+    return frontier_summary(frontier_frames[2],correlation_frames[1])
+
+
+# backtests over the years the S&P 500 covers, hi-IIE years by every slider setting
+@analysis.node()
+def backtest_returns():
+    returns = datasets["asset_returns"]
+    return returns[returns["S&P 500"].notnull()]
+
+
+@analysis.node("backtest_returns")
+def backtest_regimes(backtest_returns):
+    return collections.OrderedDict(
+        ((threshold, window), backtest.regime_flags(backtest_returns.index,regime_years(threshold,window)))
+        for threshold in BACKTEST_THRESHOLDS
+        for window in BACKTEST_WINDOWS
+    )
+
+
+@analysis.node("base","tilt","backtest_returns","backtest_regimes")
+def backtest_grid(base, tilt, backtest_returns, backtest_regimes):
+    columns = backtest_returns.columns
+    grid = backtest.grid_search(
+        backtest_returns,
+        backtest.weights(columns,base),
+        backtest.weights(columns,tilt),
+        BACKTEST_AMOUNTS,
+        backtest_regimes,
+        backtest_returns[backtest.RISK_FREE])
+    results = grid.results
+    results["threshold"] = [label[0] for label in results.label]
+    results["window"] = [label[1] for label in results.label]
+    return grid
+
 
 external_stylesheet = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 app = dash.Dash(__name__,external_stylesheets=external_stylesheet)
 server = app.server
+# PROFILE_CALLBACKS lets /_metrics/profile arm a cProfile capture of one callback request
+profiler = instrumentation.Profiler() if os.environ.get("PROFILE_CALLBACKS") else None
+instrumentation.instrument(app,metrics,profiler)
+instrumentation.request_hooks(server,metrics)
 
 app.title = "Asset Classes"
-app.layout = html.Div([
+
+
+# below the fold, sections start empty: assets/lazy.js clicks a section's hidden trigger button the first
+# time the section scrolls into view (or its tab is opened), and the callbacks that fill it wait for that
+def lazy_section(name, children, min_height="450px", style=None):
+    trigger = html.Button(id=name+'-visible',n_clicks=0,className='lazy-trigger',style=dict(display='none'))
+    return html.Div([trigger]+children,id=name+'-section',className='lazy-section',style=dict(style or {},minHeight=min_height))
+
+
+def visible_input(name):
+    return Input(name+'-visible','n_clicks')
+
+
+def require_visible(n_clicks):
+    if not n_clicks:
+        raise PreventUpdate
+
+
+analysis_layout = html.Div([
     # Analysis Text and Charts
     html.Div([
         html.H1("Asset Class Analysis",style=dict(textAlign='center')),
@@ -118,14 +604,46 @@ interest were higher than the preceding trend.
 #### Selecting High-IIE Periods
 
 This chart shows how I selected high-IIE periods - selected the periods that are high in all three.
-High-IIE periods are shown with shading boxes.
+High-IIE periods are shown with shading boxes. Move the sliders to redefine hi-IIE periods; every chart
+and table below follows.
 
         """)
         ],style=dict(marginLeft='auto',marginRight='auto',width='75%')),
         html.Div([
+            html.Div([
+                html.Label("Energy price over its rolling average (%)"),
+                dcc.Slider(
+                    id='threshold-slider',
+                    min=0,
+                    max=50,
+                    step=5,
+                    value=THRESHOLD,
+                    marks={i:"{}%".format(i) for i in range(0,51,10)}
+                )
+            ],style=dict(display='inline-block',width='45%',padding='0 2.5%')),
+            html.Div([
+                html.Label("Rolling average window (months)"),
+                dcc.Slider(
+                    id='window-slider',
+                    min=12,
+                    max=60,
+                    step=6,
+                    value=WINDOW,
+                    marks={i:str(i) for i in range(12,61,12)}
+                )
+            ],style=dict(display='inline-block',width='45%',padding='0 2.5%')),
+        ],style=dict(paddingBottom='40px')),
+        html.Div(id='analysis-status',style=dict(textAlign='center',fontStyle='italic')),
+        dcc.Store(id='analysis-job',data=dict(threshold=THRESHOLD,window=WINDOW,keys=[])),
+        dcc.Store(id='analysis-ready',data=dict(threshold=THRESHOLD,window=WINDOW)),
+        dcc.Interval(id='analysis-poll',interval=500,disabled=True),
+        dcc.Store(id='significance-job',data=dict(threshold=THRESHOLD,window=WINDOW,keys=[])),
+        dcc.Store(id='significance-ready'),
+        dcc.Interval(id='significance-poll',interval=1000,disabled=True),
+        html.Div([
+            # the figure comes from update_periods_graph, which runs on page load anyway
             dcc.Graph(
-                id='selecting-iie-periods-graph',
-                figure = recessions_fig
+                id='selecting-iie-periods-graph'
             )# end of dcc.Graph
         ]),
         dcc.Markdown(
@@ -149,88 +667,8 @@ rates, inflation, and energy prices and periods where those three conditions are
 
 """            
         ),
-        html.Div([
-            dcc.Graph(
-                id='differences graph',
-                figure = go.Figure(
-                    data = [
-                        go.Scatter(
-                            x=temp1.clip(-20,20,axis=0).stdev_,
-                            y=temp1.clip(-20,20,axis=0).avg_return,
-                            mode="markers",
-                            text=["{}, {}, {}".format(col,temp1.loc[col,"stdev_"],temp1.loc[col,"avg_return"]) for col in temp1.index],
-                            marker=dict(size=15),
-                            hoverinfo='text'
-                        )
-                    ],
-                    layout = go.Layout(
-                        title="Return vs S&P500 and Risk: Difference Between Hi-IIE & Non-Hi-IIE Periods",
-                        titlefont=dict(size=15),
-                        hovermode="closest",
-                        xaxis=dict(title="Difference in Volatility of Returns"),
-                        yaxis=dict(title="Difference in Avg Returns vs S&P 500"),
-                        height=600,
-                        shapes=[        
-                            {
-                                'type': 'rect',
-                                'xref': 'x',
-                                'yref': 'y',
-                                'x0': -20,
-                                'y0': 0,
-                                'x1': 0,
-                                'y1': 20,
-                                'fillcolor': 'green',
-                                'opacity': .3,
-                                'line': {
-                                    'width': 0,
-                                }
-                            },
-                            {
-                                'type': 'rect',
-                                'xref': 'x',
-                                'yref': 'y',
-                                'x0': 0,
-                                'y0': 0,
-                                'x1': 20,
-                                'y1': 20,
-                                'fillcolor': 'green',
-                                'opacity': .085,
-                                'line': {
-                                    'width': 0,
-                                }
-                            },
-                            {
-                                'type': 'rect',
-                                'xref': 'x',
-                                'yref': 'y',
-                                'x0': 0,
-                                'y0': -13.5,
-                                'x1': 20,
-                                'y1': 0,
-                                'fillcolor': 'red',
-                                'opacity': .3,
-                                'line': {
-                                    'width': 0,
-                                }
-                            },
-                            {
-                                'type': 'rect',
-                                'xref': 'x',
-                                'yref': 'y',
-                                'x0': -20,
-                                'y0': -13.5,
-                                'x1': 0,
-                                'y1': 0,
-                                'fillcolor': 'red',
-                                'opacity': .085,
-                                'line': {
-                                    'width': 0,
-                                }
-                            }
-                        ]
-                    )
-                ),
-            )
+        lazy_section('differences',[
+            dcc.Graph(id='differences graph')
         ]),
         html.Div([
             dcc.Markdown(
@@ -246,79 +684,24 @@ hovering over a data point shows its true value. **Returns are shown relative to
 High-IIE periods display high volatility for many asset classes, especially positive. Many asset classes 
 perform well, but positive outliers perform very well.
 
-**Returns** : 
-* Median-Balanced Average: **{}** 
-* Average: {}
-* Median: {}
+The line is the efficient frontier: the long-only mixes of asset classes with the highest return for their
+volatility. The star is the mix with the most return per unit of volatility; hover over it for its weights.
+Pick asset classes below to draw the frontiers of just those.
 
-**Volatility**
-* Median-Balanced Average: **{}** 
-* Average: {}
-* Median: {}
-""".format( 
-        round(temp2.balanced.mean(),2),
-        round(correlations.avg_return.mean(),2),
-        round(correlations.avg_return.median(),2),
-        round((correlations.stdev_.mean()+correlations.stdev_.median())/2,2),        
-        round(correlations.stdev_.mean(),2),
-        round(correlations.stdev_.median(),2),
-
-
-    ))
+"""),
+            dcc.Markdown(id='high-iie-summary')
         ],style=dict(marginLeft='auto',marginRight='auto',width='75%')),
         html.Div([
-            dcc.Graph(
-                id='high-iie-returns-graph',
-                figure = go.Figure(
-                    data = [
-                        go.Scatter(
-                            x=temp2.stdev_.clip_upper(30,axis=0),
-                            y=temp2.balanced.clip_upper(30,axis=0),
-                            mode="markers",
-                            text=["{}, {}, {}".format(col,temp2.loc[col,"stdev_"],temp2.loc[col,"balanced"]) for col in temp2.index],
-                            marker=dict(size=15),
-                            hoverinfo='text'
-                        )
-                    ],
-                    layout = go.Layout(
-                        title="Return vs Volatility - Frontier During High-IIE Periods",
-                        hovermode="closest",
-                        xaxis=dict(title="Volatility"),
-                        yaxis=dict(title="Return vs S&P 500"),
-                        height=600,
-                        shapes=[
-                            {
-                                'type': 'rect',
-                                'xref': 'paper',
-                                'yref': 'y',
-                                'x0': 0,
-                                'y0': 0,
-                                'x1': 1,
-                                'y1': 30,
-                                'fillcolor': 'green',
-                                'opacity': .085,
-                                'line': {
-                                    'width': 0,
-                                }
-                            },
-                            {
-                                'type': 'rect',
-                                'xref': 'paper',
-                                'yref': 'y',
-                                'x0': 0,
-                                'y0': -12,
-                                'x1': 1,
-                                'y1': 0,
-                                'fillcolor': 'red',
-                                'opacity': .085,
-                                'line': {
-                                    'width': 0,
-                                }
-                            },
-                        ] # end of shapes
-                    ), # end of go.Layout            
-                ) # end of go.Figure
-            )# end of dcc.Graph
+            dcc.Dropdown(
+                id='frontier-assets',
+                options=[dict(label=col,value=col) for col in analysis.get("frontier_frames",threshold=THRESHOLD,window=WINDOW)[1].index],
+                value=[],
+                multi=True,
+                placeholder="All asset classes"
+            )
+        ],style=dict(width="75%",marginLeft="auto",marginRight="auto")),
+        lazy_section('high-iie',[
+            dcc.Graph(id='high-iie-returns-graph')
         ]),
         html.Div([
             dcc.Markdown(
@@ -334,84 +717,17 @@ its true value.
 
 This chart shows notably less positive volatility.
 
-**Returns** : 
-* Median-Balanced Average: **{}** 
-* Average: {}
-* Median: {}
-
-**Volatility**
-* Median-Balanced Average: **{}** 
-* Average: {}
-* Median: {}
-""".format( 
-        round(temp3.balanced.mean(),2),
-        round(correlations_not_iie.avg_return.mean(),2),
-        round(correlations_not_iie.avg_return.median(),2),
-        round((correlations_not_iie.stdev_.mean()+correlations_not_iie.stdev_.median())/2,2),
-        round(correlations_not_iie.stdev_.mean(),2),
-        round(correlations_not_iie.stdev_.median(),2),
-
-    ))
+"""),
+            dcc.Markdown(id='not-high-iie-summary')
         ],style=dict(width="75%",marginLeft='auto',marginRight='auto')),
 
-        html.Div([
-            dcc.Graph(
-                id='not-high-iie-returns-graph',
-                figure = go.Figure(
-                    data = [
-                        go.Scatter(
-                            x=temp3.stdev_.clip_upper(30,axis=0),
-                            y=temp3.balanced.clip_upper(30,axis=0),
-                            mode="markers",
-                            text=["{}, {}, {}".format(col,temp3.loc[col,"stdev_"],temp3.loc[col,"balanced"]) for col in temp3.index],
-                            marker=dict(size=15),
-                            hoverinfo='text'
-                        )
-                    ],
-                    layout = go.Layout(
-                        title="Return and Risk - Frontier During Non-High-IIE Periods",
-                        hovermode="closest",
-                        xaxis=dict(title="Volatility"),
-                        yaxis=dict(title="Return vs S&P 500"),
-                        height=600,
-                        shapes=[
-                            {
-                                'type': 'rect',
-                                'xref': 'paper',
-                                'yref': 'y',
-                                'x0': 0,
-                                'y0': 0,
-                                'x1': 1,
-                                'y1': 30,
-                                'fillcolor': 'green',
-                                'opacity': .085,
-                                'line': {
-                                    'width': 0,
-                                }
-                            },
-                            {
-                                'type': 'rect',
-                                'xref': 'paper',
-                                'yref': 'y',
-                                'x0': 0,
-                                'y0': -12,
-                                'x1': 1,
-                                'y1': 0,
-                                'fillcolor': 'red',
-                                'opacity': .085,
-                                'line': {
-                                    'width': 0,
-                                }
-                            },
-                        ] # end of shapes
-                    ), # end of go.Layout            
-                ) # end of go.Figure
-            )# end of dcc.Graph
+        lazy_section('not-high-iie',[
+            dcc.Graph(id='not-high-iie-returns-graph')
         ]),
     ],style=dict(marginLeft='auto',marginRight='auto',width='65%')), # end of analysis div
     html.Hr(),
     # data tables
-    html.Div([
+    lazy_section('tables',[
         html.H2("Correlation Data Tables",style=dict(textAlign='center')),
         html.Div([
             dcc.Markdown(
@@ -424,6 +740,9 @@ Example filter input:
 * Greater than 0.5: `> num(.5)`
 * Equal to 0.5: `eq num(.5)`
 * Equal to "Australia": `eq "Australia"`
+
+The `-p` columns are permutation-test p-values of each correlation: the share of 10,000 shuffles of the
+indicator that correlate at least as strongly. They fill in a few seconds after the sliders settle.
 """)
         ],style=dict(width="48.75%",marginLeft='auto',marginRight='auto')),
         # first table
@@ -431,12 +750,16 @@ Example filter input:
             html.H4("Asset Class correlations in High-IEE periods"),
             dash_table.DataTable(
                 id='iie-correlations-table',
-                columns=[{"name":i,"id":i,"deletable":False} for i in table_correlations],
-                data = table_correlations.to_dict("rows"),
-                filtering=True,
+                columns=[{"name":i,"id":i,"deletable":False} for i in table_columns+list(table_p_columns)],
+                data = [],
+                pagination_mode='be',
+                pagination_settings=dict(current_page=0,page_size=TABLE_PAGE_SIZE),
+                filtering='be',
+                filtering_settings='',
                 editable=False,
-                sorting=True,
+                sorting='be',
                 sorting_type="multi",
+                sorting_settings=[],
                 #row_selectable='multi',
                 row_deletable=False,
                 selected_rows=[] ,
@@ -452,12 +775,16 @@ Example filter input:
             html.H4("Asset Class correlations in non-High-IEE periods"),
             dash_table.DataTable(
                 id='not-iie-correlations-table',
-                columns=[{"name":i,"id":i,"deletable":False} for i in table_correlations_not_iie],
-                data = table_correlations_not_iie.to_dict("rows"),
-                filtering=True,
+                columns=[{"name":i,"id":i,"deletable":False} for i in table_columns+list(table_p_columns)],
+                data = [],
+                pagination_mode='be',
+                pagination_settings=dict(current_page=0,page_size=TABLE_PAGE_SIZE),
+                filtering='be',
+                filtering_settings='',
                 editable=False,
-                sorting=True,
+                sorting='be',
                 sorting_type="multi",
+                sorting_settings=[],
                 #row_selectable='multi',
                 row_deletable=False,
                 selected_rows=[],
@@ -468,7 +795,7 @@ Example filter input:
             ),
             html.Div(id='not-iie-datatable-interactivity-container')
         ],style=dict(width="49%",marginLeft="auto",marginRight='auto',display='inline-block',padding=".5%")),
-    ],style=dict(paddingBottom='100px')),
+    ],min_height="700px",style=dict(paddingBottom='100px')),
     html.Hr(),
     # interactive regression
     html.Div([
@@ -481,71 +808,172 @@ Example filter input:
             html.Div([
                 dcc.Dropdown(
                     id = 'sector-dropdown',
-                    options = [dict(label=col,value=col) for col in list(sectors.columns)],
+                    options = [dict(label=col,value=col) for col in list(datasets["sectors"].columns)],
                     value = "Total US",
                     style=dict(fontSize="20px")
                 )
             ],style=dict(width="400px",marginLeft="auto",marginRight="auto"))
         ],style=dict(marginLeft='auto',marginRight='auto',width="100%")),
-        # graph in hi-IIE periods
-        html.Div([
+        # correlation banner and regression graphs, hi-IIE on top and non-hi-IIE below
+        lazy_section('regressions',[
             html.Div(
-                children="",
-                id = 'correlation-div',
-                style=dict(marginLeft='auto',marginRight='auto',textAlign='center')),
-            html.Div([
-                html.Div([
-                    dcc.Graph(
-                        id = 'sector-vs-interest'
-                    )
-                ],style=dict(display='inline-block',width="33%")),
-                html.Div([
-                    dcc.Graph(
-                        id = 'sector-vs-inflation'
-                    )
-                ],style=dict(display='inline-block',width="33%")),
-                html.Div([
-                    dcc.Graph(
-                        id = 'sector-vs-oil'
-                    )
-                ],style=dict(display='inline-block',width="33%")),
-            ]),
-            # graph in non-hi-IIE periods?
-            html.Div([
-                html.Div([
-                    dcc.Graph(
-                        id = 'sector-vs-interest-other'
-                    )
-                ],style=dict(display='inline-block',width="33%")),
-                html.Div([
-                    dcc.Graph(
-                        id = 'sector-vs-inflation-other'
-                    )
-                ],style=dict(display='inline-block',width="33%")),
-                html.Div([
-                    dcc.Graph(
-                        id = 'sector-vs-oil-other'
-                    )
-                ],style=dict(display='inline-block',width="33%")),
-            ])
-        ],style=dict(width="100%",marginLeft='auto',marginRight='auto'))
+                children=[],
+                id = 'regression-div',
+                style=dict(width="100%",marginLeft='auto',marginRight='auto'))
+        ],min_height="750px")
     ],style=dict(width="100%",marginLeft='auto',marginRight='auto')),
+    # sector fundamentals from the SEC filings against the same indicators
+    html.Div([
+        html.H3("Sector Fundamentals vs the Indicators",style=dict(textAlign="center")),
+        html.Div([
+            dcc.Markdown(
+"""
+The SEC filings of every company, rolled up by sector: the total, the median company, or the mean weighted by
+each company's assets. Each chart regresses the year-over-year growth of that figure on one indicator, quarter by
+quarter over 2012-2017, in hi-IIE quarters and the rest. Quarters follow the sliders above; at most settings
+there are few or no hi-IIE quarters this recent.
+""")
+        ],style=dict(width="75%",marginLeft='auto',marginRight='auto')),
+        html.Div([
+            dcc.Dropdown(
+                id='fundamentals-sector',
+                options=[dict(label=col,value=col) for col in sector_store.frame("Revenues","sum").columns],
+                value="Manufacturing",
+                clearable=False)
+        ],style=dict(display='inline-block',width='30%',padding='0 1%')),
+        html.Div([
+            dcc.Dropdown(
+                id='fundamentals-tag',
+                options=[dict(label=tag,value=tag) for tag in sector_store.tags()],
+                value="Revenues",
+                clearable=False)
+        ],style=dict(display='inline-block',width='30%',padding='0 1%')),
+        html.Div([
+            dcc.Dropdown(
+                id='fundamentals-how',
+                options=[dict(label="Sector total",value="sum"),dict(label="Median company",value="median"),dict(label="Asset-weighted mean",value="weighted")],
+                value="sum",
+                clearable=False)
+        ],style=dict(display='inline-block',width='30%',padding='0 1%')),
+        lazy_section('fundamentals',[html.Div(id='fundamentals-div')],min_height="350px")
+    ],style=dict(width="100%",marginLeft='auto',marginRight='auto',textAlign='center',paddingTop='40px')),
     html.Div([""
     ])
 ])
 
 
+asset_options = [dict(label=col,value=col) for col in datasets["asset_returns"].columns]
+backtest_metrics = collections.OrderedDict([
+    ("sharpe", "Sharpe Ratio"),
+    ("cagr", "Annual Return"),
+    ("cumulative_return", "Cumulative Return"),
+    ("volatility", "Volatility"),
+    ("max_drawdown", "Max Drawdown"),
+])
 
+backtest_layout = html.Div([
+    html.H2("Backtest: Tilting a Portfolio in hi-IIE Periods",style=dict(textAlign='center')),
+    html.Div([
+        dcc.Markdown("""
+Hold the base portfolio, and in hi-IIE years move part of it into the tilt assets. Portfolios are
+equal-weighted, rebalanced every year-end without costs, over 1976-2015. Every tilt size from 0% to 100% is
+run under every slider setting of the Analysis tab; the Sharpe ratio is over Treasury Bills.
+        """)
+    ],style=dict(marginLeft='auto',marginRight='auto',width='75%')),
+    html.Div([
+        html.Div([
+            html.Label("Base portfolio"),
+            dcc.Dropdown(id='backtest-base',options=asset_options,value=["S&P 500"],multi=True),
+        ],style=dict(display='inline-block',width='45%',padding='0 2.5%',verticalAlign='top')),
+        html.Div([
+            html.Label("Tilt into, in hi-IIE years"),
+            dcc.Dropdown(id='backtest-tilt',options=asset_options,value=["US Energy","Chile"],multi=True),
+        ],style=dict(display='inline-block',width='45%',padding='0 2.5%',verticalAlign='top')),
+    ]),
+    html.Div([
+        html.Div([
+            html.Label("Tilt size (share of the portfolio)"),
+            dcc.Slider(
+                id='backtest-amount',
+                min=0,
+                max=100,
+                step=5,
+                value=50,
+                marks={i:"{}%".format(i) for i in range(0,101,20)}
+            )
+        ],style=dict(display='inline-block',width='45%',padding='0 2.5%')),
+        html.Div([
+            html.Label("Heatmap statistic"),
+            dcc.Dropdown(
+                id='backtest-metric',
+                options=[dict(label=label,value=value) for value, label in backtest_metrics.items()],
+                value="sharpe",
+                clearable=False),
+        ],style=dict(display='inline-block',width='45%',padding='0 2.5%',verticalAlign='top')),
+    ],style=dict(paddingTop='20px',paddingBottom='40px')),
+    lazy_section('backtest',[html.Div(id='backtest-results')],min_height="900px"),
+])
 
+# one screener per filing frequency, built on first use
+screeners = {}
 
 
+def get_screener(frequency):
+    if frequency not in screeners:
+        screeners[frequency] = screener.Screener(screener.load_companies(frequency))
+    return screeners[frequency]
 
 
+screener_columns = ["cik"] + list(get_screener("yearly").companies.columns)
 
-@app.callback(
-    Output('correlation-div','children'),
-    [Input('sector-dropdown','value')])
-def update_correlation_div(sector):
+screener_layout = html.Div([
+    html.H2("Company Screener",style=dict(textAlign='center')),
+    html.Div([
+        dcc.Markdown("""
+The latest SEC filing of about 10,000 companies, with their sector. Filter in the row at the top of the table
+with the same language as the correlation tables, e.g. `> num(2)` under `current_ratio`, or `eq "Mining, Quarrying,
+and Oil and Gas Extraction"` under `sector`. The ratios are `current_ratio` (current assets / current liabilities),
+`cash_ratio` (cash / current liabilities), `debt_ratio` (liabilities / assets), `goodwill_share` (goodwill / assets),
+`asset_turnover` (revenues / assets), `operating_margin` and `net_margin` (operating and comprehensive income /
+revenues). The sector table below follows the filter.
+        """),
+        dcc.RadioItems(
+            id='screener-frequency',
+            options=[dict(label="Latest annual filing",value="yearly"),dict(label="Latest quarterly filing",value="quarterly")],
+            value="yearly",
+            labelStyle=dict(display='inline-block',paddingRight='20px'))
+    ],style=dict(marginLeft='auto',marginRight='auto',width='75%')),
+    lazy_section('screener',[
+        dash_table.DataTable(
+            id='screener-table',
+            columns=[{"name":i,"id":i,"deletable":False} for i in screener_columns],
+            data=[],
+            pagination_mode='be',
+            pagination_settings=dict(current_page=0,page_size=TABLE_PAGE_SIZE),
+            filtering='be',
+            filtering_settings='',
+            sorting='be',
+            sorting_type="multi",
+            sorting_settings=[],
+            style_table=dict(overflowX='auto'),
+            style_cell=dict(maxWidth='175px')
+        ),
+    ],min_height="600px",style=dict(padding='1%')),
+    html.Div(id='screener-sectors',style=dict(width='75%',marginLeft='auto',marginRight='auto',paddingBottom='100px')),
+])
+
+app.layout = html.Div([
+    dcc.Tabs(id='tabs',value='analysis',children=[
+        dcc.Tab(label="Analysis",value='analysis',children=[analysis_layout]),
+        dcc.Tab(label="Backtest",value='backtest',children=[backtest_layout]),
+        dcc.Tab(label="Screener",value='screener',children=[screener_layout]),
+    ])
+])
+boot.phase("layout")
+
+
+def correlation_banner(sector, threshold, window):
+    correlations = analysis.get("correlation_frames",threshold=threshold,window=window)[0]
     return dcc.Markdown(
 """**Correlations in Hi-IIE Periods**: Energy: {} {} | Inflation: {} {} | Interest: {} {}
 """.format(
@@ -556,65 +984,20 @@ def update_correlation_div(sector):
     )
 
 
-@app.callback(
-    Output('sector-vs-oil','figure'),
-    [Input('sector-dropdown','value')])
-def sector_vs_oil_not_iie(sector):
-    xi = indicators["oil_diff%_rolling_30"]
-    y = sectors[sector]
-    slope, intercept, r_value, p_value, std_err = stats.linregress(xi,y)
-    dots = go.Scatter(
-        x = xi,
-        y = y,
-        mode = 'markers',
-        name = "Data",
-        text = [x[:4] for x in y.index],
-    )
-    line = go.Scatter(
-        x = xi,
-        y = slope*xi+intercept,
-        mode = 'lines',
-        name = "Fit"
-    )
-    data = [dots,line]
-    layout = go.Layout(
-        title="Hi-IIE: "+sector+" vs Relative Energy Price",
-        titlefont=dict(size=14),
-        height=350,
-        xaxis=dict(
-            title="Energy Price as % of 30-month Rolling Avg",
-            titlefont=dict(size=12),
-            automargin=True),
-        yaxis=dict(
-            title="Return vs S%P 500",
-            titlefont=dict(size=12)),
-        annotations=[
-            dict(
-                x=55,
-                showarrow=False,
-                y=-1,
-                xref='x',
-                yref='y',
-                text='p-val: {} slope: {}'.format(round(p_value,2),round(slope,2)),
-            ),
-        ],
-        margin=go.layout.Margin(
-            l=30,
-            b=30,
-            t=30,
-            r=60,
-            pad=4
-        ),
-        hovermode='closest'
-    )
-    return go.Figure(data,layout)
-@app.callback(
-    Output('sector-vs-interest','figure'),
-    [Input('sector-dropdown','value')])
-def sector_vs_interest_not_iie(sector):
-    xi = indicators["prime"]
-    y = sectors[sector]
-    slope, intercept, r_value, p_value, std_err = stats.linregress(xi,y)
+def regression_figure(sector, indicator, regime, threshold, window, robust=False):
+    graph_id, label, xaxis_title, annotation_x = regression_panels[indicator]
+    prefix, suffix = regression_regimes[regime]
+    hi_indicators, lo_indicators, hi_sectors, lo_sectors = analysis.get("split",threshold=threshold,window=window)
+    regime_indicators, regime_sectors = (hi_indicators, hi_sectors) if regime == "iie" else (lo_indicators, lo_sectors)
+    xi = regime_indicators[indicator]
+    y = regime_sectors[sector]
+    regressions = analysis.get("regressions",threshold=threshold,window=window)
+    slope, intercept, r_value, p_value, std_err = regressions.loc[(regime,indicator,sector)]
+    annotation = 'p-val: {} slope: {}'.format(round(p_value,2),round(slope,2))
+    if robust:
+        resampled = load_significance(threshold,window).loc[(regime,indicator,sector)]
+        annotation = 'p-val: {} (perm. {}) slope: {} [{}, {}]'.format(
+            round(p_value,2),round(resampled.p_value,3),round(slope,2),round(resampled.slope_low,2),round(resampled.slope_high,2))
     dots = go.Scatter(
         x = xi,
         y = y,
@@ -630,11 +1013,11 @@ def sector_vs_interest_not_iie(sector):
     )
     data = [dots,line]
     layout = go.Layout(
-        title="Hi-IIE: "+sector+" vs Interest Rate",
+        title=prefix+": "+sector+" vs "+label,
         titlefont=dict(size=14),
         height=350,
         xaxis=dict(
-            title="Interest Rate",
+            title=xaxis_title.format(window),
             titlefont=dict(size=12),
             automargin=True),
         yaxis=dict(
@@ -643,12 +1026,12 @@ def sector_vs_interest_not_iie(sector):
             automargin=True),
         annotations=[
             dict(
-                x=20,
+                x=annotation_x[regime],
                 showarrow=False,
                 y=-1,
                 xref='x',
                 yref='y',
-                text='p-val: {} slope: {}'.format(round(p_value,2),round(slope,2)),
+                text=annotation,
             )
         ],
         hovermode="closest",
@@ -659,52 +1042,67 @@ def sector_vs_interest_not_iie(sector):
             r=60,
             pad=4
         ),
-
     )
     return go.Figure(data,layout)
-@app.callback(
-    Output('sector-vs-inflation','figure'),
-    [Input('sector-dropdown','value')])
-def sector_vs_inflation_not_iie(sector):
-    xi = indicators["inflation"]
-    y = sectors[sector]
-    slope, intercept, r_value, p_value, std_err = stats.linregress(xi,y)
-    dots = go.Scatter(
-        x = xi,
-        y = y,
-        mode = 'markers',
-        name = "Data",
-        text = [x[:4] for x in y.index]
-    )
-    line = go.Scatter(
-        x = xi,
-        y = slope*xi+intercept,
-        mode = 'lines',
-        name = "Fit"
-    )
-    data = [dots,line]
+
+
+def fundamentals_figure(sector, tag, how, indicator, threshold, window):
+    graph_id, label, xaxis_title, annotation_x = regression_panels[indicator]
+    growth = analysis.get("fundamental_growth",tag=tag,how=how)[sector].rename("growth")
+    quarters = analysis.get("quarterly_indicators",threshold=threshold,window=window)
+    frame = pd.concat([quarters.reindex(growth.index),growth],axis=1).dropna()
+    data, notes = [], []
+    for (regime, (prefix, suffix)), color in zip(regression_regimes.items(),["#d62728","#1f77b4"]):
+        points = frame[frame.hi == (1 if regime == "iie" else 0)]
+        xi = points[indicator]
+        data.append(go.Scatter(
+            x = xi,
+            y = points.growth,
+            mode = 'markers',
+            name = prefix,
+            text = list(points.index),
+            marker = dict(color=color)
+        ))
+        if len(points) < MIN_QUARTERS:
+            notes.append('{}: {} quarters'.format(prefix,len(points)))
+            continue
+        if xi.nunique() < 2:
+            notes.append('{}: {} flat'.format(prefix,label))
+            continue
+        slope, intercept, r_value, p_value, std_err = linregress_frame(points[[indicator]],points[["growth"]]).iloc[0]
+        data.append(go.Scatter(
+            x = xi,
+            y = slope*xi+intercept,
+            mode = 'lines',
+            name = prefix+" Fit",
+            line = dict(color=color)
+        ))
+        notes.append('{}: p-val: {} slope: {}'.format(prefix,round(p_value,2),round(slope,2)))
     layout = go.Layout(
-        title="Hi-IIE: "+sector+" vs Inflation Rate",
+        title=sector+" "+tag+" vs "+label,
         titlefont=dict(size=14),
         height=350,
         xaxis=dict(
-            title="Inflation Rate",
+            title=xaxis_title.format(window),
             titlefont=dict(size=12),
             automargin=True),
         yaxis=dict(
-            title="Return vs S%P 500",
+            title="Year-over-year growth %",
             titlefont=dict(size=12),
             automargin=True),
         annotations=[
             dict(
-                x=12,
+                x=0,
+                y=1,
                 showarrow=False,
-                y=-1,
-                xref='x',
-                yref='y',
-                text='p-val: {} slope: {}'.format(round(p_value,2),round(slope,2)),
+                xref='paper',
+                yref='paper',
+                xanchor='left',
+                align='left',
+                text='<br>'.join(notes),
             )
         ],
+        legend=dict(orientation="h"),
         hovermode="closest",
         margin=go.layout.Margin(
             l=30,
@@ -717,193 +1115,510 @@ def sector_vs_inflation_not_iie(sector):
     return go.Figure(data,layout)
 
 
+# serialized regression figures keyed by (sector, indicator, regime, threshold, window, robust)
+regression_figures = FigureCache(regression_figure,maxsize=int(os.environ.get("FIGURE_CACHE_SIZE",512)))
+if os.environ.get("PREWARM_FIGURES"):
+    regression_figures.prewarm(
+        (sector,indicator,regime,THRESHOLD,WINDOW,False)
+        for sector in datasets["sectors"].columns
+        for regime in regression_regimes
+        for indicator in regression_panels
+    )
+boot.phase("figures")
+
+
+# the analysis nodes that read each dataset, and those that read the monthly series in regimes.py;
+# a new data version re-derives them and everything downstream, and keeps the rest
+dataset_nodes = dict(
+    indicators=["split"],
+    indicators_not_iie=["split"],
+    sectors=["split","hi_iie_years"],
+    sectors_not_iie=["split"],
+    all_sectors=["raw_split"],
+    indicators_all=["annual_indicators"],
+    oil_annual=["annual_indicators"],
+    asset_returns=["backtest_returns"],
+)
+monthly_nodes = ["hi_iie_years","monthly_indicators","quarterly_indicators","periods_figure","backtest_regimes"]
+monthly_files = frozenset(os.path.basename(path) for path in regimes.SOURCES)
+
+
+def refresh_datasets():
+    """Switch to a newly published data plane version, re-deriving only what depends on the data/ files that changed."""
+    global datasets
+    if plane.changed() and plane.attach():
+        datasets = plane.frames()
+        nodes = [node for name in plane.changed_datasets() for node in dataset_nodes.get(name,[])]
+        if plane.changed_files is None or plane.changed_files & monthly_files:
+            regimes.reload()
+            nodes += monthly_nodes
+        stale = analysis.invalidate(*nodes)
+        if stale & {"split","correlation_frames","regressions","significance"}:
+            regression_figures.clear()
+
+
+def update_options():
+    """Point the dropdowns that list sectors and asset classes at the current data."""
+    app.layout['sector-dropdown'].options = [dict(label=col,value=col) for col in datasets["sectors"].columns]
+    app.layout['frontier-assets'].options = [
+        dict(label=col,value=col) for col in analysis.get("frontier_frames",threshold=THRESHOLD,window=WINDOW)[1].index]
+    for dropdown in ('backtest-base','backtest-tilt'):
+        app.layout[dropdown].options = [dict(label=col,value=col) for col in datasets["asset_returns"].columns]
+
+
+# the layout, and the page-load responses of the charts it opens with, serialized and compressed
+# once per data version (see precompressed.py); Dash would redo both per page view. only the layout
+# is a GET, so only it carries an ETag
+static_blobs = precompressed.BlobCache()
+
+
+def serve_layout():
+    return precompressed.respond(static_blobs.get(("layout",plane.data_version),lambda: precompressed.to_json(app._layout_value())))
+
+
+server.view_functions["/_dash-layout"] = serve_layout
+
+
+def static_callback(output, *defaults):
+    """Answer the callback for `output` from static_blobs when it is called with the page's initial `defaults`."""
+    name = "{}.{}".format(output.component_id,output.component_property)
+    dispatch = app.callback_map[name]["callback"]
+
+    def serve(*args):
+        if list(args) != list(defaults):
+            return dispatch(*args)
+        return precompressed.encoded(static_blobs.get((name,plane.data_version),lambda: precompressed.stable(dispatch(*args).get_data())))
+    app.callback_map[name]["callback"] = serve
+
+
+# a worker keeps serving the version it has until a background job has computed the published settings
+# on the new one, then switches between two requests; no visitor waits on the recompute. A version the
+# job fails on is not switched to
+SWAP_TIMEOUT = 60
+
+
+@server.before_request
+def check_data_plane():
+    version = plane.pending()
+    if version is None:
+        return
+    params = dict(threshold=THRESHOLD,window=WINDOW,version=version)
+    status, elapsed, error = jobs.status(JobQueue.key(compute_analysis,params))
+    if status is None:
+        jobs.submit(compute_analysis,**params)
+        return
+    if status == "error" or (status != "done" and elapsed < SWAP_TIMEOUT):
+        return
+    refresh_datasets()
+    load_analysis(THRESHOLD,WINDOW)
+    update_options()
+    static_blobs.clear()
+
 
+@server.route("/_figure-cache")
+def figure_cache_stats():
+    return jsonify(regression_figures.stats())
 
 
+figure_cache_metric = metrics.gauge("figure_cache","Regression figure cache counters.",["stat"])
 
 
+@metrics.collect
+def collect_figure_cache():
+    for stat, value in regression_figures.stats().items():
+        figure_cache_metric.set(value,stat)
 
 
+@server.route("/_metrics")
+def prometheus_metrics():
+    return Response(metrics.render(),mimetype="text/plain; version=0.0.4")
 
 
+# POST arms a capture of the next request to ?callback=<output id>.<property> (any callback if left out),
+# GET returns the last capture
+@server.route("/_metrics/profile",methods=["GET","POST"])
+def callback_profile():
+    if profiler is None:
+        abort(404)
+    if request.method == "POST":
+        profiler.arm(request.args.get("callback","*"))
+        return jsonify(armed=profiler.armed)
+    return Response(profiler.report or "nothing captured yet\n",mimetype="text/plain")
 
 
+# slider changes recompute the analysis in a background job; the page polls until it is ready.
+# the job draws the frontiers of every asset class, a subset is drawn in the web worker
+JOB_NODES = ["hi_iie_years","raw_split","split","correlation_frames","frontier_frames","efficient_frontiers","regressions","periods_figure"]
+# the job's settings besides the sliders: every asset class, and the period chart zoomed out
+JOB_PARAMS = dict(assets=(),x_range=None)
+jobs = JobQueue(processes=JOB_PROCESSES)
+
+
+def compute_analysis(threshold, window, version):
+    # pool processes fork with the datasets of the moment; catch up to the version asked for
+    if version != plane.data_version:
+        refresh_datasets()
+    return {name: analysis.get(name,threshold=threshold,window=window,**JOB_PARAMS) for name in JOB_NODES}
+
+
+# the published settings are computed up front, so the first page load never waits on a job
+compute_analysis(THRESHOLD,WINDOW,plane.data_version)
+
+
+def load_analysis(threshold, window):
+    """Seed this worker's analysis graph from a finished job, if there is one."""
+    if all(analysis.cached(name,threshold=threshold,window=window,**JOB_PARAMS) for name in JOB_NODES):
+        return
+    try:
+        values = jobs.result(JobQueue.key(compute_analysis,dict(threshold=threshold,window=window,version=plane.data_version)))
+    except KeyError:
+        return
+    for name, value in values.items():
+        analysis.seed(name,value,threshold=threshold,window=window,**JOB_PARAMS)
+
 
 @app.callback(
-    Output('sector-vs-oil-other','figure'),
-    [Input('sector-dropdown','value')])
-def sector_vs_oil(sector):
-    xi = indicators_not_iie["oil_diff%_rolling_30"]
-    y = sectors_not_iie[sector]
-    slope, intercept, r_value, p_value, std_err = stats.linregress(xi,y)
-    dots = go.Scatter(
-        x = xi,
-        y = y,
-        mode = 'markers',
-        name = "Data",
-        text = [x[:4] for x in y.index],
-    )
-    line = go.Scatter(
-        x = xi,
-        y = slope*xi+intercept,
-        mode = 'lines',
-        name = "Fit"
-    )
-    data = [dots,line]
-    layout = go.Layout(
-        title="Not-Hi-IIE: "+sector+" vs Relative Energy Price",
-        titlefont=dict(size=14),
-        height=350,
-        xaxis=dict(
-            title="Energy Price as % of 30-month Rolling Avg",
-            titlefont=dict(size=12),
-            automargin=True),
-        yaxis=dict(
-            title="Return vs S%P 500",
-            titlefont=dict(size=12),
-            automargin=True),
-        annotations=[
-            dict(
-                x=55,
-                showarrow=False,
-                y=-1,
-                xref='x',
-                yref='y',
-                text='p-val: {} slope: {}'.format(round(p_value,2),round(slope,2)),
-            ),
-        ],
-        hovermode='closest',
-        margin=go.layout.Margin(
-            l=30,
-            b=30,
-            t=30,
-            r=60,
-            pad=4
-        ),
-    )
-    return go.Figure(data,layout)
+    Output('analysis-job','data'),
+    [Input('threshold-slider','value'),Input('window-slider','value')])
+def request_analysis(threshold, window):
+    if all(analysis.cached(name,threshold=threshold,window=window,**JOB_PARAMS) for name in JOB_NODES):
+        return dict(threshold=threshold,window=window,keys=[])
+    key = jobs.submit(compute_analysis,threshold=threshold,window=window,version=plane.data_version)
+    return dict(threshold=threshold,window=window,keys=[key])
+
+
+def job_status(job):
+    """done once every job of a `<name>-job` store is (or it has none), error if one failed, else pending."""
+    statuses = set(jobs.status(key)[0] for key in job["keys"])
+    if "error" in statuses:
+        return "error"
+    return "done" if statuses <= {"done"} else "pending"
+
+
+def job_params(job):
+    """The settings a `<name>-job` store was submitted for: everything but its job keys."""
+    return dict((name, value) for name, value in job.items() if name != "keys")
+
+
+def job_callbacks(name):
+    """`<name>-ready` takes the settings of `<name>-job` once its jobs are done; `<name>-poll` ticks until then."""
+    @app.callback(
+        Output(name+'-ready','data'),
+        [Input(name+'-job','data'),Input(name+'-poll','n_intervals')],
+        [State(name+'-ready','data')])
+    def job_ready(job, n_intervals, ready):
+        params = job_params(job)
+        if params == ready:
+            raise PreventUpdate
+        if job_status(job) != "done":
+            raise PreventUpdate
+        return params
+
+    @app.callback(
+        Output(name+'-poll','disabled'),
+        [Input(name+'-job','data'),Input(name+'-ready','data'),Input(name+'-poll','n_intervals')])
+    def toggle_poll(job, ready, n_intervals):
+        if ready == job_params(job):
+            return True
+        # a failed job never becomes ready; stop asking
+        return job_status(job) == "error"
+
+
+job_callbacks('analysis')
+
+
 @app.callback(
-    Output('sector-vs-interest-other','figure'),
-    [Input('sector-dropdown','value')])
-def sector_vs_interest(sector):
-    xi = indicators_not_iie["prime"]
-    y = sectors_not_iie[sector]
-    slope, intercept, r_value, p_value, std_err = stats.linregress(xi,y)
-    dots = go.Scatter(
-        x = xi,
-        y = y,
-        mode = 'markers',
-        name = "Data",
-        text = [x[:4] for x in y.index]
-    )
-    line = go.Scatter(
-        x = xi,
-        y = slope*xi+intercept,
-        mode = 'lines',
-        name = "Fit"
-    )
-    data = [dots,line]
-    layout = go.Layout(
-        title="Not-Hi-IIE: "+sector+" vs Interest Rate",
-        titlefont=dict(size=14),
-        height=350,
-        xaxis=dict(
-            title="Interest Rate",
-            titlefont=dict(size=12),
-            automargin=True),
-        yaxis=dict(
-            title="Return vs S%P 500",
-            titlefont=dict(size=12),
-            automargin=True),
-        annotations=[
-            dict(
-                x=12,
-                showarrow=False,
-                y=-1,
-                xref='x',
-                yref='y',
-                text='p-val: {} slope: {}'.format(round(p_value,2),round(slope,2)),
-            )
-        ],
-        hovermode="closest",
-        margin=go.layout.Margin(
-            l=30,
-            b=30,
-            t=30,
-            r=60,
-            pad=4
-        ),
+    Output('analysis-status','children'),
+    [Input('analysis-job','data'),Input('analysis-poll','n_intervals')])
+def analysis_status(job, n_intervals):
+    if not job["keys"]:
+        return ""
+    status, elapsed, error = jobs.status(job["keys"][0])
+    if status == "error":
+        return "The analysis failed for these settings."
+    if status == "done":
+        return ""
+    return "Recomputing the analysis... {:.0f}s".format(elapsed)
+
+
+# each output below is one node of the analysis graph for the ready settings
+ready_input = Input('analysis-ready','data')
+
+
+# once the analysis is ready, the resampled significance follows in jobs of its own, one per chunk of
+# sectors, so the job pool's processes share it; each writes its chunk to the disk cache
+def compute_significance(threshold, window, version, chunk):
+    if version != plane.data_version:
+        refresh_datasets()
+    hi_indicators, lo_indicators, hi_sectors, lo_sectors = analysis.get("raw_split",threshold=threshold,window=window)
+    resampling.cached(significance_key(threshold,window,chunk),lambda: resampling.significance_table({
+        "iie": (hi_indicators[regression_indicators],hi_sectors),
+        "not_iie": (lo_indicators[regression_indicators],lo_sectors),
+    },chunk=chunk,chunks=JOB_PROCESSES))
+
 
-    )
-    return go.Figure(data,layout)
 @app.callback(
-    Output('sector-vs-inflation-other','figure'),
-    [Input('sector-dropdown','value')])
-def sector_vs_inflation(sector):
-    xi = indicators_not_iie["inflation"]
-    y = sectors_not_iie[sector]
-    slope, intercept, r_value, p_value, std_err = stats.linregress(xi,y)
-    dots = go.Scatter(
-        x = xi,
-        y = y,
-        mode = 'markers',
-        name = "Data",
-        text = [x[:4] for x in y.index]
-    )
-    line = go.Scatter(
-        x = xi,
-        y = slope*xi+intercept,
-        mode = 'lines',
-        name = "Fit"
-    )
-    data = [dots,line]
-    layout = go.Layout(
-        title="Not-Hi-IIE: "+sector+" vs Inflation Rate",
-        titlefont=dict(size=14),
-        height=350,
-        xaxis=dict(
-            title="Inflation Rate",
-            titlefont=dict(size=12),
-            automargin=True),
-        yaxis=dict(
-            title="Return vs S%P 500",
-            titlefont=dict(size=12),
-            automargin=True),
-        annotations=[
-            dict(
-                x=5,
-                showarrow=False,
-                y=-1,
-                xref='x',
-                yref='y',
-                text='p-val: {} slope: {}'.format(round(p_value,2),round(slope,2)),
-            )
-        ],
-        hovermode="closest",
-        margin=go.layout.Margin(
-            l=30,
-            b=30,
-            t=30,
-            r=60,
-            pad=4
-        ),
-    )
-    return go.Figure(data,layout)
+    Output('significance-job','data'),
+    [ready_input])
+def request_significance(ready):
+    # the data version goes into the store, so significance-ready tells which version it is of
+    if load_significance(**ready) is not None:
+        return dict(ready,version=plane.data_version,keys=[])
+    return dict(ready,version=plane.data_version,keys=[
+        jobs.submit(compute_significance,version=plane.data_version,chunk=chunk,**ready) for chunk in range(JOB_PROCESSES)])
+
+
+job_callbacks('significance')
+significance_input = Input('significance-ready','data')
+
+
+def significance_shown(ready, significance_ready):
+    """
+    Whether the robust table and figures can be drawn: the significance jobs finished for these settings
+    on this worker's data version and every chunk is on disk. After a data plane swap they can't until
+    the next request_significance, so the plain ones are drawn.
+    """
+    return significance_ready == dict(ready,version=plane.data_version) and load_significance(**ready) is not None
+# (output, analysis node, lazy section)
+ready_outputs = [
+    (Output('differences graph','figure'),"differences_figure","differences"),
+    (Output('high-iie-summary','children'),"high_iie_summary","high-iie"),
+    (Output('not-high-iie-summary','children'),"not_high_iie_summary","not-high-iie"),
+]
+
+
+def analysis_callback(output, name, section):
+    def update(ready, visible):
+        require_visible(visible)
+        load_analysis(**ready)
+        return analysis.get(name,**ready)
+    app.callback(output,[ready_input,visible_input(section)])(update)
+
+
+for output, name, section in ready_outputs:
+    analysis_callback(output,name,section)
+    static_callback(output,dict(threshold=THRESHOLD,window=WINDOW),1)
+
+
+# the frontier charts also follow the asset classes picked for the efficient frontier
+def frontier_callback(output, name, section):
+    def update(ready, assets, visible):
+        require_visible(visible)
+        load_analysis(**ready)
+        return analysis.get(name,assets=tuple(sorted(assets or [])),**ready)
+    app.callback(output,[ready_input,Input('frontier-assets','value'),visible_input(section)])(update)
+
+
+for output, name, section in [
+        (Output('high-iie-returns-graph','figure'),"high_iie_figure","high-iie"),
+        (Output('not-high-iie-returns-graph','figure'),"not_high_iie_figure","not-high-iie")]:
+    frontier_callback(output,name,section)
+    static_callback(output,dict(threshold=THRESHOLD,window=WINDOW),[],1)
+
+
+# zooming re-queries the period chart for just the visible range
+@app.callback(
+    Output('selecting-iie-periods-graph','figure'),
+    [ready_input,Input('selecting-iie-periods-graph','relayoutData')])
+def update_periods_graph(ready, relayout_data):
+    load_analysis(**ready)
+    return analysis.get("periods_figure",x_range=visible_range(relayout_data),**ready)
+
+
+static_callback(Output('selecting-iie-periods-graph','figure'),dict(threshold=THRESHOLD,window=WINDOW),None)
 
 
+def table_callback(table_id, position):
+    @app.callback(
+        Output(table_id,'data'),
+        [Input(table_id,'pagination_settings'),Input(table_id,'sorting_settings'),Input(table_id,'filtering_settings'),ready_input,significance_input,
+         visible_input('tables')])
+    def update(pagination_settings, sorting_settings, filtering_settings, ready, significance_ready, visible):
+        require_visible(visible)
+        load_analysis(**ready)
+        name = "robust_correlation_tables" if significance_shown(ready,significance_ready) else "correlation_tables"
+        table = analysis.get(name,**ready)[position]
+        return table.page(
+            pagination_settings["current_page"],
+            pagination_settings["page_size"],
+            sorting_settings,
+            filtering_settings)
 
 
+# only the visible page of each table goes over the wire
+table_callback('iie-correlations-table',0)
+table_callback('not-iie-correlations-table',1)
 
 
+# one request per dropdown change: the banner and all six graphs come back together
+@app.callback(
+    Output('regression-div','children'),
+    [Input('sector-dropdown','value'),ready_input,significance_input,visible_input('regressions')])
+def update_regression_div(sector, ready, significance_ready, visible):
+    require_visible(visible)
+    load_analysis(**ready)
+    threshold, window = ready["threshold"], ready["window"]
+    robust = significance_shown(ready,significance_ready)
+    children = [
+        html.Div(
+            children=correlation_banner(sector,threshold,window),
+            id = 'correlation-div',
+            style=dict(marginLeft='auto',marginRight='auto',textAlign='center'))
+    ]
+    for regime, (prefix, suffix) in regression_regimes.items():
+        children.append(html.Div([
+            html.Div([
+                dcc.Graph(
+                    id = graph_id+suffix,
+                    figure = regression_figures.get(sector,indicator,regime,threshold,window,robust)
+                )
+            ],style=dict(display='inline-block',width="33%"))
+            for indicator, (graph_id, label, xaxis_title, annotation_x) in regression_panels.items()
+        ]))
+    return children
 
 
+# the fundamentals row follows the sliders but not the background analysis job
+@app.callback(
+    Output('fundamentals-div','children'),
+    [Input('fundamentals-sector','value'),Input('fundamentals-tag','value'),Input('fundamentals-how','value'),ready_input,
+     visible_input('fundamentals')])
+def update_fundamentals_div(sector, tag, how, ready, visible):
+    require_visible(visible)
+    threshold, window = ready["threshold"], ready["window"]
+    return [
+        html.Div([
+            dcc.Graph(
+                id = graph_id+'-fundamentals',
+                figure = fundamentals_figure(sector,tag,how,indicator,threshold,window)
+            )
+        ],style=dict(display='inline-block',width="33%"))
+        for indicator, (graph_id, label, xaxis_title, annotation_x) in regression_panels.items()
+    ]
+
+
+def backtest_heatmap(chosen, metric, amount):
+    table = chosen.pivot(index="threshold",columns="window",values=metric)
+    scale = 1 if metric == "sharpe" else 100
+    return go.Figure(
+        data=[go.Heatmap(
+            x=[str(window) for window in table.columns],
+            y=[str(threshold) for threshold in table.index],
+            z=(table.values*scale).round(2),
+            colorscale="Viridis",
+            reversescale=metric == "volatility",
+        )],
+        layout=go.Layout(
+            title="{} with a {}% tilt, by hi-IIE definition".format(backtest_metrics[metric],amount),
+            height=450,
+            xaxis=dict(title="Rolling average window (months)",type="category"),
+            yaxis=dict(title="Energy price over its rolling average (%)",type="category"),
+        )
+    )
 
 
+def backtest_growth(returns, portfolio, rows):
+    years = [date[:4] for date in returns.index]
+    return go.Figure(
+        data=[
+            go.Scatter(x=years,y=np.cumprod(1+portfolio[row]),mode="lines",name=name)
+            for name, row in rows
+        ],
+        layout=go.Layout(
+            title="Growth of $1",
+            height=450,
+            yaxis=dict(title="Value",type="log"),
+            legend=dict(orientation="h"),
+        )
+    )
 
 
+@app.callback(
+    Output('backtest-results','children'),
+    [Input('backtest-base','value'),Input('backtest-tilt','value'),Input('backtest-amount','value'),Input('backtest-metric','value'),
+     visible_input('backtest')])
+def update_backtest(base, tilt, amount, metric, visible):
+    require_visible(visible)
+    if not base or not tilt:
+        return dcc.Markdown("Pick at least one base and one tilt asset class.")
+    grid = analysis.get("backtest_grid",base=tuple(sorted(base)),tilt=tuple(sorted(tilt)))
+    results = grid.results
+    chosen = results[np.isclose(results.amount,amount/100.)]
+    current = chosen.index[(chosen.threshold == THRESHOLD) & (chosen.window == WINDOW)][0]
+    best = results.sharpe.idxmax()
+    top = results.sort_values("sharpe",ascending=False).head(10)
+    rows = [
+        ("Base", results.index[results.amount == 0][0]),
+        ("{}% tilt, published hi-IIE".format(amount), current),
+        ("Best Sharpe: {:.0f}% tilt at {}% / {} months".format(results.amount[best]*100,results.threshold[best],results.window[best]), best),
+    ]
+    return [
+        html.Div([
+            dcc.Markdown("**{:,} portfolios** - best Sharpe ratio {:.2f} vs {:.2f} for the base portfolio.".format(
+                len(results),results.sharpe[best],results.sharpe[rows[0][1]]))
+        ],style=dict(textAlign='center')),
+        html.Div([
+            dcc.Graph(id='backtest-heatmap',figure=backtest_heatmap(chosen,metric,amount))
+        ],style=dict(display='inline-block',width='49%')),
+        html.Div([
+            dcc.Graph(id='backtest-growth',figure=backtest_growth(analysis.get("backtest_returns"),grid.portfolio,rows))
+        ],style=dict(display='inline-block',width='49%')),
+        html.Div([
+            dash_table.DataTable(
+                id='backtest-table',
+                columns=[dict(name=name,id=name) for name in ["threshold","window","tilt","annual-return","volatility","sharpe","max-drawdown"]],
+                data=[
+                    {
+                        "threshold": row.threshold,
+                        "window": row.window,
+                        "tilt": "{:.0f}%".format(row.amount*100),
+                        "annual-return": "{:.1f}%".format(row.cagr*100),
+                        "volatility": "{:.1f}%".format(row.volatility*100),
+                        "sharpe": round(row.sharpe,2),
+                        "max-drawdown": "{:.1f}%".format(row.max_drawdown*100),
+                    }
+                    for row in top.itertuples()
+                ],
+            )
+        ],style=dict(width="60%",marginLeft="auto",marginRight="auto",paddingBottom="100px")),
+    ]
 
 
+@app.callback(
+    Output('screener-table','data'),
+    [Input('screener-table','pagination_settings'),Input('screener-table','sorting_settings'),
+     Input('screener-table','filtering_settings'),Input('screener-frequency','value'),visible_input('screener')])
+def update_screener_table(pagination_settings, sorting_settings, filtering_settings, frequency, visible):
+    require_visible(visible)
+    return get_screener(frequency).page(
+        pagination_settings["current_page"],
+        pagination_settings["page_size"],
+        sorting_settings,
+        filtering_settings)
+
+
+@app.callback(
+    Output('screener-sectors','children'),
+    [Input('screener-table','filtering_settings'),Input('screener-frequency','value'),visible_input('screener')])
+def update_screener_sectors(filtering_settings, frequency, visible):
+    require_visible(visible)
+    companies = get_screener(frequency)
+    sectors = companies.by_sector(filtering_settings).round(3).reset_index()
+    sectors["sector"] = sectors.sector.astype(str)
+    return [
+        html.H4("{:,} of {:,} companies match; median ratios by sector".format(companies.count(filtering_settings),len(companies))),
+        dash_table.DataTable(
+            id='screener-sector-table',
+            columns=[{"name":i,"id":i} for i in sectors.columns],
+            data=sectors.to_dict("records"),
+            sorting=True,
+            style_table=dict(overflowX='auto'),
+        ),
+    ]
+
 
+boot.phase("callbacks")
+boot.total()
 
 
 if __name__ == '__main__':
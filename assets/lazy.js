@@ -0,0 +1,66 @@
+/*
+ * Hydrates the lazy sections of the dashboard (see lazy_section in app.py).
+ *
+ * The first time a `.lazy-section` comes within a screen of the viewport,
+ * its hidden `.lazy-trigger` button is clicked; the button's n_clicks is an
+ * input of the callbacks that fill the section. Sections inside a tab only
+ * exist in the page once the tab is opened, so new sections are picked up
+ * as they are added.
+ */
+(function () {
+    var triggered = {};
+
+    function trigger(section) {
+        if (triggered[section.id]) {
+            return;
+        }
+        var button = section.querySelector('.lazy-trigger');
+        if (button) {
+            triggered[section.id] = true;
+            button.click();
+        }
+    }
+
+    var observer = 'IntersectionObserver' in window ? new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                trigger(entry.target);
+            }
+        });
+    }, {rootMargin: '100% 0px'}) : null;
+
+    var watched = typeof WeakSet === 'function' ? new WeakSet() : null;
+
+    function scan() {
+        var sections = document.querySelectorAll('.lazy-section');
+        for (var i = 0; i < sections.length; i++) {
+            var section = sections[i];
+            if (triggered[section.id] || (watched && watched.has(section))) {
+                continue;
+            }
+            if (observer && watched) {
+                watched.add(section);
+                observer.observe(section);
+            } else {
+                // no IntersectionObserver: load everything, as before
+                trigger(section);
+            }
+        }
+    }
+
+    // plotly churns the DOM while drawing, so rescan at most once a frame
+    var pending = false;
+    function schedule() {
+        if (!pending) {
+            pending = true;
+            window.requestAnimationFrame(function () {
+                pending = false;
+                scan();
+            });
+        }
+    }
+
+    new MutationObserver(schedule).observe(document.documentElement, {childList: true, subtree: true});
+    scan();
+})();
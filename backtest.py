@@ -0,0 +1,133 @@
+"""
+Vectorized backtests of annually rebalanced asset-class portfolios.
+
+A strategy holds one weight vector in hi-IIE years and another in the other
+years. `backtest` evaluates any number of strategies at once: weights are an
+(S, N) array per regime and the regime is an (S, T) or (T,) flag, so a grid
+of tilts x regime definitions is a pair of matrix products and a handful of
+reductions over the (S, T) portfolio returns.
+
+Each year the weights are renormalized over the asset classes that have a
+return that year. There are no trading costs.
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+
+from snapshot import read_csv
+import correlation_engine
+
+RETURNS_CSVS = ["data/bogle-all-sectors.csv", "data/world-bank-countries-returns.csv"]
+# gross annual return factors (1.05 for 5%), by year
+FACTOR_CSVS = [("data/goldman-sectors-returns-1index.csv", "goldman_")]
+SP500_CSV = "data/bogle-sp500-returns.csv"
+RISK_FREE = "Treasury Bills"
+
+METRICS = ["cumulative_return", "cagr", "volatility", "sharpe", "max_drawdown"]
+
+
+def _year_end(index):
+    return ["{}-12-31".format(year) for year in index]
+
+
+def load_returns():
+    """Annual percent returns of every asset class and the S&P 500, indexed by year end."""
+    frames = [read_csv(path) for path in RETURNS_CSVS]
+    for path, prefix in FACTOR_CSVS:
+        factors = read_csv(path)
+        frames.append(pd.DataFrame(
+            (factors.values - 1) * 100,
+            index=_year_end(factors.index),
+            columns=[prefix + column for column in factors.columns]))
+    frames.append(read_csv(SP500_CSV))
+    returns = pd.concat(frames, axis=1).sort_index()
+    returns = returns.loc[:, ~returns.columns.duplicated()]
+    for date, column in correlation_engine.BAD_VALUES:
+        returns.loc[date, column] = np.nan
+    return returns
+
+
+def regime_flags(index, years):
+    """Boolean array: whether the year of each index entry is in `years`."""
+    return np.asarray([year in years for year in pd.to_datetime(index).year])
+
+
+def weights(columns, assets, total=1.0):
+    """Equal weights over `assets`, as a vector over `columns`."""
+    vector = np.zeros(len(columns))
+    positions = [list(columns).index(asset) for asset in assets]
+    if positions:
+        vector[positions] = total / len(positions)
+    return vector
+
+
+def tilted(base, tilt, amounts):
+    """(len(amounts), N) weights: `base` with `amount` moved into `tilt`, for each amount."""
+    amounts = np.asarray(amounts, dtype=float)[:, None]
+    return (1 - amounts) * base[None, :] + amounts * tilt[None, :]
+
+
+def _portfolio_returns(returns, weights):
+    # (S, T) weighted returns with weights renormalized over the assets present each year
+    present = ~np.isnan(returns)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.dot(weights, np.where(present, returns, 0.0).T) / np.dot(weights, present.T)
+
+
+def backtest(returns, hi_weights, lo_weights=None, regime=None, risk_free=None):
+    """
+    Metrics and yearly portfolio returns for S strategies over T years.
+
+    `returns` is a (T, N) frame or array of percent returns; `hi_weights` and
+    `lo_weights` are (S, N) or (N,) weights held in hi-IIE and other years;
+    `regime` is a (T,) or (S, T) boolean hi-IIE flag. Without `lo_weights` or
+    `regime` the hi-IIE weights are held every year. `risk_free` is a (T,)
+    percent return for the Sharpe ratio. Returns (metrics, portfolio) where
+    metrics is an (S, len(METRICS)) array and portfolio the (S, T) fractional
+    returns.
+    """
+    values = np.asarray(returns, dtype=float) / 100
+    hi = _portfolio_returns(values, np.atleast_2d(hi_weights))
+    if lo_weights is None or regime is None:
+        portfolio = hi
+    else:
+        lo = _portfolio_returns(values, np.atleast_2d(lo_weights))
+        portfolio = np.where(np.atleast_2d(regime), hi, lo)
+    portfolio = np.where(np.isnan(portfolio), 0.0, portfolio)
+
+    years = portfolio.shape[1]
+    growth = np.cumprod(1 + portfolio, axis=1)
+    cumulative = growth[:, -1] - 1
+    cagr = np.sign(growth[:, -1]) * np.abs(growth[:, -1]) ** (1.0 / years) - 1
+    volatility = portfolio.std(axis=1, ddof=1)
+    excess = portfolio - (0 if risk_free is None else np.nan_to_num(np.asarray(risk_free, dtype=float) / 100))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = excess.mean(axis=1) / excess.std(axis=1, ddof=1)
+    peaks = np.maximum.accumulate(np.concatenate([np.ones((len(growth), 1)), growth], axis=1), axis=1)[:, 1:]
+    max_drawdown = (growth / peaks - 1).min(axis=1)
+    metrics = np.column_stack([cumulative, cagr, volatility, sharpe, max_drawdown])
+    return metrics, portfolio
+
+
+Grid = collections.namedtuple("Grid", ["results", "portfolio"])
+
+
+def grid_search(returns, base, tilt, amounts, regimes, risk_free=None):
+    """
+    Every tilt amount under every regime definition.
+
+    `regimes` maps a label (e.g. a (threshold, window) pair) to a (T,) flag.
+    Returns a Grid of a results frame - one row per (regime, amount) with the
+    metrics - and the (rows, T) yearly portfolio returns in the same order.
+    """
+    labels = list(regimes)
+    amounts = np.asarray(amounts, dtype=float)
+    hi = tilted(base, tilt, amounts)
+    # every amount for the first regime, then every amount for the next...
+    flags = np.repeat(np.array([regimes[label] for label in labels]), len(amounts), axis=0)
+    metrics, portfolio = backtest(returns, np.tile(hi, (len(labels), 1)), base, flags, risk_free)
+    index = pd.MultiIndex.from_product([range(len(labels)), amounts], names=["regime", "amount"])
+    results = pd.DataFrame(metrics, index=index, columns=METRICS)
+    results.insert(0, "label", [label for label in labels for _ in amounts])
+    return Grid(results.reset_index(), portfolio)
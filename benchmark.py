@@ -0,0 +1,409 @@
+"""
+Repeatable benchmarks of the dashboard's hot paths.
+
+    python benchmark.py                    everything, results in benchmarks/results.json
+    python benchmark.py --quick            fewer repeats and no 100x scale-up
+    python benchmark.py --save-baseline    also keep the results as this machine's benchmarks/baseline.json
+
+Measured, all through Flask's test client so no server or network is needed:
+
+* import     - a cold `import app` in a fresh interpreter, with the boot
+               phases and import times it records (see instrumentation.py)
+* layout     - the first /_dash-layout request after import, a warm one and
+               a revalidation with the ETag of the first
+* callbacks  - the regression row for every sector-dropdown value, uncached
+               then cached, and the other heavy callbacks once each
+* payload    - response bytes of the layout, a correlation table page, a
+               screener page, a regression row and the backtest results
+* throughput - requests per second and latency with N threads, each driving
+               its own test client through a mix of callbacks
+* scale      - the correlation summary, the regression fits and table
+               paging on synthetic copies of the data with 10x and 100x the
+               years, and with 10x and 100x the asset classes; downsampling
+               and the screener with 10x and 100x the months and companies
+
+Timings are the median of --repeat runs. No baseline is shipped, since
+one is only meaningful on the machine and runtime that wrote it. Once
+--save-baseline has recorded one locally, later runs are compared with
+it: a timing more than --tolerance slower (and more than --floor
+seconds), a larger payload or a lower throughput is listed and the exit
+status is 1. The comparison is skipped, with a warning, when the
+baseline's RUNTIME fields differ from this run's.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = "benchmarks"
+RESULTS_JSON = os.path.join(BENCH_DIR, "results.json")
+BASELINE_JSON = os.path.join(BENCH_DIR, "baseline.json")
+SCALES = [10, 100]
+CLIENTS = [1, 4, 8]
+REPEAT = 5
+TOLERANCE = .25
+# timing differences smaller than this are noise
+FLOOR = .005
+SEED = 0
+# meta fields a baseline has to share with this run to be compared with it
+RUNTIME = ["python", "pandas", "numpy", "platform", "cpus"]
+# what a browser sends, so payloads are measured as they go over the wire
+BROWSER_ENCODINGS = "gzip, deflate, br"
+
+COLD_IMPORT = """
+import json, time
+start = time.time()
+import app
+seconds = time.time() - start
+print(json.dumps(dict(
+    seconds=seconds,
+    phases=dict((labels[0], value) for labels, value in app.boot.phases.values().items()),
+    imports=dict((labels[0], value) for labels, value in app.boot.imports.values().items()))))
+"""
+
+
+class Results(object):
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit="s"):
+        self.metrics[name] = dict(value=float(value), unit=unit)
+
+    def timings(self, name, seconds):
+        seconds = np.asarray(seconds)
+        self.add(name + ".p50", np.percentile(seconds, 50))
+        self.add(name + ".p95", np.percentile(seconds, 95))
+        self.add(name + ".max", seconds.max())
+
+
+def timed(function, repeat=REPEAT):
+    """Median seconds of `repeat` calls, and the last result."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return float(np.median(seconds)), result
+
+
+def post(client, output, inputs, state=()):
+    """One callback request; (seconds, response bytes)."""
+    body = dict(
+        output=dict(id=output[0], property=output[1]),
+        inputs=[dict(id=id, property=prop, value=value) for id, prop, value in inputs],
+        state=[dict(id=id, property=prop, value=value) for id, prop, value in state])
+    start = time.perf_counter()
+    response = client.post(
+        "/_dash-update-component", data=json.dumps(body), content_type="application/json",
+        headers={"Accept-Encoding": BROWSER_ENCODINGS})
+    seconds = time.perf_counter() - start
+    if response.status_code not in (200, 204):
+        raise RuntimeError("{}.{} returned {}".format(output[0], output[1], response.status_code))
+    return seconds, len(response.data)
+
+
+def ready(app):
+    return dict(threshold=app.THRESHOLD, window=app.WINDOW)
+
+
+def visible(section):
+    # the lazy section has scrolled into view
+    return (section + "-visible", "n_clicks", 1)
+
+
+def regression_request(app, sector):
+    return ("regression-div", "children"), [
+        ("sector-dropdown", "value", sector),
+        ("analysis-ready", "data", ready(app)),
+        ("significance-ready", "data", None),
+        visible("regressions")]
+
+
+def table_request(app, filtering="", sorting=()):
+    table = "iie-correlations-table"
+    return (table, "data"), [
+        (table, "pagination_settings", dict(current_page=0, page_size=app.TABLE_PAGE_SIZE)),
+        (table, "sorting_settings", list(sorting)),
+        (table, "filtering_settings", filtering),
+        ("analysis-ready", "data", ready(app)),
+        ("significance-ready", "data", None),
+        visible("tables")]
+
+
+def screener_request(filtering="", sorting=()):
+    table = "screener-table"
+    return (table, "data"), [
+        (table, "pagination_settings", dict(current_page=0, page_size=25)),
+        (table, "sorting_settings", list(sorting)),
+        (table, "filtering_settings", filtering),
+        ("screener-frequency", "value", "yearly"),
+        visible("screener")]
+
+
+def backtest_request():
+    return ("backtest-results", "children"), [
+        ("backtest-base", "value", ["S&P 500"]),
+        ("backtest-tilt", "value", ["US Energy", "Chile"]),
+        ("backtest-amount", "value", 50),
+        ("backtest-metric", "value", "sharpe"),
+        visible("backtest")]
+
+
+def fundamentals_request(app):
+    return ("fundamentals-div", "children"), [
+        ("fundamentals-sector", "value", "Manufacturing"),
+        ("fundamentals-tag", "value", "Revenues"),
+        ("fundamentals-how", "value", "sum"),
+        ("analysis-ready", "data", ready(app)),
+        visible("fundamentals")]
+
+
+def bench_import(results, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, "-W", "ignore", "-c", COLD_IMPORT])
+        runs.append(json.loads(out.decode().strip().splitlines()[-1]))
+    results.add("import.cold", np.median([run["seconds"] for run in runs]))
+    for key, prefix in [("phases", "import.phase."), ("imports", "import.module.")]:
+        for name in runs[0][key]:
+            results.add(prefix + name, np.median([run[key][name] for run in runs]))
+
+
+def bench_layout(app, client, results, repeat):
+    headers = {"Accept-Encoding": BROWSER_ENCODINGS}
+    start = time.perf_counter()
+    response = client.get("/_dash-layout", headers=headers)
+    results.add("layout.first", time.perf_counter() - start)
+    results.add("payload.layout", len(response.data), "bytes")
+    results.add("layout.warm", timed(lambda: client.get("/_dash-layout", headers=headers), repeat)[0])
+    headers["If-None-Match"] = response.headers.get("ETag", "")
+    results.add("layout.revalidate", timed(lambda: client.get("/_dash-layout", headers=headers), repeat)[0])
+
+
+def bench_callbacks(app, client, results, repeat):
+    sectors = list(app.datasets["sectors"].columns)
+    app.regression_figures.clear()
+    for stage in ["cold", "warm"]:
+        seconds = []
+        for sector in sectors:
+            elapsed, size = post(client, *regression_request(app, sector))
+            seconds.append(elapsed)
+        results.timings("callback.regression.{}".format(stage), seconds)
+    results.add("payload.regression_row", size, "bytes")
+
+    for name, request in [
+            ("correlation_table", table_request(app, "stdev > num(10)", [dict(column_id="energy", direction="desc")])),
+            ("screener_table", screener_request("current_ratio > num(2)", [dict(column_id="Assets", direction="desc")])),
+            ("backtest", backtest_request()),
+            ("fundamentals", fundamentals_request(app))]:
+        seconds, (_, size) = timed(lambda: post(client, *request), repeat)
+        results.add("callback." + name, seconds)
+        results.add("payload." + name, size, "bytes")
+
+
+def bench_throughput(app, results, clients, requests=40):
+    sectors = list(app.datasets["sectors"].columns)
+    workload = [regression_request(app, sector) for sector in sectors[:10]] + [
+        table_request(app, "energy > num({})".format(cut)) for cut in (-.5, 0, .5)] + [
+        screener_request("debt_ratio < num({})".format(cut)) for cut in (.3, .6)]
+    # the throughput runs measure cached figures and indexes, not first builds
+    client = app.server.test_client()
+    for request in workload:
+        post(client, *request)
+
+    for count in clients:
+        latencies = []
+        lock = threading.Lock()
+
+        def drive(offset):
+            client = app.server.test_client()
+            mine = []
+            for i in range(requests):
+                mine.append(post(client, *workload[(offset + i) % len(workload)])[0])
+            with lock:
+                latencies.extend(mine)
+
+        threads = [threading.Thread(target=drive, args=(i,)) for i in range(count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        results.add("throughput.clients_{}.requests_per_second".format(count), len(latencies) / elapsed, "req/s")
+        results.add("throughput.clients_{}.p95".format(count), np.percentile(latencies, 95))
+
+
+def scaled_returns(returns, indicators, rows=1, columns=1, seed=SEED):
+    """
+    An annual returns frame with `rows` times the years and `columns` times
+    the asset classes: years drawn with replacement, every asset class
+    copied with noise of a tenth of its spread, gaps kept. Returns the
+    frame, the indicators of the drawn years and their positions.
+    """
+    random = np.random.RandomState(seed)
+    drawn = np.arange(len(returns)) if rows == 1 else random.randint(0, len(returns), len(returns) * rows)
+    values = np.tile(returns.values[drawn], columns)
+    spread = np.tile(np.nanstd(returns.values, axis=0), columns)
+    values += random.standard_normal(values.shape) * spread / 10
+    names = ["{} {}".format(column, copy) for copy in range(columns) for column in returns.columns]
+    indicators = indicators.iloc[drawn].reset_index(drop=True)
+    indicators += random.standard_normal(indicators.shape) * indicators.std().values / 10
+    return pd.DataFrame(values, columns=names), indicators, drawn
+
+
+def scaled_companies(companies, factor, seed=SEED):
+    """`factor` copies of every company with numeric columns jittered by up to 5%."""
+    random = np.random.RandomState(seed)
+    frame = pd.concat([companies] * factor)
+    frame.index = np.arange(len(frame))
+    frame.index.name = companies.index.name
+    numeric = frame.select_dtypes("number").columns.drop("sector_code", errors="ignore")
+    frame[numeric] = frame[numeric].values * random.uniform(.95, 1.05, (len(frame), len(numeric)))
+    return frame
+
+
+def bench_scale(app, results, scales, repeat):
+    import correlation_engine
+    import screener
+    from downsample import downsample
+    from regressions import regression_table
+    from table_query import IndexedTable
+
+    returns = app.datasets["all_sectors"]
+    indicators = app.analysis.get("annual_indicators", window=app.WINDOW).loc[returns.index]
+    hi_years = app.analysis.get("hi_iie_years", threshold=app.THRESHOLD, window=app.WINDOW)
+    hi = np.asarray([year in hi_years for year in pd.to_datetime(returns.index).year])
+    monthly = app.analysis.get("monthly_indicators", window=app.WINDOW).energy_diff.dropna()
+    companies = screener.load_companies("yearly")
+    # each axis on its own: 100x the years and the asset classes at once is 10,000x the cells
+    shapes = [(1, 1)] + [(factor, 1) for factor in scales] + [(1, factor) for factor in scales]
+    for rows, columns in shapes:
+        name = "scale.x1." if rows == columns == 1 else "scale.{}_x{}.".format(*(("rows", rows) if rows > 1 else ("columns", columns)))
+        repeat_here = repeat if max(rows, columns) < 100 else 1
+        big, big_indicators, drawn = scaled_returns(returns, indicators, rows, columns)
+        big_hi = hi[drawn]
+        seconds, table = timed(lambda: correlation_engine.summary(big, big_indicators), repeat_here)
+        results.add(name + "summary", seconds)
+        split = {
+            "iie": (big_indicators[app.regression_indicators][big_hi], big[big_hi]),
+            "not_iie": (big_indicators[app.regression_indicators][~big_hi], big[~big_hi])}
+        results.add(name + "regressions", timed(lambda: regression_table(split), repeat_here)[0])
+
+        frame = table.reset_index().rename(columns={"index": "asset-class"})
+
+        def page():
+            indexed = IndexedTable(frame)
+            return indexed.page(0, app.TABLE_PAGE_SIZE, [dict(column_id="stdev_", direction="desc")], "oil > num(0)")
+        results.add(name + "table_page", timed(page, repeat_here)[0])
+        if columns > 1:
+            continue
+
+        series = pd.Series(np.tile(monthly.values, rows), index=np.arange(len(monthly) * rows, dtype=float))
+        results.add(name + "downsample", timed(lambda: downsample(series), repeat_here)[0])
+
+        many = companies if rows == 1 else scaled_companies(companies, rows)
+        seconds, screen = timed(lambda: screener.Screener(many), repeat_here)
+        results.add(name + "screener_build", seconds)
+        # once: repeats would be answered from the screener's filter cache
+        results.add(name + "screener_page", timed(
+            lambda: screen.page(0, 25, [dict(column_id="Assets", direction="desc")], "current_ratio > num(2)"), 1)[0])
+        del many, screen
+
+
+def compare(current, baseline, tolerance=TOLERANCE, floor=FLOOR):
+    """(name, baseline, current) of every metric that got worse by more than `tolerance`."""
+    worse = []
+    for name, metric in sorted(current.items()):
+        if name not in baseline:
+            continue
+        before, now = baseline[name]["value"], metric["value"]
+        if metric["unit"] == "req/s":
+            bad = now < before / (1 + tolerance)
+        elif metric["unit"] == "bytes":
+            bad = now > before * (1 + tolerance)
+        else:
+            bad = now > before * (1 + tolerance) and now - before > floor
+        if bad:
+            worse.append((name, before, now))
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's hot paths.")
+    parser.add_argument("--quick", action="store_true", help="2 repeats, no 100x scale-up")
+    parser.add_argument("--repeat", type=int, default=None)
+    parser.add_argument("--clients", type=int, nargs="*", default=CLIENTS)
+    parser.add_argument("--scales", type=int, nargs="*", default=None)
+    parser.add_argument("--output", default=RESULTS_JSON)
+    parser.add_argument("--baseline", default=BASELINE_JSON)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--floor", type=float, default=FLOOR)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["import", "layout", "callbacks", "throughput", "scale"])
+    args = parser.parse_args(argv)
+    repeat = args.repeat or (2 if args.quick else REPEAT)
+    scales = args.scales if args.scales is not None else [factor for factor in SCALES if not (args.quick and factor > 10)]
+
+    results = Results()
+    if "import" not in args.skip:
+        bench_import(results, repeat)
+    import app
+    client = app.server.test_client()
+    if "layout" not in args.skip:
+        bench_layout(app, client, results, repeat)
+    if "callbacks" not in args.skip:
+        bench_callbacks(app, client, results, repeat)
+    if "throughput" not in args.skip:
+        bench_throughput(app, results, args.clients)
+    if "scale" not in args.skip:
+        bench_scale(app, results, scales, repeat)
+
+    report = dict(
+        meta=dict(
+            date=datetime.datetime.now().isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            pandas=pd.__version__,
+            numpy=np.__version__,
+            platform=platform.platform(),
+            cpus=os.cpu_count(),
+            repeat=repeat,
+            scales=scales,
+            clients=args.clients),
+        metrics=results.metrics)
+    for path in [args.output] + ([args.baseline] if args.save_baseline else []):
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+    for name, metric in sorted(results.metrics.items()):
+        print("{:<50} {:>14.4f} {}".format(name, metric["value"], metric["unit"]))
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        stored = json.load(f)
+    differs = [field for field in RUNTIME if stored["meta"].get(field) != report["meta"][field]]
+    if differs:
+        for field in differs:
+            print("warning: {} {} in {}, {} here".format(field, stored["meta"].get(field), args.baseline, report["meta"][field]))
+        print("not compared with {}: it was recorded on another runtime".format(args.baseline))
+        return 0
+    baseline = stored["metrics"]
+    worse = compare(results.metrics, baseline, args.tolerance, args.floor)
+    for name, before, now in worse:
+        print("worse: {} {:.4f} -> {:.4f}".format(name, before, now))
+    print("{} of {} metrics worse than {}".format(len(worse), len(baseline), args.baseline))
+    return 1 if worse else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
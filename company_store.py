@@ -0,0 +1,263 @@
+"""
+Long-format columnar store for the SEC financials in archive/companies.
+
+archive/companies holds one wide CSV per company and frequency
+(`<CIK>-instant.csv`, `-quarterly.csv`, `-yearly.csv`) with XBRL tags as rows
+and period dates as columns. `python company_store.py` turns that tree into
+
+    archive/store/index.json
+    archive/store/<frequency>/<tag>.npz     cik, period, value sorted by (cik, period)
+    archive/store/<frequency>/_companies/<n>.npz   the same rows sorted by (cik, tag, period)
+    archive/store/<frequency>/_companies.npz      first CIK of every block, tag names
+
+so one tag across every company is a single compressed file, one company is
+a binary search into one small block per frequency, and a date slice only
+opens partitions whose period range overlaps it.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+COMPANIES_DIR = os.path.join("archive", "companies")
+STORE_DIR = os.path.join("archive", "store")
+FREQUENCIES = ["instant", "quarterly", "yearly"]
+FORMAT_VERSION = 1
+BLOCK_SIZE = 64
+
+_COMPANY_FILE = re.compile(r"^(\d+)-(instant|quarterly|yearly)\.csv$")
+
+
+def company_files(companies_dir=COMPANIES_DIR, frequency=None):
+    """(cik, frequency, path) for every company file, sorted by CIK."""
+    files = []
+    for name in os.listdir(companies_dir):
+        match = _COMPANY_FILE.match(name)
+        if match and frequency in (None, match.group(2)):
+            files.append((int(match.group(1)), match.group(2), os.path.join(companies_dir, name)))
+    return sorted(files)
+
+
+def read_company_file(path):
+    """
+    Parse one wide company CSV into long arrays.
+
+    Returns (tags, tag_idx, period, value): the tag names in file order, and
+    for every non-empty cell the position of its tag, its period in days since
+    1970-01-01 and its value.
+    """
+    with open(path) as f:
+        reader = csv.reader(f)
+        # some companies have an empty file for a frequency
+        header = next(reader, [""])
+        periods = np.array(header[1:], dtype="datetime64[D]").astype(np.int32)
+        tags, tag_idx, period, value = [], [], [], []
+        for row in reader:
+            if not row:
+                continue
+            for j, cell in enumerate(row[1:]):
+                if cell:
+                    tag_idx.append(len(tags))
+                    period.append(periods[j])
+                    value.append(float(cell))
+            tags.append(row[0])
+    return (
+        tags,
+        np.array(tag_idx, dtype=np.int32),
+        np.array(period, dtype=np.int32),
+        np.array(value, dtype=np.float64),
+    )
+
+
+def _read_company(item):
+    cik, frequency, path = item
+    return cik, read_company_file(path)
+
+
+def _ingest_frequency(frequency, companies_dir, store_dir, pool):
+    tag_codes = {}
+    ciks, codes, periods, values = [], [], [], []
+    files = company_files(companies_dir, frequency)
+    for cik, (tags, tag_idx, period, value) in pool.imap(_read_company, files, chunksize=64):
+        local = np.array([tag_codes.setdefault(tag, len(tag_codes)) for tag in tags], dtype=np.int32)
+        ciks.append(np.full(len(value), cik, dtype=np.int32))
+        codes.append(local[tag_idx] if len(tags) else tag_idx)
+        periods.append(period)
+        values.append(value)
+    cik = np.concatenate(ciks) if ciks else np.zeros(0, np.int32)
+    code = np.concatenate(codes) if codes else np.zeros(0, np.int32)
+    period = np.concatenate(periods) if periods else np.zeros(0, np.int32)
+    value = np.concatenate(values) if values else np.zeros(0, np.float64)
+    del ciks, codes, periods, values
+
+    order = np.lexsort((period, cik, code))
+    cik, code, period, value = cik[order], code[order], period[order], value[order]
+    tag_names = sorted(tag_codes, key=tag_codes.get)
+
+    out_dir = os.path.join(store_dir, frequency)
+    blocks_dir = os.path.join(out_dir, "_companies")
+    if not os.path.isdir(blocks_dir):
+        os.makedirs(blocks_dir)
+    partitions = {}
+    bounds = np.flatnonzero(np.diff(code)) + 1
+    for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(code)]):
+        if start == stop:
+            continue
+        tag = tag_names[code[start]]
+        part_cik, part_period = cik[start:stop], period[start:stop]
+        np.savez_compressed(
+            os.path.join(out_dir, tag + ".npz"),
+            cik=part_cik, period=part_period, value=value[start:stop])
+        partitions[tag] = dict(
+            rows=int(stop - start),
+            companies=int(len(np.unique(part_cik))),
+            first=str(part_period.min().astype("datetime64[D]")),
+            last=str(part_period.max().astype("datetime64[D]")),
+        )
+
+    # the same rows again, company-major, in blocks of BLOCK_SIZE CIKs
+    order = np.lexsort((period, code, cik))
+    cik, code, period, value = cik[order], code[order], period[order], value[order]
+    unique_ciks = np.unique(cik)
+    first_ciks = unique_ciks[::BLOCK_SIZE]
+    block_bounds = np.searchsorted(cik, first_ciks)
+    for block, (start, stop) in enumerate(zip(block_bounds, np.r_[block_bounds[1:], len(cik)])):
+        np.savez_compressed(
+            os.path.join(blocks_dir, "{}.npz".format(block)),
+            cik=cik[start:stop], tag=code[start:stop], period=period[start:stop], value=value[start:stop])
+    np.savez_compressed(
+        os.path.join(out_dir, "_companies.npz"),
+        first_ciks=first_ciks, tags=np.array(tag_names))
+    return partitions
+
+
+def ingest(companies_dir=COMPANIES_DIR, store_dir=STORE_DIR, processes=None):
+    """Build the store under `store_dir` from the wide CSVs in `companies_dir`."""
+    index = dict(version=FORMAT_VERSION, frequencies={})
+    pool = multiprocessing.Pool(processes)
+    try:
+        # one frequency at a time keeps peak memory to a third of the archive
+        for frequency in FREQUENCIES:
+            index["frequencies"][frequency] = _ingest_frequency(frequency, companies_dir, store_dir, pool)
+    finally:
+        pool.close()
+        pool.join()
+    with open(os.path.join(store_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+    return index
+
+
+class CompanyStore(object):
+    """Read-side API over a store written by `ingest`."""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "index.json")) as f:
+            index = json.load(f)
+        if index.get("version") != FORMAT_VERSION:
+            raise ValueError("{} was written by another version of company_store".format(store_dir))
+        self.partitions = index["frequencies"]
+        self._blocks = {}
+
+    def tags(self, frequency):
+        return sorted(self.partitions[frequency])
+
+    def _partition(self, frequency, tag):
+        with np.load(os.path.join(self.store_dir, frequency, tag + ".npz")) as part:
+            return part["cik"], part["period"], part["value"]
+
+    def _company_blocks(self, frequency):
+        if frequency not in self._blocks:
+            with np.load(os.path.join(self.store_dir, frequency, "_companies.npz")) as companies:
+                self._blocks[frequency] = companies["first_ciks"], np.array(companies["tags"], dtype=object)
+        return self._blocks[frequency]
+
+    @staticmethod
+    def _frame(cik, tag, period, value):
+        return pd.DataFrame(dict(
+            cik=cik,
+            tag=tag,
+            period=period.astype("datetime64[D]"),
+            value=value,
+        ), columns=["cik", "tag", "period", "value"])
+
+    def tag(self, tag, frequency, start=None, end=None):
+        """One tag across every company, optionally limited to periods in [start, end]."""
+        if tag not in self.partitions[frequency]:
+            return self._frame([], [], np.zeros(0, np.int32), [])
+        cik, period, value = self._partition(frequency, tag)
+        if start is not None or end is not None:
+            mask = _period_mask(period, start, end)
+            cik, period, value = cik[mask], period[mask], value[mask]
+        return self._frame(cik, tag, period, value)
+
+    def company(self, cik, frequency=None, tags=None):
+        """Every tag (or just `tags`) reported by one company."""
+        frames = []
+        for freq in [frequency] if frequency else FREQUENCIES:
+            first_ciks, tag_names = self._company_blocks(freq)
+            block = np.searchsorted(first_ciks, cik, side="right") - 1
+            if block < 0:
+                continue
+            with np.load(os.path.join(self.store_dir, freq, "_companies", "{}.npz".format(block))) as part:
+                block_cik = part["cik"]
+                lo, hi = np.searchsorted(block_cik, [cik, cik + 1])
+                code, period, value = part["tag"][lo:hi], part["period"][lo:hi], part["value"][lo:hi]
+            tag = tag_names[code]
+            if tags is not None:
+                mask = np.isin(tag, list(tags))
+                tag, period, value = tag[mask], period[mask], value[mask]
+            if not len(tag):
+                continue
+            frame = self._frame(np.full(len(tag), cik, dtype=np.int32), tag, period, value)
+            frame.insert(0, "frequency", freq)
+            frames.append(frame)
+        if not frames:
+            frame = self._frame([], [], np.zeros(0, np.int32), [])
+            frame.insert(0, "frequency", [])
+            return frame
+        return pd.concat(frames, ignore_index=True)
+
+    def between(self, start, end, frequency, tags=None):
+        """Every value with a period in [start, end], skipping partitions outside the range."""
+        ciks, names, periods, values = [], [], [], []
+        for tag in tags if tags is not None else self.tags(frequency):
+            info = self.partitions[frequency].get(tag)
+            if info is None:
+                continue
+            if (end is not None and info["first"] > str(end)) or (start is not None and info["last"] < str(start)):
+                continue
+            cik, period, value = self._partition(frequency, tag)
+            mask = _period_mask(period, start, end)
+            ciks.append(cik[mask])
+            names.append(np.repeat(np.array([tag], dtype=object), mask.sum()))
+            periods.append(period[mask])
+            values.append(value[mask])
+        if not ciks:
+            return self._frame([], [], np.zeros(0, np.int32), [])
+        return self._frame(np.concatenate(ciks), np.concatenate(names), np.concatenate(periods), np.concatenate(values))
+
+
+def _period_mask(period, start, end):
+    mask = np.ones(len(period), dtype=bool)
+    if start is not None:
+        mask &= period >= np.datetime64(start, "D").astype(np.int32)
+    if end is not None:
+        mask &= period <= np.datetime64(end, "D").astype(np.int32)
+    return mask
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the columnar store for archive/companies")
+    parser.add_argument("--companies", default=COMPANIES_DIR)
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+    index = ingest(args.companies, args.store, args.processes)
+    for frequency, partitions in sorted(index["frequencies"].items()):
+        print(frequency, len(partitions), "tags", sum(p["rows"] for p in partitions.values()), "values")
@@ -0,0 +1,180 @@
+"""
+Correlation statistics for every asset class, computed from annual returns.
+
+`load_returns()` rebuilds the returns-vs-S&P 500 frame behind
+data/all-sectors-vs-sp500*.csv from the raw return files, and
+
+    summary(returns, indicators)              the correlation-analysis table
+    correlation_matrix(returns)               pairwise asset-class correlations
+    rolling_summary / expanding_summary       the table for every window
+    rolling_matrix / expanding_matrix         the matrix for every window
+
+compute them in one batched NumPy pass. Every statistic is a function of
+running sums (count, sum x, sum y, sum x^2, sum y^2, sum xy) over the rows
+where both sides are present, so any window is a difference of two rows of
+their cumulative sums; only the median gathers the window itself. Missing
+values are excluded pairwise, as pandas `corrwith`, `corr`, `std` and `mean`
+do.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from snapshot import read_csv
+
+RETURNS_CSVS = ["data/bogle-all-sectors.csv", "data/world-bank-countries-returns.csv"]
+SP500_CSV = "data/bogle-sp500-returns.csv"
+# US Large tracks the S&P 500 itself
+EXCLUDED = ["US Large"]
+# (year end, asset class) outliers left out of the published sector files
+BAD_VALUES = [("1978-12-31", "Austria")]
+# summary column -> indicator column
+INDICATORS = [("oil", "energy"), ("inflation", "inflation"), ("interest", "prime")]
+SUMMARY_COLUMNS = ["oil", "inflation", "interest", "stdev_", "avg_return", "median_return"]
+
+
+def relative_returns(returns, sp500):
+    """`returns` less the `sp500` series, over the years it covers, without EXCLUDED and BAD_VALUES."""
+    returns = returns.drop(EXCLUDED, axis=1).reindex(sp500.index).sub(sp500, axis=0)
+    for date, column in BAD_VALUES:
+        returns.loc[date, column] = np.nan
+    return returns
+
+
+def load_returns():
+    """Annual returns of every asset class less the S&P 500, over the years the S&P 500 covers."""
+    return relative_returns(pd.concat([read_csv(path) for path in RETURNS_CSVS], axis=1), read_csv(SP500_CSV)["S&P 500"])
+
+
+def _windows(rows, window, expanding):
+    """(start, stop) row bounds of every window, one per end row."""
+    stops = np.arange(1, rows + 1)
+    if expanding:
+        return np.zeros(rows, dtype=int), stops
+    return np.maximum(stops - window, 0), stops
+
+
+def _cumulative(values):
+    """Cumulative sums along the first axis with a leading row of zeros."""
+    return np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+
+
+def _correlation(n, sx, sy, sxx, syy, sxy):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+    return np.clip(corr, -1, 1)
+
+
+def _indicator_correlations(y, x, starts, stops):
+    """(windows, indicators, columns) correlations of every column of y with every column of x."""
+    present = ~np.isnan(y)[:, None, :] & ~np.isnan(x)[:, :, None]
+    yv = np.where(present, np.nan_to_num(y)[:, None, :], 0.0)
+    xv = np.where(present, np.nan_to_num(x)[:, :, None], 0.0)
+    sums = [_cumulative(a) for a in (present.astype(float), xv, yv, xv * xv, yv * yv, xv * yv)]
+    return sums[0][stops] - sums[0][starts], _correlation(*[s[stops] - s[starts] for s in sums])
+
+
+def _moments(y, starts, stops):
+    """(windows, columns) count, mean and sample standard deviation."""
+    present = ~np.isnan(y)
+    yv = np.where(present, y, 0.0)
+    n, s, ss = [c[stops] - c[starts] for c in map(_cumulative, (present.astype(float), yv, yv * yv))]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / n
+        var = (ss - s * mean) / (n - 1)
+    return n, mean, np.sqrt(np.where(var > 0, var, 0.0)) * np.where(n > 1, 1, np.nan)
+
+
+def _medians(y, starts, stops):
+    length = int((stops - starts).max())
+    rows = starts[:, None] + np.arange(length)
+    gathered = y[np.minimum(rows, len(y) - 1)]
+    gathered[rows >= stops[:, None]] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(gathered, axis=1)
+
+
+def _summaries(returns, indicators, starts, stops, min_periods):
+    y = returns.values.astype(float)
+    x = np.column_stack([np.asarray(indicators[column], dtype=float) for _, column in INDICATORS])
+    if len(x) != len(y):
+        raise ValueError("indicators and returns must cover the same years")
+    pairs, corr = _indicator_correlations(y, x, starts, stops)
+    n, mean, std = _moments(y, starts, stops)
+    median = _medians(y, starts, stops)
+    corr[pairs < min_periods] = np.nan
+    short = n < min_periods
+    for stat in (mean, std, median):
+        stat[short] = np.nan
+    # (windows, columns, statistics)
+    return np.concatenate([corr.transpose(0, 2, 1), np.stack([std, mean, median], axis=2)], axis=2)
+
+
+def summary(returns, indicators, min_periods=2):
+    """
+    The correlation-analysis table for one period: correlation with energy,
+    inflation and the prime rate, standard deviation, mean and median, per
+    asset class. `indicators` is matched to `returns` by position.
+    """
+    stats = _summaries(returns, indicators, np.array([0]), np.array([len(returns)]), min_periods)
+    return pd.DataFrame(stats[0], index=returns.columns, columns=SUMMARY_COLUMNS)
+
+
+def _windowed_summary(returns, indicators, starts, stops, min_periods):
+    stats = _summaries(returns, indicators, starts, stops, min_periods)
+    index = pd.MultiIndex.from_product([returns.index[stops - 1], returns.columns])
+    return pd.DataFrame(stats.reshape(-1, len(SUMMARY_COLUMNS)), index=index, columns=SUMMARY_COLUMNS)
+
+
+def rolling_summary(returns, indicators, window, min_periods=None):
+    """`summary` over every trailing `window` rows, indexed by (window end, asset class)."""
+    starts, stops = _windows(len(returns), window, expanding=False)
+    return _windowed_summary(returns, indicators, starts, stops, window if min_periods is None else min_periods)
+
+
+def expanding_summary(returns, indicators, min_periods=2):
+    """`summary` over every leading stretch of rows, indexed by (window end, asset class)."""
+    starts, stops = _windows(len(returns), None, expanding=True)
+    return _windowed_summary(returns, indicators, starts, stops, min_periods)
+
+
+def _matrices(returns, starts, stops, min_periods):
+    y = returns.values.astype(float)
+    present = ~np.isnan(y)
+    yv = np.where(present, y, 0.0)
+    p = present.astype(float)
+
+    def pair(a, b):
+        # running sums of a_i * b_j over rows, for every pair of columns
+        return _cumulative(a[:, :, None] * b[:, None, :])
+    sums = [pair(p, p), pair(yv, p), pair(p, yv), pair(yv * yv, p), pair(p, yv * yv), pair(yv, yv)]
+    n = sums[0][stops] - sums[0][starts]
+    corr = _correlation(n, *[s[stops] - s[starts] for s in sums[1:]])
+    corr[n < min_periods] = np.nan
+    return corr
+
+
+def correlation_matrix(returns, min_periods=2):
+    """Pairwise correlations between asset classes, as `returns.corr()`."""
+    corr = _matrices(returns, np.array([0]), np.array([len(returns)]), min_periods)[0]
+    return pd.DataFrame(corr, index=returns.columns, columns=returns.columns)
+
+
+def _windowed_matrix(returns, starts, stops, min_periods):
+    corr = _matrices(returns, starts, stops, min_periods)
+    index = pd.MultiIndex.from_product([returns.index[stops - 1], returns.columns])
+    return pd.DataFrame(corr.reshape(-1, len(returns.columns)), index=index, columns=returns.columns)
+
+
+def rolling_matrix(returns, window, min_periods=None):
+    """Pairwise correlations over every trailing `window` rows, as `returns.rolling(window).corr()`."""
+    starts, stops = _windows(len(returns), window, expanding=False)
+    return _windowed_matrix(returns, starts, stops, window if min_periods is None else min_periods)
+
+
+def expanding_matrix(returns, min_periods=2):
+    """Pairwise correlations over every leading stretch of rows, as `returns.expanding().corr()`."""
+    starts, stops = _windows(len(returns), None, expanding=True)
+    return _windowed_matrix(returns, starts, stops, min_periods)
@@ -0,0 +1,280 @@
+"""
+Shared, versioned copy of the frames the app builds from data/.
+
+The app's datasets - the published split, the returns vs the S&P 500, the
+annual indicators - are written once as a snapshot file (see snapshot.py)
+under data/plane/, and every gunicorn worker maps that file read-only, so
+16 workers hold one copy of the data in the page cache instead of 16 on
+their heaps.
+
+data/plane/current names the active version. `publish` writes a new
+version next to the old one and replaces `current` atomically; workers
+call `Plane.changed()` between requests and re-attach when it moves.
+Mappings of the old version stay valid until the worker lets go of them.
+Publishing holds a lock on data/plane/.lock, so workers booting together
+after a data change publish one version between them, not one each.
+
+`refresh` publishes a new version when data/ has changed, rebuilding only
+the datasets read from the changed files (see DATASETS) and copying the
+rest from the current version. Workers compare the stamps of the two
+versions to re-derive only what depends on those files.
+
+`python dataplane.py` rebuilds the datasets from data/ and publishes them,
+which is the reload signal for running workers. `python dataplane.py
+--watch` polls data/ and refreshes whenever a CSV changes.
+"""
+import collections
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import time
+
+from snapshot import DATA_DIR, Snapshot, read_csv, write
+import backtest
+import correlation_engine
+
+PLANE_DIR = os.path.join(DATA_DIR, "plane")
+# versions kept on disk, so workers still on the previous one can finish
+KEEP = 2
+# seconds between looks at data/ under --watch
+WATCH_INTERVAL = 5
+
+
+def _published_indicators(path, scale=1):
+    frame = read_csv(path).round(2)
+    frame["oil_diff%_rolling_30"] *= scale
+    return frame.rename(columns={"oil_diff%_rolling_30": "energy"})
+
+
+def _basenames(paths):
+    return [os.path.basename(path) for path in paths]
+
+
+# dataset -> (the data/ files it is read from, how to build it)
+# published analysis: hi-IIE years are those with energy 10% over its 30-month rolling average
+DATASETS = collections.OrderedDict([
+    ("indicators", (
+        ["indicators-hi-iie.csv"],
+        lambda: _published_indicators("data/indicators-hi-iie.csv"))),
+    ("indicators_not_iie", (
+        ["indicators-not-hi-iie.csv"],
+        lambda: _published_indicators("data/indicators-not-hi-iie.csv", scale=100))),
+    ("sectors", (
+        ["all-sectors-vs-sp500-iie.csv"],
+        lambda: read_csv("data/all-sectors-vs-sp500-iie.csv").round(2))),
+    ("sectors_not_iie", (
+        ["all-sectors-vs-sp500-not-iie.csv"],
+        lambda: read_csv("data/all-sectors-vs-sp500-not-iie.csv").round(2))),
+    # every year of sector returns and indicators, for re-splitting at other thresholds / windows
+    ("all_sectors", (
+        _basenames(correlation_engine.RETURNS_CSVS + [correlation_engine.SP500_CSV]),
+        correlation_engine.load_returns)),
+    ("indicators_all", (
+        ["indicators - oil, rollingdiff%, prime, inflation.csv"],
+        lambda: read_csv("data/indicators - oil, rollingdiff%, prime, inflation.csv"))),
+    ("oil_annual", (
+        ["oil prices annual 12-31.csv"],
+        lambda: read_csv("data/oil prices annual 12-31.csv"))),
+    # absolute returns of every asset class, for the backtests
+    ("asset_returns", (
+        _basenames(backtest.RETURNS_CSVS + [path for path, prefix in backtest.FACTOR_CSVS] + [backtest.SP500_CSV]),
+        backtest.load_returns)),
+])
+
+
+def build_datasets(names=None):
+    """The frames every worker reads, name -> DataFrame; just `names` if given."""
+    return collections.OrderedDict(
+        (name, build()) for name, (sources, build) in DATASETS.items() if names is None or name in names)
+
+
+def changed_files(old, new):
+    """Names of the data/ files that differ between two stamps (see data_stamp)."""
+    return frozenset(name for name in set(old) | set(new) if old.get(name) != new.get(name))
+
+
+def stale_datasets(files):
+    """Names of the datasets read from any of `files`."""
+    return [name for name, (sources, build) in DATASETS.items() if set(sources) & set(files)]
+
+
+def data_stamp(data_dir=DATA_DIR):
+    """Size and mtime of every CSV in data/, to tell whether a version is out of date."""
+    stamp = {}
+    for name in sorted(os.listdir(data_dir)):
+        if name.endswith(".csv"):
+            stat = os.stat(os.path.join(data_dir, name))
+            stamp[name] = [stat.st_size, stat.st_mtime_ns]
+    return stamp
+
+
+def stamp_version(stamp):
+    """Digest of a data_stamp: the same files give the same digest whatever the version is numbered."""
+    return hashlib.sha1(json.dumps(stamp, sort_keys=True).encode()).hexdigest()
+
+
+def _pointer(plane_dir):
+    return os.path.join(plane_dir, "current")
+
+
+@contextlib.contextmanager
+def _locked(plane_dir):
+    # every worker imports the app on its own and may publish at the same moment
+    os.makedirs(plane_dir, exist_ok=True)
+    with open(os.path.join(plane_dir, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish(frames, plane_dir=PLANE_DIR, stamp=None):
+    """Write `frames` as a new version and make it current; returns its path."""
+    with _locked(plane_dir):
+        return _publish(frames, plane_dir, stamp)
+
+
+def _publish(frames, plane_dir, stamp):
+    existing = sorted(name for name in os.listdir(plane_dir) if name.endswith(".bin"))
+    number = int(existing[-1][:-len(".bin")]) + 1 if existing else 1
+    path = os.path.join(plane_dir, "{:08d}.bin".format(number))
+    write(frames, path, stamp=stamp if stamp is not None else data_stamp())
+
+    pointer = _pointer(plane_dir)
+    tmp = "{}.{}.tmp".format(pointer, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp, pointer)
+    for name in existing[:max(len(existing) - (KEEP - 1), 0)]:
+        try:
+            os.remove(os.path.join(plane_dir, name))
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def refresh(plane_dir=PLANE_DIR):
+    """
+    Publish a new version if data/ has changed since the current one,
+    rebuilding only the datasets read from changed files and copying the
+    rest over. Returns the new version's path, or None if nothing changed.
+    """
+    # under the lock, a worker that waited on another's publish finds it current and does nothing
+    with _locked(plane_dir):
+        # stamped before reading, so a file changed mid-build is picked up by the next refresh
+        stamp = data_stamp()
+        plane = Plane(plane_dir)
+        if not plane.attach():
+            return _publish(build_datasets(), plane_dir, stamp)
+        files = changed_files(plane.stamp, stamp)
+        missing = [name for name in DATASETS if name not in plane.snapshot.tables]
+        if not files and not missing:
+            return None
+        frames = plane.frames()
+        frames.update(build_datasets(set(stale_datasets(files)) | set(missing)))
+        return _publish(collections.OrderedDict((name, frames[name]) for name in DATASETS), plane_dir, stamp)
+
+
+def watch(interval=WATCH_INTERVAL, plane_dir=PLANE_DIR):
+    """Poll data/ and publish each change once the files have stayed the same for a whole `interval`."""
+    last = data_stamp()
+    while True:
+        time.sleep(interval)
+        stamp = data_stamp()
+        # a file still being copied in would be published half-written
+        if stamp == last:
+            path = refresh(plane_dir)
+            if path is not None:
+                print("published", path, flush=True)
+        last = stamp
+
+
+class Plane(object):
+    """One worker's read-only view of the current version."""
+
+    def __init__(self, plane_dir=PLANE_DIR):
+        self.plane_dir = plane_dir
+        self.snapshot = None
+        # data/ files that differ from the version attached before this one; None on the first attach
+        self.changed_files = None
+        self._pointer_stat = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(_pointer(self.plane_dir))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def changed(self):
+        """Whether another version has been published since this worker attached."""
+        return self._stat() != self._pointer_stat
+
+    def pending(self):
+        """The data version (see data_version) of the current version if it is not the one attached, else None."""
+        if not self.changed():
+            return None
+        try:
+            with open(_pointer(self.plane_dir)) as f:
+                version = f.read().strip()
+            if version == self.version:
+                return None
+            return stamp_version(Snapshot(os.path.join(self.plane_dir, version)).header.get("stamp"))
+        except (IOError, OSError):
+            return None
+
+    def attach(self):
+        """Map the current version; returns False if there is none."""
+        pointer_stat = self._stat()
+        if pointer_stat is None:
+            return False
+        with open(_pointer(self.plane_dir)) as f:
+            snapshot = Snapshot(os.path.join(self.plane_dir, f.read().strip()))
+        if self.snapshot is not None:
+            self.changed_files = changed_files(self.stamp, snapshot.header.get("stamp") or {})
+        self.snapshot = snapshot
+        self._pointer_stat = pointer_stat
+        return True
+
+    def load(self):
+        """
+        Map the current version, first publishing one if there is none or
+        data/ has changed since it was made. Returns name -> frame.
+        """
+        if not self.attach() or self.stamp != data_stamp():
+            refresh(self.plane_dir)
+            self.attach()
+        return self.frames()
+
+    def frames(self):
+        return collections.OrderedDict((name, self.snapshot.frame(name)) for name in self.snapshot.tables)
+
+    def changed_datasets(self):
+        """Names of the datasets the last attach changed: all of them on the first."""
+        if self.changed_files is None:
+            return list(self.snapshot.tables)
+        return stale_datasets(self.changed_files)
+
+    @property
+    def stamp(self):
+        return self.snapshot.header.get("stamp") or {}
+
+    @property
+    def version(self):
+        return os.path.basename(self.snapshot.path) if self.snapshot is not None else None
+
+    @property
+    def data_version(self):
+        """Digest of the data/ files the current version was built from, stable across republishing."""
+        return stamp_version(self.snapshot.header.get("stamp"))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--watch"]:
+        watch(float(sys.argv[2]) if len(sys.argv) > 2 else WATCH_INTERVAL)
+    else:
+        print("published", publish(build_datasets()))
@@ -0,0 +1,352 @@
+"""
+Build graph for the CSVs in data/ that are derived from other CSVs there.
+
+Each node in NODES is one output file. It names its input files and a
+transform, a module-level function that turns the input frames (and the
+node's params) into the output frame with whole-column pandas operations.
+Files no node writes are the sources: the raw return series, and the
+indicator files indicator_store.py maintains.
+
+A node's key is the sha1 of its transform's source, the source of the
+modules and helpers the transforms share, its params and the sha1 of each
+input file. data/.derived.json records the key each output was built
+under and the output's own sha1. A node rebuilds only when its
+key has moved or its output is missing or was edited by hand. File
+hashes are cached by size and mtime, as rebuild_metrics.py does for the
+company files. Without a manifest, as in a fresh clone, the outputs on
+disk are recorded as built from the inputs on disk instead of rebuilt.
+
+Nodes are keyed once their inputs are settled, from the files the
+upstream nodes actually wrote. A rebuild that writes the same bytes as
+before leaves everything downstream of it alone. Stale nodes run on a
+process pool as soon as their inputs are ready, so one changed source
+reruns only the nodes it reaches, and a full rebuild keeps every core busy.
+
+    python derived.py           rebuild whatever is stale
+    python derived.py --full    rebuild everything
+"""
+import argparse
+import collections
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import queue
+
+import pandas as pd
+
+import correlation_engine
+from snapshot import DATA_DIR
+
+MANIFEST = ".derived.json"
+# bump when the manifest layout changes, or to rebuild everything
+VERSION = 2
+INDICATORS_CSV = "indicators - oil, rollingdiff%, prime, inflation.csv"
+# the published hi-IIE years: energy 10% over its 30-month rolling average
+HI_IIE_YEARS = [1976, 1977, 1978, 1979, 1980, 1981, 1982, 1988, 1989, 1990, 1991, 2005, 2006, 2007]
+# modules whose functions the transforms call, besides this module's own helpers
+HELPERS = [correlation_engine]
+# the indicator correlation tables start with the S&P 500 and world bank series
+FIRST_YEAR = 1976
+ENERGY = "oil_diff%_rolling_30"
+
+
+def _reindexed(frame, index):
+    frame = frame.copy()
+    frame.index = index
+    return frame
+
+
+def _by_year(frame):
+    return _reindexed(frame, pd.Index(pd.to_datetime(frame.index).year))
+
+
+def _by_year_end(frame):
+    return _reindexed(frame, pd.Index(["{}-12-31".format(year) for year in frame.index]))
+
+
+def _hi_iie(index, years):
+    return pd.to_datetime(index).year.isin(years)
+
+
+def sp500_returns(index):
+    """Annual S&P 500 returns (%) from its growth of $1."""
+    return _by_year_end(((index - 1) * 100).round(2))
+
+
+def growth_index(returns):
+    """Growth of $1 in each year from returns in %."""
+    return (1 + returns / 100).round(9)
+
+
+def goldman_index(vs_sp500, sp500_index):
+    """Growth of $1 in each Goldman sector, from its return over the S&P 500, in the years both cover."""
+    sp500 = (sp500_index["S&P 500"] - 1) * 100
+    frame = vs_sp500.add(sp500, axis=0).reindex(vs_sp500.index.intersection(sp500.index))
+    frame.columns = [column[len("goldman_"):] for column in frame.columns]
+    return 1 + frame / 100
+
+
+def countries(returns, sectors):
+    """World bank country returns, less the countries bogle-all-sectors.csv already carries."""
+    return returns.drop([column for column in returns.columns if column in sectors.columns], axis=1)
+
+
+def sector_index(sectors, indicators, last):
+    """Growth of $1 in inflation and the Bogle sectors up to `last`, by year."""
+    frame = 1 + _by_year(sectors).loc[:, :last] / 100
+    frame.insert(0, "Inflation", 1 + _by_year(indicators)["inflation"].reindex(frame.index) / 100)
+    return frame
+
+
+def all_sectors_index(sectors, indicators, goldman_vs_sp500):
+    """Growth of $1 in inflation, every Bogle sector and every Goldman sector over the S&P 500, by year."""
+    sectors = _by_year(sectors)
+    frame = pd.concat([
+        _by_year(indicators)[["inflation"]].rename(columns={"inflation": "Inflation"}),
+        sectors,
+        goldman_vs_sp500,
+    ], axis=1).reindex(sectors.index)
+    frame = (1 + frame / 100).round(6)
+    frame.index.name = "Year"
+    return frame
+
+
+def return_stdev(index, relative):
+    """
+    Per asset class: standard deviation and annualized return, and the
+    annualized return less inflation's, except for the `relative` columns,
+    which are returns over the S&P 500 already.
+    """
+    annualized = index.prod() ** (1. / index.count()) - 1
+    real = annualized - annualized["Inflation"]
+    real[[column.startswith(relative) for column in real.index]] = float("nan")
+    return pd.DataFrame(collections.OrderedDict([
+        ("stdev", (index - 1).std()),
+        ("annualized return", annualized),
+        ("real annualized return", real),
+    ])).round(9)
+
+
+def returns_vs_sp500(sectors, countries, sp500, years, hi_iie):
+    """Returns over the S&P 500 as correlation_engine.load_returns builds them, in or out of `years`."""
+    returns = correlation_engine.relative_returns(pd.concat([sectors, countries], axis=1), sp500["S&P 500"])
+    return returns[_hi_iie(returns.index, years) == hi_iie]
+
+
+def indicators_split(indicators, sp500, years, hi_iie, scale):
+    """The annual indicators in the S&P 500 years in or out of `years`, energy times `scale`."""
+    frame = indicators.reindex(sp500.index)
+    frame = frame[_hi_iie(frame.index, years) == hi_iie].copy()
+    frame[ENERGY] *= scale
+    return frame
+
+
+def correlation_analysis(returns, indicators):
+    """correlation_engine.summary of one regime's returns and indicators, matched by position."""
+    return correlation_engine.summary(returns, indicators.rename(columns={ENERGY: "energy"}))
+
+
+def indicator_correlations(indicators, returns, columns, sort):
+    """Correlation of every indicator and return column with `columns`, from FIRST_YEAR on."""
+    frame = pd.concat([indicators[columns], returns], axis=1)
+    frame = frame[pd.to_datetime(frame.index).year >= FIRST_YEAR]
+    rows = columns + (sorted(returns.columns) if sort else list(returns.columns))
+    return frame.corr()[columns].loc[rows]
+
+
+def indicator_correlations_vs_sp500(sectors, countries, sp500, indicators, years):
+    """Correlations of inflation and of every return over the S&P 500 with the indicators, in `years`."""
+    sp500 = sp500["S&P 500"]
+    returns = pd.concat([sectors, countries], axis=1).reindex(sp500.index).sub(sp500, axis=0)
+    returns.insert(0, "Inflation", indicators["inflation"].reindex(sp500.index) - sp500)
+    returns = returns[_hi_iie(returns.index, years)]
+    indicators = indicators.reindex(returns.index).rename(columns={ENERGY: "energy"})
+    return correlation_engine.summary(returns, indicators)[["oil", "inflation", "interest"]]
+
+
+Node = collections.namedtuple("Node", "inputs transform params")
+
+# output -> how it is built; inputs and outputs are file names in data/
+NODES = collections.OrderedDict([
+    ("bogle-sp500-returns.csv", Node(
+        ["bogle-sp500-returns-1index.csv"], sp500_returns, {})),
+    ("spdr-sector-returns-1index.csv", Node(
+        ["spdr-sector-returns.csv"], growth_index, {})),
+    ("goldman-sectors-returns-1index.csv", Node(
+        ["goldman-sectors-vs-sp500.csv", "bogle-sp500-returns-1index.csv"], goldman_index, {})),
+    ("world-bank-countries-returns.csv", Node(
+        ["world-bank-countries-returns.csv.csv", "bogle-all-sectors.csv"], countries, {})),
+    ("bogle-sector-returns-1index.csv", Node(
+        ["bogle-all-sectors.csv", INDICATORS_CSV], sector_index, dict(last="Treasury Bills"))),
+    ("bogle-all-sectors-1index.csv", Node(
+        ["bogle-all-sectors.csv", INDICATORS_CSV, "goldman-sectors-vs-sp500.csv"], all_sectors_index, {})),
+    ("bogle-all-sectors-return-stdev.csv", Node(
+        ["bogle-all-sectors-1index.csv"], return_stdev, dict(relative="goldman_"))),
+    # the hi-IIE split under its original name
+    ("all-sectors-vs-sp500.csv", Node(
+        ["bogle-all-sectors.csv", "world-bank-countries-returns.csv", "bogle-sp500-returns.csv"],
+        returns_vs_sp500, dict(years=HI_IIE_YEARS, hi_iie=True))),
+    ("all-sectors-vs-sp500-iie.csv", Node(
+        ["bogle-all-sectors.csv", "world-bank-countries-returns.csv", "bogle-sp500-returns.csv"],
+        returns_vs_sp500, dict(years=HI_IIE_YEARS, hi_iie=True))),
+    ("all-sectors-vs-sp500-not-iie.csv", Node(
+        ["bogle-all-sectors.csv", "world-bank-countries-returns.csv", "bogle-sp500-returns.csv"],
+        returns_vs_sp500, dict(years=HI_IIE_YEARS, hi_iie=False))),
+    # the hi-IIE file carries energy in %, the other a fraction; dataplane.DATASETS reads them that way
+    ("indicators-hi-iie.csv", Node(
+        [INDICATORS_CSV, "bogle-sp500-returns.csv"], indicators_split, dict(years=HI_IIE_YEARS, hi_iie=True, scale=100))),
+    ("indicators-not-hi-iie.csv", Node(
+        [INDICATORS_CSV, "bogle-sp500-returns.csv"], indicators_split, dict(years=HI_IIE_YEARS, hi_iie=False, scale=1))),
+    ("correlation-analysis-all-sectors-vs-sp500.csv", Node(
+        ["all-sectors-vs-sp500-iie.csv", "indicators-hi-iie.csv"], correlation_analysis, {})),
+    ("correlation-analysis-all-sectors-vs-sp500-not-iie.csv", Node(
+        ["all-sectors-vs-sp500-not-iie.csv", "indicators-not-hi-iie.csv"], correlation_analysis, {})),
+    ("correlation-indicators-sectors.csv", Node(
+        [INDICATORS_CSV, "bogle-all-sectors.csv"], indicator_correlations,
+        dict(columns=["oil", "inflation", "prime"], sort=True))),
+    ("correlation-indicators-sectors-oildiff.csv", Node(
+        [INDICATORS_CSV, "bogle-all-sectors.csv"], indicator_correlations,
+        dict(columns=[ENERGY, "inflation", "prime"], sort=True))),
+    ("correlation-indicators-countries-oildiff.csv", Node(
+        [INDICATORS_CSV, "world-bank-countries-returns.csv.csv"], indicator_correlations,
+        dict(columns=[ENERGY, "inflation", "prime"], sort=False))),
+    ("correlation-indicators-countries-oildiff-vs-sp500.csv", Node(
+        ["bogle-all-sectors.csv", "world-bank-countries-returns.csv", "bogle-sp500-returns.csv", INDICATORS_CSV],
+        indicator_correlations_vs_sp500, dict(years=HI_IIE_YEARS))),
+])
+
+
+def _helper_source():
+    own = [function for name, function in sorted(globals().items())
+           if name.startswith("_") and inspect.isfunction(function) and function.__module__ == __name__]
+    return [inspect.getsource(helper) for helper in HELPERS + own]
+
+
+def node_key(output, digests):
+    """sha1 of everything `output` is built from: transform and helper source, params and input digests."""
+    transform, params = NODES[output].transform, NODES[output].params
+    identity = [VERSION, inspect.getsource(transform), _helper_source(), params, digests]
+    return hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _read(path):
+    # a few of the hand-made files start with a byte order mark
+    return pd.read_csv(path, index_col=0, encoding="utf-8-sig")
+
+
+def _build(output, data_dir):
+    inputs, transform, params = NODES[output]
+    frame = transform(*[_read(os.path.join(data_dir, name)) for name in inputs], **params)
+    path = os.path.join(data_dir, output)
+    # written aside and moved into place, so dataplane --watch never sees half a file
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    frame.to_csv(tmp)
+    os.replace(tmp, path)
+    return output
+
+
+class Manifest(object):
+    def __init__(self):
+        # data/ file -> [size, mtime_ns, sha1]
+        self.files = {}
+        # output -> [key it was built under, sha1 of what was written]
+        self.nodes = {}
+
+    @classmethod
+    def load(cls, path):
+        manifest = cls()
+        if os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get("version") == VERSION:
+                manifest.files, manifest.nodes = stored["files"], stored["nodes"]
+        return manifest
+
+    def save(self, path):
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(dict(version=VERSION, files=self.files, nodes=self.nodes), f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    def digest(self, data_dir, name):
+        """sha1 of a data/ file, rehashed only when its size or mtime changed."""
+        stat = os.stat(os.path.join(data_dir, name))
+        stamp = self.files.get(name)
+        if not stamp or stamp[0] != stat.st_size or stamp[1] != stat.st_mtime_ns:
+            stamp = self.files[name] = [stat.st_size, stat.st_mtime_ns, _file_digest(os.path.join(data_dir, name))]
+        return stamp[2]
+
+    def fresh(self, data_dir, output, key):
+        built = self.nodes.get(output)
+        return (built is not None and built[0] == key and os.path.exists(os.path.join(data_dir, output)) and
+                self.digest(data_dir, output) == built[1])
+
+
+def build(data_dir=DATA_DIR, processes=None, full=False):
+    """Bring every derived CSV in `data_dir` up to date; returns the outputs rebuilt, in the order they finished."""
+    manifest_path = os.path.join(data_dir, MANIFEST)
+    manifest = Manifest() if full else Manifest.load(manifest_path)
+    # a fresh clone has the committed outputs but no manifest: take them as built rather than rewrite them
+    seed = not full and not os.path.exists(manifest_path)
+    # output -> the derived files it still waits for
+    waiting = dict((output, set(node.inputs) & set(NODES)) for output, node in NODES.items())
+    keys = {}
+    settled = set()
+    rebuilt = []
+    finished = queue.Queue()
+    pool = None
+    running = 0
+    try:
+        while waiting or running:
+            ready = sorted(output for output, inputs in waiting.items() if inputs <= settled)
+            skipped = False
+            for output in ready:
+                del waiting[output]
+                keys[output] = node_key(output, [manifest.digest(data_dir, name) for name in NODES[output].inputs])
+                if seed and os.path.exists(os.path.join(data_dir, output)):
+                    manifest.nodes[output] = [keys[output], manifest.digest(data_dir, output)]
+                if manifest.fresh(data_dir, output, keys[output]):
+                    settled.add(output)
+                    skipped = True
+                    continue
+                if pool is None:
+                    pool = multiprocessing.Pool(processes)
+                pool.apply_async(_build, (output, data_dir), callback=finished.put, error_callback=finished.put)
+                running += 1
+            # a node found fresh may have unblocked others: look again before waiting
+            if skipped:
+                continue
+            if not running:
+                raise ValueError("derived nodes wait on each other: {}".format(", ".join(sorted(waiting))))
+            output = finished.get()
+            running -= 1
+            if isinstance(output, Exception):
+                raise output
+            manifest.nodes[output] = [keys[output], manifest.digest(data_dir, output)]
+            settled.add(output)
+            rebuilt.append(output)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        manifest.save(manifest_path)
+    return rebuilt
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the derived CSVs in data/ that are out of date")
+    parser.add_argument("--data", default=DATA_DIR)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and rebuild everything")
+    args = parser.parse_args()
+    rebuilt = build(args.data, args.processes, args.full)
+    print("rebuilt", len(rebuilt), "of", len(NODES), "files")
+    for output in rebuilt:
+        print(" ", output)
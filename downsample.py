@@ -0,0 +1,84 @@
+"""
+Server-side downsampling for line charts.
+
+A chart a thousand pixels wide can't show more than about a thousand points,
+so the app sends at most `points` of each series for the visible x range and
+asks again when the user zooms. Two reducers:
+
+* `lttb`   - Largest-Triangle-Three-Buckets, keeps the visual shape of the line
+* `minmax` - the lowest and highest point of every bucket, keeps every extreme
+
+Both return positions into the input, so the kept points are real samples.
+"""
+import numpy as np
+import pandas as pd
+
+POINTS = 600
+
+
+def lttb(x, y, points):
+    """Positions of the `points` samples that Largest-Triangle-Three-Buckets keeps."""
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # points - 2 buckets between the first and last sample
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    counts = np.diff(edges)
+    avg_x = np.r_[np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1]]
+    avg_y = np.r_[np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1]]
+    keep = np.empty(points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        # triangle between the last kept point, each candidate and the next bucket's mean
+        area = np.abs((x[a] - avg_x[bucket + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[bucket + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[bucket + 1] = a
+    return keep
+
+
+def minmax(x, y, points):
+    """Positions of the lowest and highest sample in each of `points` / 2 buckets."""
+    n = len(x)
+    buckets = points // 2
+    if points >= n or buckets < 1:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    order = np.lexsort((np.asarray(y, dtype=float), bucket))
+    return np.unique(np.r_[0, order[edges[:-1]], order[edges[1:] - 1], n - 1])
+
+
+METHODS = dict(lttb=lttb, minmax=minmax)
+
+
+def downsample(series, points=POINTS, start=None, end=None, method="lttb"):
+    """
+    At most `points` samples of `series` (indexed by date or number) between
+    `start` and `end`, plus the sample either side so the line reaches the edges.
+    """
+    series = series.dropna().sort_index()
+    index = series.index
+    lo = 0 if start is None else max(index.searchsorted(start, side="left") - 1, 0)
+    hi = len(index) if end is None else min(index.searchsorted(end, side="right") + 1, len(index))
+    series = series.iloc[lo:hi]
+    x = series.index.values
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    keep = METHODS[method](x, series.values, points)
+    return series.iloc[keep]
+
+
+def visible_range(relayout_data, axis="xaxis"):
+    """(start, end) of `axis` after a zoom or pan in `relayoutData`, None when autoranged or untouched."""
+    relayout_data = relayout_data or {}
+    if "{}.range[0]".format(axis) in relayout_data:
+        bounds = relayout_data["{}.range[0]".format(axis)], relayout_data["{}.range[1]".format(axis)]
+    elif "{}.range".format(axis) in relayout_data:
+        bounds = relayout_data["{}.range".format(axis)]
+    else:
+        return None
+    return tuple(str(pd.Timestamp(bound).date()) for bound in bounds)
@@ -0,0 +1,58 @@
+"""
+Bounded LRU cache for figures that are pure functions of their arguments.
+
+Figures are stored already serialized to plain JSON-ready dicts, so a hit
+skips both Plotly object construction/validation and numpy conversion.
+"""
+import collections
+import json
+import threading
+
+from plotly.utils import PlotlyJSONEncoder
+
+
+def serialize_figure(figure):
+    return json.loads(json.dumps(figure, cls=PlotlyJSONEncoder))
+
+
+class FigureCache(object):
+    def __init__(self, build, maxsize=512):
+        self.build = build
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._figures = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, *key):
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return self._figures[key]
+            self.misses += 1
+        figure = serialize_figure(self.build(*key))
+        with self._lock:
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+        return figure
+
+    def prewarm(self, keys):
+        """Build every key up front, e.g. every dropdown value at boot."""
+        for key in keys:
+            self.get(*key)
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._figures),
+                maxsize=self.maxsize,
+            )
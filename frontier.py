@@ -0,0 +1,94 @@
+"""
+Long-only mean-variance efficient frontiers.
+
+Each frontier point is the fully invested, long-only portfolio that
+maximizes mu'w - (aversion / 2) w'Sw for one risk aversion. `solve` finds
+the portfolios for every aversion in one batch: accelerated projected
+gradient steps on the (aversions, assets) weight matrix, projecting each
+row back onto the simplex (w >= 0, sum w = 1) after every step.
+
+A regime has few years next to its number of asset classes, so the sample
+covariance is singular; its negative eigenvalues are dropped and it is
+shrunk towards the sample variances first.
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+
+SHRINKAGE = .2
+AVERSIONS = np.logspace(-4, 1, 60)
+# enough for the objective to within about 1e-4 of the optimum on the regime splits
+ITERATIONS = 400
+TOLERANCE = 1e-6
+# asset classes with fewer years in the regime are left out
+MIN_YEARS = 3
+
+Frontier = collections.namedtuple("Frontier", ["volatility", "returns", "weights", "tangency"])
+
+
+def covariance(returns, shrinkage=SHRINKAGE):
+    """Pairwise sample covariance of the columns of `returns`, shrunk towards its diagonal."""
+    sample = returns.cov().values
+    variances = np.diag(sample).copy()
+    sample = np.where(np.isnan(sample), 0.0, sample)
+    # columns cover different years, so the pairwise estimate can have negative eigenvalues
+    values, vectors = np.linalg.eigh(sample)
+    sample = np.dot(vectors * np.maximum(values, 0), vectors.T)
+    return (1 - shrinkage) * sample + shrinkage * np.diag(variances)
+
+
+def project_simplex(weights):
+    """Euclidean projection of every row onto {w >= 0, sum w = 1}."""
+    ordered = -np.sort(-weights, axis=1)
+    cumulative = np.cumsum(ordered, axis=1) - 1
+    steps = np.arange(1, weights.shape[1] + 1)
+    rho = (ordered - cumulative / steps > 0).sum(axis=1)
+    theta = cumulative[np.arange(len(weights)), rho - 1] / rho
+    return np.maximum(weights - theta[:, None], 0)
+
+
+def solve(mu, cov, aversions=AVERSIONS, iterations=ITERATIONS, tolerance=TOLERANCE):
+    """(len(aversions), len(mu)) optimal weights, one row per risk aversion."""
+    mu = np.asarray(mu, dtype=float)
+    aversions = np.asarray(aversions, dtype=float)[:, None]
+    step = 1 / (aversions * np.linalg.eigvalsh(cov)[-1])
+    weights = np.full((len(aversions), len(mu)), 1. / len(mu))
+    momentum, t = weights, np.ones((len(aversions), 1))
+    for _ in range(iterations):
+        gradient = aversions * np.dot(momentum, cov) - mu
+        updated = project_simplex(momentum - step * gradient)
+        change = updated - weights
+        # restart the momentum of rows where it has started to point uphill
+        t[(gradient * change).sum(axis=1) > 0] = 1.
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        momentum = updated + (t - 1) / t_next * change
+        weights, t = updated, t_next
+        if np.abs(change).max() < tolerance:
+            break
+    return weights
+
+
+def efficient_frontier(returns, mu, risk_free=0., aversions=AVERSIONS):
+    """
+    The frontier of the columns of `returns` (one row per year) with expected
+    returns `mu` (a Series by column): portfolio volatility and return along
+    the frontier, from the least volatile up, a frame of the weights of each
+    point and the position of the tangency portfolio, the point with the
+    highest return over `risk_free` per unit of volatility. None when no
+    column has MIN_YEARS years.
+    """
+    returns = returns.loc[:, (returns.count() >= MIN_YEARS) & mu.reindex(returns.columns).notnull().values]
+    if not len(returns.columns):
+        return None
+    cov = covariance(returns)
+    mu = mu[returns.columns].values.astype(float)
+    weights = solve(mu, cov, aversions)
+    volatility = np.sqrt(np.maximum(np.einsum("ij,jk,ik->i", weights, cov, weights), 0))
+    expected = np.dot(weights, mu)
+    order = np.argsort(volatility)
+    volatility, expected, weights = volatility[order], expected[order], weights[order]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = (expected - risk_free) / volatility
+    weights = pd.DataFrame(weights, columns=returns.columns)
+    return Frontier(volatility, expected, weights, int(np.nanargmax(sharpe)))
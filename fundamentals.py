@@ -0,0 +1,180 @@
+"""
+Sector-level fundamentals rolled up from the per-company metric pivots.
+
+archive/metrics/<Tag>-<frequency>.csv holds one row per company (CIK) and
+one column per quarter or fiscal year. Each company gets its sector from
+the two-digit NAICS `sector_code` in company-metadata.csv, named by
+`sector` (so codes 31-33 are all Manufacturing), and every period column
+is reduced per sector to
+
+* `sum`      - the sector total
+* `median`   - the median company
+* `weighted` - the mean weighted by each company's total assets that
+               period; the filings carry no market value, so assets stand
+               in for capitalization
+
+Sums and weighted means are one (sectors x companies) indicator-matrix
+product over a period block; medians are a pandas group-by over the CIK
+axis.
+
+`python fundamentals.py` (or `SectorStore.update`) keeps the results in
+archive/fundamentals/<frequency>.bin as a snapshot file (see snapshot.py).
+A tag is looked at again when its pivot or the total-assets pivot the
+weights come from has changed. Then only the periods whose column of
+values or weights differs from the last run are aggregated again, so
+appended periods and amended filings cost the columns they touch.
+Everything is rebuilt when the sector mapping changes.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from rebuild_metrics import METRIC_TAGS, METRICS_DIR
+from snapshot import Snapshot, file_digest, write
+
+METADATA_CSV = "company-metadata.csv"
+STORE_DIR = os.path.join("archive", "fundamentals")
+FREQUENCIES = ["quarterly", "yearly"]
+HOWS = ["sum", "median", "weighted"]
+WEIGHT_TAG = "Assets"
+
+
+def pivot_path(tag, frequency, metrics_dir=METRICS_DIR):
+    return os.path.join(metrics_dir, "{}-{}.csv".format(tag, frequency))
+
+
+def read_pivot(tag, frequency, periods=None, metrics_dir=METRICS_DIR):
+    """CIK x period values of one tag, only the `periods` columns if given."""
+    path = pivot_path(tag, frequency, metrics_dir)
+    usecols = None if periods is None else lambda column: column == "SEC ID" or column in periods
+    pivot = pd.read_csv(path, index_col=0, usecols=usecols)
+    pivot.index.name = "cik"
+    return pivot.astype(float)
+
+
+def load_sectors(path=METADATA_CSV):
+    """Sector name of every CIK that has one."""
+    return pd.read_csv(path, index_col=0)["sector"].dropna()
+
+
+def aggregate(values, sectors, weights=None):
+    """
+    how -> (periods x sectors) frame for HOWS, from CIK x period `values`,
+    a CIK -> sector Series and CIK x period `weights` (the weighted mean is
+    NaN without them). Companies without a sector are left out.
+    """
+    values = values[values.index.isin(sectors.index)]
+    names = sorted(sectors.unique())
+    codes = pd.Categorical(sectors.reindex(values.index), categories=names).codes
+    # (sectors x companies) indicator matrix
+    membership = (codes[None, :] == np.arange(len(names))[:, None]).astype(float)
+
+    present = values.notnull().values
+    filled = np.where(present, values.values, 0.0)
+    frames = dict(sum=np.dot(membership, filled))
+    frames["sum"][np.dot(membership, present) == 0] = np.nan
+    frames["median"] = values.groupby(codes).median().reindex(range(len(names))).values
+    if weights is None:
+        frames["weighted"] = np.full(frames["sum"].shape, np.nan)
+    else:
+        weights = weights.reindex(index=values.index, columns=values.columns).values
+        weights = np.where(present & (weights > 0), weights, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frames["weighted"] = np.dot(membership, filled * weights) / np.dot(membership, weights)
+    return dict(
+        (how, pd.DataFrame(frames[how].T, index=values.columns, columns=names))
+        for how in HOWS
+    )
+
+
+def column_digests(values, weights):
+    """period -> sha1 of one period's values and weights, to tell which periods changed."""
+    weights = weights.reindex(index=values.index, columns=values.columns)
+    ciks = values.index.values.tobytes()
+    return dict(
+        (str(period), hashlib.sha1(ciks + values[period].values.tobytes() + weights[period].values.tobytes()).hexdigest())
+        for period in values.columns)
+
+
+class SectorStore(object):
+    """Sector aggregates of every metric tag for one frequency, kept up to date incrementally."""
+
+    def __init__(self, frequency="quarterly", store_dir=STORE_DIR, metrics_dir=METRICS_DIR, metadata=METADATA_CSV):
+        self.frequency = frequency
+        self.path = os.path.join(store_dir, "{}.bin".format(frequency))
+        self.metrics_dir = metrics_dir
+        self.metadata = metadata
+        self._snapshot = None
+
+    def _open(self):
+        if self._snapshot is None and os.path.exists(self.path):
+            self._snapshot = Snapshot(self.path)
+        return self._snapshot
+
+    def frame(self, tag, how):
+        """(periods x sectors) `how` aggregate of `tag`."""
+        return self._open().frame("{}/{}".format(tag, how))
+
+    def tags(self):
+        return sorted(set(name.split("/")[0] for name in self._open().tables))
+
+    def update(self, tags=METRIC_TAGS, full=False):
+        """Bring the store up to date with the pivots; returns the tags that were (re)aggregated."""
+        sectors = load_sectors(self.metadata)
+        digest = file_digest(self.metadata)
+        snapshot = self._open()
+        stored = snapshot.header if snapshot is not None else {}
+        rebuild = full or stored.get("sectors") != digest
+        # tag -> key: sha1 of its pivot and of the weight pivot; periods: period -> column_digests
+        pivots = {} if rebuild else dict(stored.get("pivots", {}))
+        weight_digest = file_digest(pivot_path(WEIGHT_TAG, self.frequency, self.metrics_dir))
+
+        frames = {}
+        changed = []
+        for tag in tags:
+            key = [file_digest(pivot_path(tag, self.frequency, self.metrics_dir)), weight_digest]
+            entry = pivots.get(tag)
+            old = dict((how, self.frame(tag, how)) for how in HOWS) if isinstance(entry, dict) else None
+            if old is not None and entry["key"] == key:
+                frames.update(("{}/{}".format(tag, how), frame) for how, frame in old.items())
+                continue
+            values = read_pivot(tag, self.frequency, metrics_dir=self.metrics_dir)
+            weights = read_pivot(WEIGHT_TAG, self.frequency, list(values.columns), self.metrics_dir)
+            digests = column_digests(values, weights)
+            known = entry["periods"] if old is not None else {}
+            periods = [period for period in values.columns if known.get(period) != digests[period]]
+            new = aggregate(values[periods], sectors, weights) if periods else None
+            for how in HOWS:
+                parts = []
+                if old is not None:
+                    # stored periods still in the pivot and unchanged
+                    kept = old[how].index.isin(values.columns) & ~old[how].index.isin(periods)
+                    parts.append(old[how][kept])
+                if new is not None:
+                    parts.append(new[how])
+                frame = pd.concat(parts).reindex(values.columns)
+                frame.index = frame.index.astype(str)
+                frames["{}/{}".format(tag, how)] = frame
+            pivots[tag] = dict(key=key, periods=digests)
+            changed.append(tag)
+
+        if changed or snapshot is None:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            # the open mapping keeps reading the old file until it is replaced
+            self._snapshot = None
+            write(frames, self.path, sectors=digest, pivots=pivots)
+        return changed
+
+
+def growth(frame, frequency):
+    """Percent change on the same period a year earlier; NaN where that was zero or negative."""
+    earlier = frame.shift(4 if frequency == "quarterly" else 1)
+    return (frame / earlier.where(earlier > 0) - 1) * 100
+
+
+if __name__ == '__main__':
+    for frequency in FREQUENCIES:
+        print(frequency, "updated", SectorStore(frequency).update())
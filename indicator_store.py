@@ -0,0 +1,231 @@
+"""
+Append-only store of the raw monthly indicator series in data/.
+
+`oil prices WTISPLC.csv` carries, next to each month's WTI price, its
+trailing 12- to 60-month means (`rolling_<n>`) and the price's distance
+from them (`diff%_rolling_<n>`, a fraction). The prime rate, fed funds and
+Shiller CPI files are plain monthly dumps. Two annual views are derived
+from them:
+
+* `oil prices annual 12-31.csv` - the January row of the WTI file for
+  every year, dated the 31st of the December before
+* `indicators - oil, rollingdiff%, prime, inflation.csv` - per year, the
+  log WTI price and the prime rate of the previous December, December on
+  December CPI inflation (%) and the energy diff% of the next January
+
+`IndicatorStore.load()` replays the files once. After that, `append` adds
+a month to one series in constant time. Each trailing mean moves by a
+running sum: add the new price and subtract the one leaving the window.
+The row is appended to the series' CSV, and only the per-year values the
+views read are updated. `write_views()` then rewrites the two small
+annual files from those values.
+
+    store = IndicatorStore.load()
+    store.append("energy", "2018-11-01", 56.96)
+    store.append("cpi", "2018-12-01", 252.7)
+    store.write_views()
+
+`python indicator_store.py --add energy 2018-11-01 56.96 ...` appends
+without touching the views; `--write-views` also rewrites them. The
+rewritten views differ from the published ones where those were edited
+by hand (the 1972 rows, 2016 inflation), so rewriting them is opt-in.
+`--rebuild` recomputes the WTI file's derived columns from the prices.
+"""
+import argparse
+import collections
+import csv
+import math
+import os
+
+import regimes
+
+WINDOWS = tuple(range(12, 61, 6))
+# the energy window the indicators view carries, as in the published split
+VIEW_WINDOW = 30
+OIL_ANNUAL_CSV = "data/oil prices annual 12-31.csv"
+INDICATORS_CSV = "data/indicators - oil, rollingdiff%, prime, inflation.csv"
+
+# series -> (CSV, date column, value column)
+SERIES = collections.OrderedDict([
+    ("energy", (regimes.ENERGY_CSV, "Date", "price")),
+    ("prime", (regimes.PRIME_CSV, "", "rate")),
+    ("fedfunds", (regimes.FEDFUNDS_CSV, "Date", "rate")),
+    ("cpi", (regimes.SHILLER_CSV, "Date", "CPI")),
+])
+
+
+def _month(date):
+    """(year, month) of a YYYY-MM[-DD] date, or of a Shiller year.month date (1972.1 is October)."""
+    if "-" in date:
+        year, month = date.split("-")[:2]
+        return int(year), int(month)
+    value = float(date)
+    year = int(math.floor(value))
+    return year, int(round((value - year) * 100))
+
+
+def _number(value):
+    return "" if value is None else repr(value)
+
+
+class RollingMeans(object):
+    """Trailing means over several windows, each updated in O(1) per observation from a running sum."""
+
+    def __init__(self, windows=WINDOWS):
+        self.windows = tuple(windows)
+        self.count = 0
+        self._ring = [0.0] * max(self.windows)
+        self._sums = dict.fromkeys(self.windows, 0.0)
+
+    def push(self, value):
+        """Add the next observation; returns the mean per window, None until the window is full."""
+        size = len(self._ring)
+        for window in self.windows:
+            self._sums[window] += value
+            if self.count >= window:
+                self._sums[window] -= self._ring[(self.count - window) % size]
+        self._ring[self.count % size] = value
+        self.count += 1
+        return [self._sums[window] / window if self.count >= window else None for window in self.windows]
+
+
+def energy_row(price, means):
+    """Price, trailing means and diff% of one month, in the column order of the WTI file."""
+    return [price] + means + [None if mean is None else price / mean - 1 for mean in means]
+
+
+class IndicatorStore(object):
+    def __init__(self, windows=WINDOWS):
+        self.windows = tuple(windows)
+        self.energy = RollingMeans(self.windows)
+        # series -> (year, month) of its last observation
+        self.last = {}
+        # per-year values the views read: year -> (month, value) of the year's latest observation
+        self.latest = collections.defaultdict(dict)
+        # year -> CPI of its first month, the base of inflation in the year a series starts
+        self.first_cpi = {}
+        # year -> the WTI row of its January
+        self.january = {}
+        self._headers = {}
+
+    @classmethod
+    def load(cls, windows=WINDOWS):
+        """Replay every series from its CSV."""
+        store = cls(windows)
+        for series, (path, date_column, value_column) in SERIES.items():
+            with open(path, newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                store._headers[series] = header
+                date_at, value_at = header.index(date_column), header.index(value_column)
+                for row in reader:
+                    if len(row) > value_at and row[date_at] and row[value_at]:
+                        store._observe(series, _month(row[date_at]), float(row[value_at]))
+        return store
+
+    def _observe(self, series, month, value):
+        last = self.last.get(series)
+        if last is not None and month != (last[0] + last[1] // 12, last[1] % 12 + 1):
+            raise ValueError("{} {}-{:02d} does not follow {}-{:02d}".format(series, month[0], month[1], *last))
+        self.last[series] = month
+        year = month[0]
+        self.latest[series][year] = (month[1], value)
+        row = None
+        if series == "energy":
+            row = energy_row(value, self.energy.push(value))
+            if month[1] == 1:
+                self.january[year] = row
+        elif series == "cpi":
+            self.first_cpi.setdefault(year, value)
+        return row
+
+    def append(self, series, date, value):
+        """Add the month after the last one of `series` and append its row to the series' CSV."""
+        path, date_column, value_column = SERIES[series]
+        month = _month(date)
+        row = self._observe(series, month, float(value))
+        fields = dict.fromkeys(self._headers[series], "")
+        if series == "energy":
+            fields.update(zip(self._energy_columns(), map(_number, row)))
+        else:
+            fields[value_column] = _number(float(value))
+        if series == "cpi":
+            # Shiller's own columns: year.month and the fractional date of mid-month
+            fields[date_column] = "{}.{:02d}".format(*month)
+            fields["date  "] = repr(month[0] + (month[1] - .5) / 12)
+        else:
+            fields[date_column] = "{}-{:02d}-01".format(*month)
+        with open(path, "a", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerow([fields[column] for column in self._headers[series]])
+
+    def _december(self, series, year):
+        month, value = self.latest[series].get(year, (None, None))
+        return value if month == 12 else None
+
+    def oil_annual(self):
+        """Rows of the annual WTI view: date, then the January row of the year after."""
+        return [["{}-12-31".format(year - 1)] + row for year, row in sorted(self.january.items())]
+
+    def indicators(self):
+        """Rows of the annual indicators view, for every year all four values are known."""
+        diff_at = 1 + len(self.windows) + self.windows.index(VIEW_WINDOW)
+        rows = []
+        for year in sorted(self.latest["cpi"]):
+            oil = self._december("energy", year - 1)
+            prime = self._december("prime", year - 1)
+            cpi = self._december("cpi", year)
+            base = self._december("cpi", year - 1) or self.first_cpi.get(year)
+            following = self.january.get(year + 1)
+            if None in (oil, prime, cpi, following) or following[diff_at] is None:
+                continue
+            rows.append(["{}-12-31".format(year), math.log(oil), prime, (cpi / base - 1) * 100, following[diff_at]])
+        return rows
+
+    def _energy_columns(self):
+        return (["price"] + ["rolling_{}".format(window) for window in self.windows] +
+                ["diff%_rolling_{}".format(window) for window in self.windows])
+
+    def write_views(self, oil_annual=OIL_ANNUAL_CSV, indicators=INDICATORS_CSV):
+        _write(oil_annual, ["Date"] + self._energy_columns(), self.oil_annual())
+        _write(indicators, ["", "oil", "prime", "inflation", "oil_diff%_rolling_{}".format(VIEW_WINDOW)], self.indicators())
+
+    def rebuild(self):
+        """Rewrite the WTI file with every derived column recomputed from its prices."""
+        path, date_column, value_column = SERIES["energy"]
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            prices = [(row[0], float(row[header.index(value_column)])) for row in reader if row]
+        means = RollingMeans(self.windows)
+        rows = [[date] + energy_row(price, means.push(price)) for date, price in prices]
+        _write(path, [date_column] + self._energy_columns(), rows)
+
+
+def _write(path, header, rows):
+    # written aside and moved into place, so readers (and dataplane --watch) never see half a file
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows([row[0]] + [_number(value) for value in row[1:]] for row in rows)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Append monthly indicator observations and rewrite the annual views")
+    parser.add_argument("--add", nargs=3, action="append", default=[], metavar=("SERIES", "DATE", "VALUE"),
+                        help="one month of one series: {}".format(", ".join(SERIES)))
+    parser.add_argument("--rebuild", action="store_true", help="recompute the WTI file's derived columns first")
+    parser.add_argument("--write-views", action="store_true",
+                        help="also rewrite the two annual views, replacing their hand-edited values")
+    args = parser.parse_args()
+    if args.rebuild:
+        IndicatorStore().rebuild()
+    store = IndicatorStore.load()
+    for series, date, value in args.add:
+        store.append(series, date, value)
+    if args.write_views:
+        store.write_views()
+        print("views through", store.indicators()[-1][0])
+    else:
+        print("series through", ", ".join("{} {}-{:02d}".format(series, *store.last[series]) for series in SERIES))
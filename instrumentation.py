@@ -0,0 +1,280 @@
+"""
+In-process latency metrics for the app, served in Prometheus text format.
+
+* `Boot` records how long each startup phase took (imports of the heavy
+  libraries, loading the datasets, building the layout...) as gauges.
+* `instrument(app, registry)` wraps every callback registered afterwards:
+  the callback function's own time, the time Dash spends serializing its
+  output to JSON and the response size go into histograms per callback.
+* `request_hooks(server, registry)` times every Flask request by route.
+* `Profiler` runs one callback request under cProfile when armed.
+
+Nothing heavier than Flask is imported, so the module can be imported
+(and start timing) before numpy, pandas and plotly are. Metrics live in the
+process that recorded them; under several web workers each worker serves
+its own.
+"""
+import bisect
+import cProfile
+import collections
+import functools
+import io
+import pstats
+import threading
+import time
+
+import flask
+
+# seconds; callbacks range from a dict lookup to a frontier solve
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+# bytes; a regression row is ~10kB, the tables and backtests ~100kB
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join('{}="{}"'.format(name, value) for name, value in zip(names, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram(object):
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append("{}_bucket{} {}".format(self.name, _labels(self.labels + ("le",), labels + (le,)), cumulative))
+            lines.append("{}_sum{} {}".format(self.name, _labels(self.labels, labels), repr(total)))
+            lines.append("{}_count{} {}".format(self.name, _labels(self.labels, labels), cumulative))
+        return lines
+
+
+class Counter(object):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] += amount
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def values(self):
+        """Label values -> current value."""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} {}".format(self.name, self.kind)]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend("{}{} {}".format(self.name, _labels(self.labels, labels), _number(value)) for labels, value in values)
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Registry(object):
+    """Named metrics in registration order, plus functions that refresh gauges just before rendering."""
+
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._collectors = []
+
+    def _add(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def collect(self, function):
+        """Call `function()` before every render, e.g. to copy cache counters into gauges."""
+        self._collectors.append(function)
+        return function
+
+    def render(self):
+        for function in self._collectors:
+            function()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Boot(object):
+    """Startup phase timer: each `phase(name)` records the time since the previous one."""
+
+    def __init__(self, registry):
+        self.phases = registry.gauge("app_boot_phase_seconds", "Wall time of each startup phase.", ["phase"])
+        self.imports = registry.gauge("app_import_seconds", "Wall time of the first import of each module.", ["module"])
+        self.started = self._last = time.time()
+
+    def phase(self, name):
+        now = time.time()
+        self.phases.set(now - self._last, name)
+        self._last = now
+
+    def import_modules(self, *names):
+        """Import `names` in order, timing each; anything a module pulls in is counted against it."""
+        for name in names:
+            start = time.time()
+            __import__(name)
+            self.imports.set(time.time() - start, name)
+        self._last = time.time()
+
+    def total(self):
+        self.phases.set(time.time() - self.started, "total")
+
+
+class Profiler(object):
+    """Arms a cProfile capture of the next request to one callback (or any callback)."""
+
+    def __init__(self, limit=40):
+        self.limit = limit
+        self.armed = None
+        self.report = None
+        self._lock = threading.Lock()
+
+    def arm(self, callback="*"):
+        with self._lock:
+            self.armed = callback
+
+    def take(self, callback):
+        """True (and disarmed) if this request to `callback` should be profiled."""
+        with self._lock:
+            if self.armed in ("*", callback):
+                self.armed = None
+                return True
+            return False
+
+    def run(self, callback, function, *args, **kwargs):
+        profile = cProfile.Profile()
+        start = time.time()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            out = io.StringIO()
+            out.write("{} {:.3f}s\n".format(callback, time.time() - start))
+            pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.limit)
+            with self._lock:
+                self.report = out.getvalue()
+
+
+def instrument(app, registry, profiler=None):
+    """Time every callback registered on `app` from now on."""
+    seconds = registry.histogram(
+        "dash_callback_seconds",
+        "Callback wall time: the callback function (compute) and Dash's JSON encoding of its output (serialize).",
+        ["callback", "stage"])
+    payload = registry.histogram(
+        "dash_callback_payload_bytes", "Size of each callback response.", ["callback"], SIZE_BUCKETS)
+    exceptions = registry.counter(
+        "dash_callback_exceptions_total", "Callbacks that raised, PreventUpdate included.", ["callback", "exception"])
+    # compute time of the callback running on this thread, read back once Dash has serialized it
+    local = threading.local()
+    register = app.callback
+
+    def callback(output, inputs=[], state=[], events=[]):
+        name = "{}.{}".format(output.component_id, output.component_property)
+        decorate = register(output, inputs, state, events)
+
+        def wrap(function):
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                start = time.time()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    local.compute = time.time() - start
+
+            dispatch = decorate(timed)
+
+            @functools.wraps(function)
+            def observed(*args, **kwargs):
+                local.compute = None
+                start = time.time()
+                try:
+                    if profiler is not None and profiler.take(name):
+                        response = profiler.run(name, dispatch, *args, **kwargs)
+                    else:
+                        response = dispatch(*args, **kwargs)
+                except Exception as e:
+                    exceptions.inc(1, name, type(e).__name__)
+                    raise
+                finally:
+                    elapsed = time.time() - start
+                    compute = elapsed if local.compute is None else local.compute
+                    seconds.observe(compute, name, "compute")
+                seconds.observe(elapsed - compute, name, "serialize")
+                payload.observe(len(response.get_data()), name)
+                return response
+
+            # dispatch looks callbacks up here, so this is what serves requests
+            app.callback_map[name]["callback"] = observed
+            return observed
+        return wrap
+
+    app.callback = callback
+
+
+def request_hooks(server, registry):
+    """Time every request to `server` by route, e.g. the layout and dependencies Dash fetches on page load."""
+    seconds = registry.histogram("http_request_seconds", "Request wall time by route.", ["route", "method", "status"])
+    payload = registry.histogram("http_response_bytes", "Response size by route.", ["route"], SIZE_BUCKETS)
+
+    @server.before_request
+    def start_timer():
+        flask.g.instrumentation_start = time.time()
+
+    @server.after_request
+    def observe(response):
+        start = getattr(flask.g, "instrumentation_start", None)
+        if start is not None:
+            route = flask.request.url_rule.rule if flask.request.url_rule is not None else "unmatched"
+            seconds.observe(time.time() - start, route, flask.request.method, str(response.status_code))
+            if not response.direct_passthrough:
+                payload.observe(response.calculate_content_length() or 0, route)
+        return response
@@ -0,0 +1,168 @@
+"""
+Background jobs for callbacks too slow to run inside a web worker.
+
+`JobQueue.submit(func, **params)` hashes the function name and parameters
+into a job key, records the job in a SQLite table and hands it to a local
+process pool, returning the key at once. The pool process writes the pickled
+result (or the error) back to the same row. Submitting parameters that are
+already done, queued or running returns the existing key without starting
+anything, and since the table is one file every gunicorn worker shares the
+same jobs and results.
+
+A Dash callback submits and returns the key; a `dcc.Interval` polls
+`status(key)` until it is "done" and then reads `result(key)`.
+
+Keys also cover a digest of the code next to the function's module, so a
+deploy never reads back results of the previous code. `submit` deletes
+jobs older than MAX_AGE, so the table doesn't grow without bound.
+"""
+import functools
+import glob
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import sys
+import time
+import traceback
+
+JOBS_DB = os.environ.get("JOBS_DB", "jobs.sqlite")
+# a queued or running job older than this is assumed lost and resubmitted
+JOB_TIMEOUT = 300
+# jobs submitted longer ago than this are deleted, results included
+MAX_AGE = 24 * 3600
+# seconds between those deletions in one process
+PRUNE_INTERVAL = 600
+
+_SCHEMA = """
+create table if not exists jobs (
+    key text primary key,
+    func text not null,
+    params text not null,
+    status text not null,
+    submitted real not null,
+    finished real,
+    result blob,
+    error text
+)
+"""
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    connection.execute("pragma journal_mode=wal")
+    return connection
+
+
+@functools.lru_cache(maxsize=None)
+def code_digest(directory):
+    """sha1 of every .py file in `directory`."""
+    digest = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _run(path, key, module, name, params):
+    connection = _connect(path)
+    try:
+        connection.execute("update jobs set status = 'running' where key = ?", (key,))
+        try:
+            func = getattr(importlib.import_module(module), name)
+            result = pickle.dumps(func(**params), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            connection.execute(
+                "update jobs set status = 'error', finished = ?, error = ? where key = ?",
+                (time.time(), traceback.format_exc(), key))
+        else:
+            connection.execute(
+                "update jobs set status = 'done', finished = ?, result = ? where key = ?",
+                (time.time(), sqlite3.Binary(result), key))
+    finally:
+        connection.close()
+
+
+class JobQueue(object):
+    def __init__(self, path=JOBS_DB, processes=None, timeout=JOB_TIMEOUT):
+        self.path = path
+        self.processes = processes
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._pruned = 0
+        connection = _connect(path)
+        try:
+            connection.execute(_SCHEMA)
+        finally:
+            connection.close()
+
+    def _get_pool(self):
+        # gunicorn forks workers after import, so each worker starts its own pool
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = multiprocessing.Pool(self.processes)
+            self._pid = os.getpid()
+        return self._pool
+
+    @staticmethod
+    def key(func, params):
+        name = "{}.{}".format(func.__module__, func.__name__)
+        code = code_digest(os.path.dirname(os.path.abspath(sys.modules[func.__module__].__file__)))
+        return hashlib.sha1(json.dumps([name, params, code], sort_keys=True, default=str).encode()).hexdigest()
+
+    def submit(self, func, **params):
+        """Queue `func(**params)` unless the same call is done or in flight; returns its key."""
+        key = self.key(func, params)
+        now = time.time()
+        if now - self._pruned > PRUNE_INTERVAL:
+            self.prune(MAX_AGE)
+            self._pruned = now
+        connection = _connect(self.path)
+        try:
+            connection.execute("begin immediate")
+            row = connection.execute("select status, submitted from jobs where key = ?", (key,)).fetchone()
+            if row is not None and (row[0] == "done" or (row[0] != "error" and now - row[1] < self.timeout)):
+                connection.execute("commit")
+                return key
+            connection.execute(
+                "insert or replace into jobs (key, func, params, status, submitted) values (?, ?, ?, 'queued', ?)",
+                (key, "{}.{}".format(func.__module__, func.__name__), json.dumps(params, default=str), now))
+            connection.execute("commit")
+        finally:
+            connection.close()
+        self._get_pool().apply_async(_run, (self.path, key, func.__module__, func.__name__, params))
+        return key
+
+    def status(self, key):
+        """(status, seconds since submission, error) - status is queued, running, done, error or None."""
+        connection = _connect(self.path)
+        try:
+            row = connection.execute("select status, submitted, finished, error from jobs where key = ?", (key,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None, 0.0, None
+        status, submitted, finished, error = row
+        return status, (finished or time.time()) - submitted, error
+
+    def result(self, key):
+        """The return value of a finished job; raises KeyError unless it is done."""
+        connection = _connect(self.path)
+        try:
+            row = connection.execute("select result from jobs where key = ? and status = 'done'", (key,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(bytes(row[0]))
+
+    def prune(self, max_age=MAX_AGE):
+        """Forget jobs submitted more than `max_age` seconds ago."""
+        connection = _connect(self.path)
+        try:
+            connection.execute("delete from jobs where submitted < ?", (time.time() - max_age,))
+        finally:
+            connection.close()
@@ -0,0 +1,128 @@
+"""
+Responses serialized and compressed once, then served from memory.
+
+A `Blob` holds one payload in every encoding the server offers - as is,
+gzip and, when the `brotli` package is installed, brotli - plus a strong
+ETag per encoding. `encoded` answers with the best encoding the client
+accepts. `respond` does the same for GET requests, with the ETag, and
+answers a matching If-None-Match with 304 Not Modified, so a repeat
+visitor re-downloads nothing and the server neither re-serializes nor
+re-compresses anything. Browsers never revalidate POSTs, so Dash
+callbacks get `encoded`. Flask-Compress (which Dash enables) leaves
+responses that already carry a Content-Encoding alone.
+
+`BlobCache` builds each blob on first use. The app keys it by data
+version, so a newly published data plane gets new blobs and new ETags.
+"""
+import collections
+import gzip
+import hashlib
+import json
+import threading
+
+import flask
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# the layout and figures change only with the data, so caches must revalidate rather than expire
+CACHE_CONTROL = "no-cache"
+
+Blob = collections.namedtuple("Blob", ["digest", "bodies"])
+
+
+def compress(payload):
+    """Blob of `payload` (bytes) in every available encoding, encoding -> body."""
+    bodies = collections.OrderedDict()
+    if brotli is not None:
+        bodies["br"] = brotli.compress(payload, quality=11)
+    bodies["gzip"] = gzip.compress(payload, compresslevel=9)
+    bodies["identity"] = payload
+    return Blob(hashlib.sha1(payload).hexdigest(), bodies)
+
+
+def _without_uids(value):
+    if isinstance(value, dict):
+        return collections.OrderedDict(
+            (key, _without_uids(item)) for key, item in value.items() if not (key == "uid" and "type" in value))
+    if isinstance(value, list):
+        return [_without_uids(item) for item in value]
+    return value
+
+
+def stable(payload):
+    """
+    JSON `payload` (bytes) without the random uid plotly gives every trace,
+    so each web worker serves the same bytes under the same ETag.
+    """
+    return json.dumps(_without_uids(json.loads(payload.decode()))).encode()
+
+
+def to_json(value):
+    """`value` serialized as Dash serializes layouts and callback output, via `stable`."""
+    return stable(json.dumps(value, cls=PlotlyJSONEncoder).encode())
+
+
+def etag(blob, encoding):
+    # strong ETags must differ between encodings of the same content
+    return blob.digest if encoding == "identity" else "{}-{}".format(blob.digest, encoding)
+
+
+def _accepted(blob):
+    return next(
+        encoding for encoding in blob.bodies if encoding == "identity" or encoding in flask.request.accept_encodings)
+
+
+def encoded(blob, mimetype="application/json"):
+    """The response for `blob` in the best encoding the current request accepts."""
+    encoding = _accepted(blob)
+    response = flask.Response(blob.bodies[encoding], mimetype=mimetype)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def respond(blob, mimetype="application/json", cache_control=CACHE_CONTROL):
+    """The response for `blob` to the current GET request: 304 if the client has it, else `encoded`."""
+    cached = [encoding for encoding in blob.bodies if flask.request.if_none_match.contains(etag(blob, encoding))]
+    if cached:
+        encoding = cached[0]
+        response = flask.Response(status=304)
+        response.vary.add("Accept-Encoding")
+    else:
+        encoding = _accepted(blob)
+        response = encoded(blob, mimetype)
+    response.set_etag(etag(blob, encoding))
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+class BlobCache(object):
+    """Blobs built on first use, key -> Blob."""
+
+    def __init__(self):
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """The blob under `key`, compressing `build()` (bytes) on a miss."""
+        with self._lock:
+            if key in self._blobs:
+                return self._blobs[key]
+        blob = compress(build())
+        with self._lock:
+            return self._blobs.setdefault(key, blob)
+
+    def clear(self):
+        with self._lock:
+            self._blobs.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                blobs=len(self._blobs),
+                bytes=sum(len(body) for blob in self._blobs.values() for body in blob.bodies.values()))
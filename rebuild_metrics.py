@@ -0,0 +1,306 @@
+"""
+Rebuild the archive/metrics pivots from the per-company files in archive/companies.
+
+For every tag in METRIC_TAGS this writes `<Tag>-quarterly.csv` and
+`<Tag>-yearly.csv` (SEC ID rows, quarter / fiscal-year columns), plus
+`latest-snapshot-quarterly.csv` and `latest-snapshot-yearly.csv` with every
+tag at each company's most recent report date.
+
+Company files are parsed on a process pool and reduced to the few values
+the pivots need. Those per-company extracts are kept in
+archive/metrics/.extracts.npz together with the size, mtime and sha1 of the
+files they came from. A later run only reparses companies whose files
+changed, so a daily delta touches a handful of files instead of 32k.
+
+The pivots the app reads in archive/metrics do not all come out of this
+rebuild cell for cell, so it writes to archive/metrics-rebuilt unless told
+`--in-place`.
+
+Periods are labelled by calendar quarter and by fiscal year, where a fiscal
+year is the calendar year of its end date minus six months (so a year
+ending 2013-03-31 is fiscal 2012).
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from company_store import COMPANIES_DIR, company_files, read_company_file
+
+METRICS_DIR = os.path.join("archive", "metrics")
+# where the rebuild writes by default, next to the published pivots rather than over them
+REBUILD_DIR = os.path.join("archive", "metrics-rebuilt")
+EXTRACTS = ".extracts.npz"
+FORMAT_VERSION = 1
+METRIC_TAGS = [
+    "Assets",
+    "AssetsCurrent",
+    "CashAndCashEquivalentsAtCarryingValue",
+    "ComprehensiveIncomeNetOfTax",
+    "EarningsPerShareDiluted",
+    "Goodwill",
+    "Liabilities",
+    "LiabilitiesCurrent",
+    "NetCashProvidedByUsedInFinancingActivities",
+    "NetCashProvidedByUsedInInvestingActivities",
+    "NetCashProvidedByUsedInOperatingActivities",
+    "OperatingIncomeLoss",
+    "PropertyPlantAndEquipmentNet",
+    "Revenues",
+    "WeightedAverageNumberOfDilutedSharesOutstanding",
+]
+_TAG_CODES = dict((tag, code) for code, tag in enumerate(METRIC_TAGS))
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def quarter_of(days):
+    """Days since 1970-01-01 -> quarters since year 0 (year*4 + quarter-1)."""
+    dates = _EPOCH + np.asarray(days, dtype="timedelta64[D]")
+    months = dates.astype("datetime64[M]").astype(np.int64)  # months since 1970-01
+    return (months // 12 + 1970) * 4 + (months % 12) // 3
+
+
+def fiscal_year_of(days):
+    dates = _EPOCH + np.asarray(days, dtype="timedelta64[D]") - np.timedelta64(182, "D")
+    return dates.astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+def _values_by_tag(parsed, periods=None):
+    """{tag: {period: value}} for METRIC_TAGS, optionally limited to `periods`."""
+    tags, tag_idx, period, value = parsed
+    found = {}
+    for i, p, v in zip(tag_idx, period, value):
+        tag = tags[i]
+        if tag in _TAG_CODES and (periods is None or p in periods):
+            found.setdefault(tag, {})[int(p)] = v
+    return found
+
+
+def _series(primary, fallback):
+    # duration tags come from the quarterly/yearly file, balance-sheet tags from instant
+    merged = dict(fallback)
+    merged.update(primary)
+    return merged
+
+
+def _latest(primary, fallback, periods):
+    if not len(periods):
+        return -1, np.full(len(METRIC_TAGS), np.nan)
+    latest = int(np.max(periods))
+    merged = _series(primary, fallback)
+    values = np.full(len(METRIC_TAGS), np.nan)
+    for tag, code in _TAG_CODES.items():
+        values[code] = merged.get(tag, {}).get(latest, np.nan)
+    return latest, values
+
+
+def extract_company(paths):
+    """
+    Reduce one company's instant/quarterly/yearly files to pivot cells.
+
+    Returns (quarterly, yearly, latest_quarterly, latest_yearly), where
+    quarterly and yearly are (tag code, period label, value) arrays and the
+    latest_* are (report date in days or -1, one value per tag).
+    """
+    empty = ([], np.zeros(0, np.int32), np.zeros(0, np.int32), np.zeros(0))
+    parsed = dict((frequency, read_company_file(path)) for frequency, path in paths.items())
+    instant = parsed.get("instant", empty)
+    quarterly = parsed.get("quarterly", empty)
+    yearly = parsed.get("yearly", empty)
+
+    year_ends = set(int(p) for p in yearly[2])
+    instant_q = _values_by_tag(instant)
+    instant_y = _values_by_tag(instant, year_ends)
+    duration_q = _values_by_tag(quarterly)
+    duration_y = _values_by_tag(yearly)
+
+    out = []
+    for primary, fallback, label in [
+            (duration_q, instant_q, quarter_of),
+            (duration_y, instant_y, fiscal_year_of)]:
+        codes, periods, values = [], [], []
+        for tag in METRIC_TAGS:
+            cells = primary.get(tag) or fallback.get(tag) or {}
+            for period in sorted(cells):
+                codes.append(_TAG_CODES[tag])
+                periods.append(period)
+                values.append(cells[period])
+        out.append((
+            np.array(codes, dtype=np.int8),
+            label(np.array(periods, dtype=np.int32)).astype(np.int32),
+            np.array(values, dtype=np.float64),
+        ))
+    out.append(_latest(duration_q, instant_q, quarterly[2]))
+    out.append(_latest(duration_y, instant_y, yearly[2]))
+    return tuple(out)
+
+
+def _extract(item):
+    cik, paths = item
+    return cik, extract_company(paths)
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class Extracts(object):
+    """Per-company extracts plus the stamps of the files they were built from."""
+
+    def __init__(self):
+        self.stamps = {}
+        self.companies = {}
+
+    @classmethod
+    def load(cls, path):
+        extracts = cls()
+        if not os.path.exists(path):
+            return extracts
+        with np.load(path) as saved:
+            if int(saved["version"]) != FORMAT_VERSION:
+                return extracts
+            extracts.stamps = json.loads(str(saved["stamps"]))
+            ciks = saved["ciks"]
+            parts = [saved[name] for name in (
+                "q_offsets", "q_codes", "q_labels", "q_values",
+                "y_offsets", "y_codes", "y_labels", "y_values",
+                "latest_q_date", "latest_q_values", "latest_y_date", "latest_y_values")]
+        q_off, q_codes, q_labels, q_values, y_off, y_codes, y_labels, y_values = parts[:8]
+        lq_date, lq_values, ly_date, ly_values = parts[8:]
+        for i, cik in enumerate(ciks):
+            extracts.companies[int(cik)] = (
+                (q_codes[q_off[i]:q_off[i + 1]], q_labels[q_off[i]:q_off[i + 1]], q_values[q_off[i]:q_off[i + 1]]),
+                (y_codes[y_off[i]:y_off[i + 1]], y_labels[y_off[i]:y_off[i + 1]], y_values[y_off[i]:y_off[i + 1]]),
+                (int(lq_date[i]), lq_values[i]),
+                (int(ly_date[i]), ly_values[i]),
+            )
+        return extracts
+
+    def save(self, path):
+        ciks = sorted(self.companies)
+        rows = [self.companies[cik] for cik in ciks]
+
+        def packed(which):
+            sizes = [len(row[which][0]) for row in rows]
+            offsets = np.r_[0, np.cumsum(sizes)].astype(np.int64)
+            return [offsets] + [
+                np.concatenate([row[which][k] for row in rows]) if rows else np.zeros(0)
+                for k in range(3)]
+
+        q_parts, y_parts = packed(0), packed(1)
+        width = len(METRIC_TAGS)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            version=np.array(FORMAT_VERSION),
+            stamps=np.array(json.dumps(self.stamps)),
+            ciks=np.array(ciks, dtype=np.int64),
+            q_offsets=q_parts[0], q_codes=q_parts[1], q_labels=q_parts[2], q_values=q_parts[3],
+            y_offsets=y_parts[0], y_codes=y_parts[1], y_labels=y_parts[2], y_values=y_parts[3],
+            latest_q_date=np.array([row[2][0] for row in rows], dtype=np.int32),
+            latest_q_values=np.array([row[2][1] for row in rows]).reshape(-1, width),
+            latest_y_date=np.array([row[3][0] for row in rows], dtype=np.int32),
+            latest_y_values=np.array([row[3][1] for row in rows]).reshape(-1, width),
+        )
+        os.replace(tmp, path)
+
+
+def _changed_companies(files, stamps):
+    """CIKs with a new, removed or modified file, updating `stamps` as it goes."""
+    changed = set()
+    seen = set()
+    for cik, frequency, path in files:
+        seen.add(path)
+        stat = os.stat(path)
+        stamp = stamps.get(path)
+        if stamp and stamp[0] == stat.st_size and stamp[1] == stat.st_mtime_ns:
+            continue
+        digest = _file_digest(path)
+        if not stamp or stamp[2] != digest:
+            changed.add(cik)
+        stamps[path] = [stat.st_size, stat.st_mtime_ns, digest]
+    for path in set(stamps) - seen:
+        changed.add(int(os.path.basename(path).split("-")[0]))
+        del stamps[path]
+    return changed
+
+
+def _quarter_name(quarter):
+    return "{}Q{}".format(quarter // 4, quarter % 4 + 1)
+
+
+def write_metrics(extracts, metrics_dir=METRICS_DIR):
+    ciks = sorted(extracts.companies)
+    index = pd.Index(ciks, name="SEC ID")
+    for which, suffix, name in [(0, "quarterly", _quarter_name), (1, "yearly", str)]:
+        cells = [extracts.companies[cik][which] for cik in ciks]
+        rows = np.repeat(np.arange(len(ciks)), [len(codes) for codes, _, _ in cells])
+        codes = np.concatenate([c for c, _, _ in cells]) if cells else np.zeros(0, np.int8)
+        periods = np.concatenate([p for _, p, _ in cells]) if cells else np.zeros(0, np.int32)
+        values = np.concatenate([v for _, _, v in cells]) if cells else np.zeros(0)
+        first = int(periods.min()) if len(periods) else 0
+        labels = np.arange(first, int(periods.max()) + 1 if len(periods) else 0)
+        for code, tag in enumerate(METRIC_TAGS):
+            mask = codes == code
+            grid = np.full((len(ciks), len(labels)), np.nan)
+            grid[rows[mask], periods[mask] - first] = values[mask]
+            frame = pd.DataFrame(grid, index=index, columns=[name(int(label)) for label in labels])
+            frame.to_csv(os.path.join(metrics_dir, "{}-{}.csv".format(tag, suffix)), float_format="%.3f")
+
+        latest = [(cik, extracts.companies[cik][which + 2]) for cik in ciks]
+        latest = [(cik, date, values) for cik, (date, values) in latest if date >= 0]
+        snapshot = pd.DataFrame(
+            np.array([values for _, _, values in latest]).reshape(-1, len(METRIC_TAGS)),
+            index=pd.Index([cik for cik, _, _ in latest], name="SEC ID"),
+            columns=METRIC_TAGS)
+        snapshot.insert(0, "Report date", [str(_EPOCH + np.timedelta64(date, "D")) for _, date, _ in latest])
+        snapshot.to_csv(os.path.join(metrics_dir, "latest-snapshot-{}.csv".format(suffix)), float_format="%.3f")
+
+
+def rebuild(companies_dir=COMPANIES_DIR, metrics_dir=REBUILD_DIR, processes=None, full=False):
+    """Bring the pivots in `metrics_dir` up to date, reparsing only changed companies unless `full`."""
+    os.makedirs(metrics_dir, exist_ok=True)
+    extracts_path = os.path.join(metrics_dir, EXTRACTS)
+    extracts = Extracts() if full else Extracts.load(extracts_path)
+    files = company_files(companies_dir)
+    changed = _changed_companies(files, extracts.stamps)
+
+    by_company = {}
+    for cik, frequency, path in files:
+        if cik in changed:
+            by_company.setdefault(cik, {})[frequency] = path
+    for cik in changed - set(by_company):
+        extracts.companies.pop(cik, None)
+
+    if by_company:
+        pool = multiprocessing.Pool(processes)
+        try:
+            work = sorted(by_company.items())
+            for cik, extract in pool.imap_unordered(_extract, work, chunksize=32):
+                extracts.companies[cik] = extract
+        finally:
+            pool.close()
+            pool.join()
+
+    if changed or full:
+        write_metrics(extracts, metrics_dir)
+    extracts.save(extracts_path)
+    return changed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild archive/metrics from archive/companies")
+    parser.add_argument("--companies", default=COMPANIES_DIR)
+    parser.add_argument("--metrics", default=None, help="output directory (default {})".format(REBUILD_DIR))
+    parser.add_argument("--in-place", action="store_true", help="overwrite the published pivots in {}".format(METRICS_DIR))
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--full", action="store_true", help="ignore the extract cache and reparse everything")
+    args = parser.parse_args()
+    metrics_dir = args.metrics or (METRICS_DIR if args.in_place else REBUILD_DIR)
+    changed = rebuild(args.companies, metrics_dir, args.processes, args.full)
+    print("reprocessed", len(changed), "companies")
@@ -1,72 +1,11 @@
-recessions = [
-        {
-            'type': 'rect',
-            'xref': 'x',
-            'yref': 'paper',
-            'x0': "1973-07-01",
-            'y0': 0,
-            'x1': "1982-07-01",
-            'y1': 1,
-            'fillcolor': '#d3d3d3',
-            'opacity': .4,
-            'line': {
-                'width': 0,
-            }
-        },
-        {
-            'type': 'rect',
-            'xref': 'x',
-            'yref': 'paper',
-            'x0': "1989-01-01",
-            'y0': 0,
-            'x1': "1991-08-01",
-            'y1': 1,
-            'fillcolor': '#d3d3d3',
-            'opacity': .4,
-            'line': {
-                'width': 0,
-            }
-        },
-        {
-            'type': 'rect',
-            'xref': 'x',
-            'yref': 'paper',
-            'x0': "1996-03-01",
-            'y0': 0,
-            'x1': "1997-01-01",
-            'y1': 1,
-            'fillcolor': '#d3d3d3',
-            'opacity': .4,
-            'line': {
-                'width': 0,
-            }
-        },
-        {
-            'type': 'rect',
-            'xref': 'x',
-            'yref': 'paper',
-            'x0': "1999-03-01",
-            'y0': 0,
-            'x1': "2001-06-01",
-            'y1': 1,
-            'fillcolor': '#d3d3d3',
-            'opacity': .4,
-            'line': {
-                'width': 0,
-            }
-        },
-        {
-            'type': 'rect',
-            'xref': 'x',
-            'yref': 'paper',
-            'x0': "2004-03-01",
-            'y0': 0,
-            'x1': "2008-07-01",
-            'y1': 1,
-            'fillcolor': '#d3d3d3',
-            'opacity': .4,
-            'line': {
-                'width': 0,
-            }
-        }
-    ]
\ No newline at end of file
+from regimes import period_shapes
+
+# hand-picked hi-IIE periods shown on the published analysis;
+# regimes.detect() computes them from the raw monthly series instead
+recessions = period_shapes([
+    ("1973-07-01", "1982-07-01"),
+    ("1989-01-01", "1991-08-01"),
+    ("1996-03-01", "1997-01-01"),
+    ("1999-03-01", "2001-06-01"),
+    ("2004-03-01", "2008-07-01"),
+])
@@ -0,0 +1,104 @@
+"""
+Memoized dependency graph for values derived from page parameters.
+
+Each node names its inputs: other nodes, or parameters such as a slider
+value. A node is cached by the values of just the parameters it depends on,
+directly or through its inputs, so moving one slider only re-derives the
+nodes downstream of it and everything else is a dict lookup.
+
+    graph = Graph()
+
+    @graph.node("window")
+    def annual_indicators(window):
+        ...
+
+    @graph.node("threshold", "annual_indicators")
+    def split(threshold, annual_indicators):
+        ...
+
+    graph.get("split", threshold=10, window=30)
+
+When the data under a node changes, `invalidate` drops that node and
+everything downstream of it and leaves the rest of the cache alone.
+"""
+import collections
+import threading
+
+
+class Graph(object):
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._nodes = collections.OrderedDict()
+        self._params = {}
+        self._lock = threading.Lock()
+
+    def node(self, *inputs):
+        def register(func):
+            self._nodes[func.__name__] = (func, inputs, collections.OrderedDict())
+            return func
+        return register
+
+    def params(self, name):
+        """Sorted names of the parameters `name` depends on."""
+        if name not in self._params:
+            found = set()
+            for item in self._nodes[name][1]:
+                if item in self._nodes:
+                    found.update(self.params(item))
+                else:
+                    found.add(item)
+            self._params[name] = tuple(sorted(found))
+        return self._params[name]
+
+    def get(self, name, **params):
+        func, inputs, memo = self._nodes[name]
+        key = tuple(params[param] for param in self.params(name))
+        with self._lock:
+            if key in memo:
+                memo.move_to_end(key)
+                return memo[key]
+        args = [self.get(item, **params) if item in self._nodes else params[item] for item in inputs]
+        value = func(*args)
+        with self._lock:
+            memo[key] = value
+            while len(memo) > self.maxsize:
+                memo.popitem(last=False)
+        return value
+
+    def cached(self, name, **params):
+        func, inputs, memo = self._nodes[name]
+        with self._lock:
+            return tuple(params[param] for param in self.params(name)) in memo
+
+    def seed(self, name, value, **params):
+        """Store a value computed elsewhere, e.g. by a background job, as if `get` had made it."""
+        func, inputs, memo = self._nodes[name]
+        with self._lock:
+            memo[tuple(params[param] for param in self.params(name))] = value
+            while len(memo) > self.maxsize:
+                memo.popitem(last=False)
+
+    def downstream(self, *names):
+        """`names` and every node that depends on one of them, directly or through other nodes."""
+        found = set(names)
+        grew = True
+        while grew:
+            grew = False
+            for name, (func, inputs, memo) in self._nodes.items():
+                if name not in found and found.intersection(inputs):
+                    found.add(name)
+                    grew = True
+        return found
+
+    def invalidate(self, *names):
+        """Forget the values of `names` and everything derived from them; returns the names forgotten."""
+        found = self.downstream(*names)
+        with self._lock:
+            for name in found:
+                self._nodes[name][2].clear()
+        return found
+
+    def clear(self):
+        with self._lock:
+            for func, inputs, memo in self._nodes.values():
+                memo.clear()
@@ -0,0 +1,148 @@
+"""
+Hi-IIE period detection from the raw monthly indicator series.
+
+A month is hi-IIE when every selected condition holds:
+
+* energy    - the WTI price exceeds its `window`-month rolling average by `threshold` or more
+* inflation - year-over-year CPI inflation (Shiller) is above its own `window`-month average
+* interest  - the prime (or fed funds) rate is above its own `window`-month average
+
+Consecutive hi-IIE months form periods; periods separated by `gap` months or
+less are merged. A year counts as hi-IIE when at least `year_share` of its
+months do. Results are cached per parameter set, so recomputing for every
+request costs a dict lookup after the first call.
+"""
+import collections
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+ENERGY_CSV = "data/oil prices WTISPLC.csv"
+PRIME_CSV = "data/prime rate monthly bank loan fred.csv"
+FEDFUNDS_CSV = "data/federal funds rate fred FEDFUNDS.csv"
+SHILLER_CSV = "data/shiller_ie_data.csv"
+SOURCES = (ENERGY_CSV, PRIME_CSV, FEDFUNDS_CSV, SHILLER_CSV)
+
+CONDITIONS = ("energy", "inflation", "interest")
+THRESHOLD = .10
+WINDOW = 30
+
+Regimes = collections.namedtuple("Regimes", ["flags", "periods", "shapes", "years"])
+
+
+def _shiller_months(dates):
+    # Shiller dates are year.month with a two-digit month, so 1972.1 is October
+    years = np.floor(dates).astype(int)
+    months = np.round((dates - years) * 100).astype(int)
+    return pd.to_datetime(pd.DataFrame(dict(year=years, month=months, day=1)))
+
+
+@lru_cache(maxsize=1)
+def load_monthly():
+    """Month-start frame of energy (WTI), prime, fedfunds and cpi over their common range."""
+    energy = pd.read_csv(ENERGY_CSV, index_col=0, parse_dates=True)["price"]
+    prime = pd.read_csv(PRIME_CSV, index_col=0, parse_dates=True)["rate"]
+    fedfunds = pd.read_csv(FEDFUNDS_CSV, index_col=0, parse_dates=True)["rate"]
+    shiller = pd.read_csv(SHILLER_CSV).dropna(subset=["Date", "CPI"])
+    cpi = pd.Series(shiller["CPI"].values, index=_shiller_months(shiller["Date"].values))
+    monthly = pd.DataFrame(dict(energy=energy, prime=prime, fedfunds=fedfunds, cpi=cpi))
+    return monthly.dropna()
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` rows from running sums; NaN unless the window is all present."""
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        present = ~np.isnan(values)
+        sums = np.cumsum(np.r_[0.0, np.where(present, values, 0.0)])
+        counts = np.cumsum(np.r_[0, present])
+        full = counts[window:] - counts[:-window] == window
+        out[window - 1:] = np.where(full, (sums[window:] - sums[:-window]) / window, np.nan)
+    return out
+
+
+@lru_cache(maxsize=64)
+def monthly_flags(threshold=THRESHOLD, window=WINDOW, interest="prime"):
+    monthly = load_monthly()
+    energy = monthly["energy"].values
+    cpi = monthly["cpi"].values
+    rate = monthly[interest].values
+
+    energy_diff = energy / rolling_mean(energy, window) - 1
+    inflation = np.full(len(cpi), np.nan)
+    inflation[12:] = (cpi[12:] / cpi[:-12] - 1) * 100
+    with np.errstate(invalid="ignore"):
+        flags = pd.DataFrame(dict(
+            energy_diff=energy_diff,
+            inflation=inflation,
+            interest=rate,
+            energy=energy_diff >= threshold,
+            inflation_high=inflation > rolling_mean(inflation, window),
+            interest_high=rate > rolling_mean(rate, window),
+        ), index=monthly.index)
+    return flags
+
+
+def _runs(flag):
+    """(start, stop) row positions of every run of True, stop exclusive."""
+    edges = np.diff(np.r_[0, flag.astype(np.int8), 0])
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def period_shapes(periods):
+    """Plotly shading rectangles for (start, end) date pairs."""
+    return [
+        {
+            'type': 'rect',
+            'xref': 'x',
+            'yref': 'paper',
+            'x0': start,
+            'y0': 0,
+            'x1': end,
+            'y1': 1,
+            'fillcolor': '#d3d3d3',
+            'opacity': .4,
+            'line': {
+                'width': 0,
+            }
+        }
+        for start, end in periods
+    ]
+
+
+@lru_cache(maxsize=256)
+def detect(threshold=THRESHOLD, window=WINDOW, conditions=CONDITIONS, gap=0, interest="prime", year_share=.5):
+    """Hi-IIE months, periods, shading shapes and years for one parameter set."""
+    flags = monthly_flags(threshold, window, interest)
+    columns = dict(energy="energy", inflation="inflation_high", interest="interest_high")
+    hi = np.ones(len(flags), dtype=bool)
+    for condition in conditions:
+        hi &= flags[columns[condition]].values
+
+    starts, stops = _runs(hi)
+    if gap and len(starts):
+        keep = np.r_[True, starts[1:] - stops[:-1] > gap]
+        starts, stops = starts[keep], np.r_[stops[:-1][keep[1:]], stops[-1]]
+        for start, stop in zip(starts, stops):
+            hi[start:stop] = True
+
+    dates = flags.index.strftime("%Y-%m-%d")
+    periods = [(dates[start], dates[stop - 1]) for start, stop in zip(starts, stops)]
+    monthly = pd.Series(hi, index=flags.index)
+    share = monthly.groupby(monthly.index.year).mean()
+    years = frozenset(int(year) for year in share.index[share.values >= year_share])
+    return Regimes(monthly, periods, period_shapes(periods), years)
+
+
+def reload():
+    """Forget the monthly series and everything detected from them, e.g. after the CSVs are updated."""
+    for function in (load_monthly, monthly_flags, detect):
+        function.cache_clear()
+
+
+def split(frame, years):
+    """Split an annual frame into (rows whose index year is in `years`, other rows)."""
+    hi = np.asarray([year in years for year in pd.to_datetime(frame.index).year])
+    return frame[hi], frame[~hi]
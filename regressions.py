@@ -0,0 +1,59 @@
+"""
+Batched least-squares fits of every asset class against every indicator.
+
+Same numbers as scipy.stats.linregress, but computed for a whole frame of
+asset classes at once instead of one column per callback.
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+TINY = 1.0e-20
+FIELDS = ["slope", "intercept", "r_value", "p_value", "std_err"]
+
+
+def linregress_frame(x, y):
+    """
+    Regress every column of `y` on every column of `x`, matched by row position.
+
+    Returns a frame indexed by (indicator, sector) with FIELDS as columns.
+    Columns of `y` with missing values come out as NaN, like linregress.
+    """
+    xv = np.asarray(x, dtype=float)
+    yv = np.asarray(y, dtype=float)
+    n = xv.shape[0]
+    df = n - 2
+
+    xc = xv - xv.mean(axis=0)
+    yc = yv - yv.mean(axis=0)
+    ssxm = (xc ** 2).mean(axis=0)[:, None]  # indicators x 1
+    ssym = (yc ** 2).mean(axis=0)[None, :]  # 1 x sectors
+    ssxym = xc.T.dot(yc) / n  # indicators x sectors
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_den = np.sqrt(ssxm * ssym)
+        r = np.where(r_den == 0, 0.0, ssxym / r_den)
+        r = np.clip(r, -1.0, 1.0)
+        t = r * np.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+        p = 2 * stats.t.sf(np.abs(t), df)
+        slope = ssxym / ssxm
+        intercept = yv.mean(axis=0)[None, :] - slope * xv.mean(axis=0)[:, None]
+        std_err = np.sqrt((1 - r ** 2) * ssym / ssxm / df)
+
+    index = pd.MultiIndex.from_product(
+        [list(x.columns), list(y.columns)], names=["indicator", "sector"])
+    values = np.stack([slope, intercept, r, p, std_err], axis=-1).reshape(-1, len(FIELDS))
+    return pd.DataFrame(values, index=index, columns=FIELDS)
+
+
+def regression_table(regimes):
+    """
+    Build the lookup table for all regimes at once.
+
+    `regimes` maps a regime name to an (indicators, sectors) pair; the result
+    is indexed by (regime, indicator, sector).
+    """
+    names = list(regimes)
+    frames = [linregress_frame(*regimes[name]) for name in names]
+    table = pd.concat(frames, keys=names, names=["regime"])
+    return table.sort_index()
@@ -0,0 +1,175 @@
+"""
+Resampled significance for the sector vs indicator regressions.
+
+A regime has a dozen or so years, too few to lean on the t-distribution
+p-values of linregress. For every (regime, indicator, sector) fit this
+computes
+
+* a moving-block bootstrap confidence interval of the slope and of the
+  correlation: resample the regime's years in blocks of consecutive rows,
+  refit, take percentiles
+* a permutation p-value: shuffle the indicator against the returns and
+  count how often |r| is at least the observed |r|
+
+All draws of a batch are fitted at once: rows are gathered for every draw
+into (draws, years, columns) arrays and the fits are sums over the years
+axis. Missing years are left out pairwise, so sectors with gaps get
+intervals too. The sector columns can be split into chunks that are
+computed separately; the app runs each chunk as a background job of its
+own. Every chunk draws the same resamples, so the numbers don't depend on
+the number of chunks.
+
+`cached` keeps finished tables on disk as snapshot files (see snapshot.py),
+keyed by the data version and the parameters.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from snapshot import DATA_DIR, Snapshot, write
+
+DRAWS = 10000
+CONFIDENCE = .95
+SEED = 0
+# draws fitted per batch, which bounds memory to a few (BATCH, years, sectors) arrays
+BATCH = 1000
+# fewer years than this in a regime leaves the fit NaN
+MIN_YEARS = 3
+CACHE_DIR = os.path.join(DATA_DIR, "significance")
+FIELDS = ["slope_low", "slope_high", "r_low", "r_high", "p_value"]
+
+
+def block_indices(rows, draws, block, random):
+    """(draws, rows) row positions of moving-block bootstrap resamples; blocks wrap around the end."""
+    blocks = -(-rows // block)
+    starts = random.randint(0, rows, size=(draws, blocks))
+    return ((starts[:, :, None] + np.arange(block)) % rows).reshape(draws, -1)[:, :rows]
+
+
+def permutation_indices(rows, draws, random):
+    """(draws, rows) row positions, one random permutation per draw."""
+    return np.argsort(random.random_sample((draws, rows)), axis=1)
+
+
+def _fits(x, y, present):
+    """
+    Slope, correlation and pair count of every column of `y` on every column
+    of `x` for a batch of draws: (..., years, indicators) x, (..., years,
+    sectors) y with missing values zeroed and `present` marking the rest;
+    the results are (..., indicators, sectors).
+    """
+    n = present.sum(axis=-2)[..., None, :]
+    sx = np.einsum("...ni,...ns->...is", x, present)
+    sxx = np.einsum("...ni,...ns->...is", x * x, present)
+    sy = y.sum(axis=-2)[..., None, :]
+    syy = (y * y).sum(axis=-2)[..., None, :]
+    sxy = np.einsum("...ni,...ns->...is", x, y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sxy - sx * sy
+        var_x = n * sxx - sx ** 2
+        slope = cov / var_x
+        r = np.clip(cov / np.sqrt(var_x * (n * syy - sy ** 2)), -1, 1)
+    slope[~np.isfinite(slope)] = np.nan
+    return slope, r, n
+
+
+def _significance(x, y, draws, block, seed, confidence):
+    """(indicators, sectors, FIELDS) array for one chunk of sector columns."""
+    present = ~np.isnan(y)
+    y = np.where(present, y, 0.0)
+    present = present.astype(float)
+    rows = len(x)
+    slope, r, n = _fits(x, y, present)
+
+    random = np.random.RandomState(seed)
+    boot_slopes, boot_r = [], []
+    exceed = np.zeros(r.shape)
+    for start in range(0, draws, BATCH):
+        size = min(BATCH, draws - start)
+        rows_drawn = block_indices(rows, size, block, random)
+        b_slope, b_r, _ = _fits(x[rows_drawn], y[rows_drawn], present[rows_drawn])
+        boot_slopes.append(b_slope)
+        boot_r.append(b_r)
+        p_slope, p_r, _ = _fits(x[permutation_indices(rows, size, random)], y[None], present[None])
+        exceed += (np.abs(p_r) >= np.abs(r) - 1e-12).sum(axis=0)
+
+    tails = [50 * (1 - confidence), 50 * (1 + confidence)]
+    slope_low, slope_high = np.nanpercentile(np.concatenate(boot_slopes), tails, axis=0)
+    r_low, r_high = np.nanpercentile(np.concatenate(boot_r), tails, axis=0)
+    p_value = (exceed + 1) / (draws + 1)
+    stats = np.stack([slope_low, slope_high, r_low, r_high, p_value], axis=-1)
+    stats[(n < MIN_YEARS) | np.isnan(r)] = np.nan
+    return stats
+
+
+def significance_frame(x, y, draws=DRAWS, block=None, seed=SEED, confidence=CONFIDENCE):
+    """
+    Bootstrap intervals and permutation p-values of every column of `y` on
+    every column of `x`, matched by row position, indexed by (indicator,
+    sector) with FIELDS as columns. `block` defaults to the cube root of the
+    number of rows.
+    """
+    xv = np.asarray(x, dtype=float)
+    yv = np.asarray(y, dtype=float)
+    block = block or max(int(round(len(xv) ** (1. / 3))), 1)
+    stats = _significance(xv, yv, draws, block, seed, confidence)
+    index = pd.MultiIndex.from_product([list(x.columns), list(y.columns)], names=["indicator", "sector"])
+    return pd.DataFrame(stats.reshape(-1, len(FIELDS)), index=index, columns=FIELDS)
+
+
+def chunk_columns(columns, chunk, chunks):
+    """The `chunk`-th of `chunks` near-equal runs of `columns`."""
+    return list(np.array_split(np.asarray(columns, dtype=object), chunks)[chunk])
+
+
+def significance_table(regimes, chunk=0, chunks=1, **kwargs):
+    """
+    `significance_frame` for every regime, in the layout of
+    regressions.regression_table: `regimes` maps a regime name to an
+    (indicators, sectors) pair and the result is indexed by (regime,
+    indicator, sector). Only the `chunk`-th of `chunks` runs of each
+    regime's sector columns is computed.
+    """
+    names = list(regimes)
+    frames = []
+    for name in names:
+        x, y = regimes[name]
+        frames.append(significance_frame(x, y[chunk_columns(y.columns, chunk, chunks)], **kwargs))
+    return pd.concat(frames, keys=names, names=["regime"]).sort_index()
+
+
+def _path(key, cache_dir):
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+    return os.path.join(cache_dir, digest + ".bin")
+
+
+def load(key, cache_dir=CACHE_DIR):
+    """The table cached under `key`, or None."""
+    path = _path(key, cache_dir)
+    if not os.path.exists(path):
+        return None
+    snapshot = Snapshot(path)
+    names = sorted(snapshot.tables)
+    return pd.concat(
+        [snapshot.frame(name) for name in names],
+        keys=[tuple(name.split("/")) for name in names],
+        names=["regime", "indicator", "sector"]).sort_index()
+
+
+def cached(key, compute, cache_dir=CACHE_DIR):
+    """The table cached under `key` (a JSON-able dict), computing and storing it with `compute()` if missing."""
+    table = load(key, cache_dir)
+    if table is not None:
+        return table
+    table = compute()
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    # one snapshot table per (regime, indicator), indexed by sector
+    frames = {}
+    for (regime, indicator), frame in table.groupby(level=["regime", "indicator"]):
+        frames["{}/{}".format(regime, indicator)] = frame.reset_index(level=["regime", "indicator"], drop=True)
+    write(frames, _path(key, cache_dir), key=key)
+    return table
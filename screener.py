@@ -0,0 +1,101 @@
+"""
+Company screener over the latest SEC filing of every company.
+
+`load_companies(frequency)` joins archive/latest-snapshot-<frequency>.csv
+(one row per CIK: the report date and the latest value of each XBRL tag)
+with company-metadata.csv (name, sector, sector code, ticker) into one frame
+indexed by CIK, with float64 tags, a datetime report date, a categorical
+sector and the derived ratios in RATIOS.
+
+`Screener` answers screens with the filter language of the correlation
+tables (see table_query.py), from a sorted index of every column built up
+front, so a range filter is two binary searches:
+
+    screener = Screener(load_companies("yearly"))
+    screener.screen('current_ratio > num(2) && debt_ratio < num(.5) && sector eq "Manufacturing"')
+    screener.by_sector('Assets > num(1e9)', ["current_ratio", "net_margin"], how="mean")
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+
+from table_query import IndexedTable
+
+SNAPSHOT_CSVS = dict(
+    yearly="archive/latest-snapshot-yearly.csv",
+    quarterly="archive/latest-snapshot-quarterly.csv",
+)
+METADATA_CSV = "company-metadata.csv"
+METADATA_COLUMNS = ["name", "ticker", "sector", "sector_code"]
+# derived ratio -> (numerator tag, denominator tag)
+RATIOS = collections.OrderedDict([
+    ("current_ratio", ("AssetsCurrent", "LiabilitiesCurrent")),
+    ("cash_ratio", ("CashAndCashEquivalentsAtCarryingValue", "LiabilitiesCurrent")),
+    ("debt_ratio", ("Liabilities", "Assets")),
+    ("goodwill_share", ("Goodwill", "Assets")),
+    ("asset_turnover", ("Revenues", "Assets")),
+    ("operating_margin", ("OperatingIncomeLoss", "Revenues")),
+    ("net_margin", ("ComprehensiveIncomeNetOfTax", "Revenues")),
+])
+
+
+def load_companies(frequency="yearly"):
+    """The latest filing of every company joined with its metadata, indexed by CIK."""
+    filings = pd.read_csv(SNAPSHOT_CSVS[frequency], index_col=0)
+    filings.index.name = "cik"
+    report_date = pd.to_datetime(filings.pop("Report date"))
+    tags = filings.astype(float)
+    metadata = pd.read_csv(METADATA_CSV, index_col=0).reindex(tags.index)
+
+    frame = metadata[METADATA_COLUMNS].copy()
+    frame["sector"] = frame.sector.astype("category")
+    frame["report_date"] = report_date
+    frame = pd.concat([frame, tags], axis=1)
+    for ratio, (numerator, denominator) in RATIOS.items():
+        # a ratio over a zero or negative denominator means nothing
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frame[ratio] = (tags[numerator] / tags[denominator].where(tags[denominator] > 0)).round(4)
+    return frame
+
+
+class Screener(object):
+    def __init__(self, companies):
+        self.companies = companies
+        self.table = IndexedTable(companies.reset_index())
+        self.table.prepare()
+
+    def __len__(self):
+        return len(self.companies)
+
+    def rows(self, filtering=None, sorting=None):
+        """Positions of the matching companies, in `sorting` order."""
+        return self.table.rows(filtering, sorting)
+
+    def screen(self, filtering=None, sorting=None, columns=None, limit=None):
+        """The matching companies as a frame indexed by CIK."""
+        rows = self.rows(filtering, sorting)[:limit]
+        frame = self.companies.iloc[rows]
+        return frame if columns is None else frame[columns]
+
+    def page(self, page=0, page_size=25, sorting=None, filtering=None):
+        """Records of one page of the matching companies, for a DataTable."""
+        rows = self.rows(filtering, sorting)[page * page_size:(page + 1) * page_size]
+        frame = self.companies.iloc[rows].reset_index()
+        frame["report_date"] = frame.report_date.dt.strftime("%Y-%m-%d")
+        return frame.to_dict("records")
+
+    def count(self, filtering=None):
+        return self.table.count(filtering)
+
+    def by_sector(self, filtering=None, columns=None, how="median"):
+        """
+        Number of matching companies per sector and the `how` (median, mean,
+        sum...) of `columns` over them, every ratio by default.
+        """
+        matches = self.companies[self.table.mask(filtering)]
+        grouped = matches.groupby("sector", observed=True)
+        columns = list(RATIOS) if columns is None else columns
+        table = grouped[columns].agg(how)
+        table.insert(0, "companies", grouped.size())
+        return table
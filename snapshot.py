@@ -0,0 +1,182 @@
+"""
+Columnar binary snapshot of the CSVs in data/.
+
+`python snapshot.py` compiles every all-float CSV in data/ into one file,
+laid out as
+
+    magic | format version | header length | JSON header | float64 blocks
+
+Each block holds one table, stored column-major and 64-byte aligned, so a
+table loads as a read-only view onto a single memory map. Forked gunicorn
+workers share those pages instead of each parsing the CSVs again.
+
+`read_csv(path)` is a drop-in for `pd.read_csv(path, index_col=0)`. It falls
+back to parsing the CSV when the snapshot is missing, was written by another
+format version, or was built from a different version of that file.
+"""
+import collections
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"ACSNAP\x00\x00"
+FORMAT_VERSION = 1
+ALIGN = 64
+DATA_DIR = "data"
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "snapshot.bin")
+
+_PREAMBLE = struct.Struct("<8sII")
+
+
+def file_digest(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha1=file_digest(path))
+
+
+def _index_values(index):
+    # numpy scalars are not JSON serializable
+    return [v.item() if hasattr(v, "item") else v for v in index]
+
+
+def _padding(n):
+    return -n % ALIGN
+
+
+def write(frames, path, sources=None, **header):
+    """
+    Write all-float `frames` (name -> DataFrame) to a snapshot at `path`.
+    `sources` optionally maps names to the stamp of the file each came from;
+    extra keyword arguments are stored in the header.
+    """
+    tables = {}
+    blocks = []
+    offset = 0
+    for name, frame in frames.items():
+        if not all(dtype == np.float64 for dtype in frame.dtypes):
+            raise ValueError("{} has non-float columns".format(name))
+        block = np.ascontiguousarray(frame.values.T, dtype="<f8")
+        tables[name] = dict(
+            index=_index_values(frame.index),
+            index_name=frame.index.name,
+            columns=list(frame.columns),
+            offset=offset,
+            shape=list(block.shape),
+        )
+        if sources is not None:
+            tables[name]["source"] = sources[name]
+        blocks.append(block)
+        offset += block.nbytes + _padding(block.nbytes)
+
+    header = json.dumps(dict(header, tables=tables)).encode()
+    start = _PREAMBLE.size + len(header)
+
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b"\x00" * _padding(start))
+        for block in blocks:
+            f.write(block.tobytes())
+            f.write(b"\x00" * _padding(block.nbytes))
+    os.replace(tmp, path)
+    return path
+
+
+def build(data_dir=DATA_DIR, path=SNAPSHOT_PATH):
+    """Compile every all-float CSV under `data_dir` into the snapshot at `path`."""
+    frames = collections.OrderedDict()
+    sources = {}
+    for name in sorted(os.listdir(data_dir)):
+        if not name.endswith(".csv"):
+            continue
+        source = os.path.normpath(os.path.join(data_dir, name))
+        frame = pd.read_csv(source, index_col=0)
+        if not all(dtype == np.float64 for dtype in frame.dtypes):
+            continue
+        frames[source] = frame
+        sources[source] = _source_stamp(source)
+
+    data_version = hashlib.sha1("".join(
+        sources[source]["sha1"] for source in sorted(sources)).encode()).hexdigest()
+    return write(frames, path, sources, data_version=data_version)
+
+
+class Snapshot(object):
+    def __init__(self, path=SNAPSHOT_PATH):
+        with open(path, "rb") as f:
+            magic, version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError("{} is not a version {} snapshot".format(path, FORMAT_VERSION))
+            header = json.loads(f.read(header_len).decode())
+        start = _PREAMBLE.size + header_len
+        self.path = path
+        self.header = header
+        self.data_version = header.get("data_version")
+        self.tables = header["tables"]
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        self._start = start + _padding(start)
+
+    def __contains__(self, source):
+        return source in self.tables
+
+    def is_fresh(self, source):
+        table = self.tables.get(source)
+        if table is None or "source" not in table or not os.path.exists(source):
+            return False
+        stamp = table["source"]
+        stat = os.stat(source)
+        if stat.st_size != stamp["size"]:
+            return False
+        # checkouts and copies touch mtime without changing content
+        return stat.st_mtime_ns == stamp["mtime_ns"] or file_digest(source) == stamp["sha1"]
+
+    def array(self, source):
+        """Read-only column-major (columns x rows) float64 view of a table."""
+        table = self.tables[source]
+        cols, rows = table["shape"]
+        begin = self._start + table["offset"]
+        return self._buffer[begin:begin + cols * rows * 8].view("<f8").reshape(cols, rows)
+
+    def frame(self, source):
+        table = self.tables[source]
+        index = pd.Index(table["index"], name=table["index_name"])
+        return pd.DataFrame(self.array(source).T, index=index, columns=table["columns"], copy=False)
+
+
+_snapshot = None
+
+
+def load(path=SNAPSHOT_PATH):
+    """Open the process-wide snapshot, or return None if there is no usable one."""
+    global _snapshot
+    if _snapshot is None or _snapshot.path != path:
+        try:
+            _snapshot = Snapshot(path)
+        except (IOError, OSError, ValueError):
+            return None
+    return _snapshot
+
+
+def read_csv(source, path=SNAPSHOT_PATH):
+    """`pd.read_csv(source, index_col=0)`, served from the snapshot when it is fresh."""
+    source = os.path.normpath(source)
+    snapshot = load(path)
+    if snapshot is not None and snapshot.is_fresh(source):
+        return snapshot.frame(source)
+    return pd.read_csv(source, index_col=0)
+
+
+if __name__ == '__main__':
+    print("wrote", build())
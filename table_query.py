@@ -0,0 +1,305 @@
+"""
+Server-side paging, sorting and filtering for dash_table.DataTable.
+
+With `pagination_mode`, `sorting` and `filtering` set to 'be' the table sends
+its `pagination_settings`, `sorting_settings` and `filtering_settings` to a
+callback instead of holding every row in the browser. `IndexedTable` answers
+those with one page of records:
+
+    table = IndexedTable(frame)
+    table.page(0, 25, [{"column_id": "energy", "direction": "desc"}], 'energy > num(.5)')
+
+Filters use the table's own language - `&&`/`and`, `||`/`or`, `!`,
+parentheses, `eq ne gt ge lt le` (or `= != > >= < <=`), `is nil`, `is num`,
+`is str`, `is even`, `is odd`, `is bool`, `is prime` - with columns as bare
+words and values as `num(.5)`, `str(x)` or quoted strings. Comparisons
+against a value are answered from a sorted index of each column, and masks
+and row orders are cached per filter and sort.
+"""
+import collections
+import operator
+import re
+import threading
+
+import numpy as np
+
+_SPACE = re.compile(r"\s*")
+_OR = re.compile(r"or\s|\|\|", re.I)
+_AND = re.compile(r"and\s|&&", re.I)
+_NOT = re.compile(r"!")
+_OPEN = re.compile(r"\(")
+_CLOSE = re.compile(r"\)")
+_UNARY = re.compile(r"is (nil|odd|even|bool|num|object|str|prime)\b", re.I)
+_RELATIONAL = re.compile(r">=|<=|!=|>|<|=|(ge|le|gt|lt|eq|ne)\b", re.I)
+_OPERAND = re.compile(r"""(num|str)\(([^()]*)\)|'((?:[^']|\\')*)'|"((?:[^"]|\\")*)"|([\w\-%]+)""")
+
+_OPERATORS = {
+    "=": "eq", "!=": "ne", ">": "gt", ">=": "ge", "<": "lt", "<=": "le",
+    "eq": "eq", "ne": "ne", "gt": "gt", "ge": "ge", "lt": "lt", "le": "le",
+}
+_FLIPPED = dict(eq="eq", ne="ne", gt="lt", ge="le", lt="gt", le="ge")
+
+
+class QueryError(ValueError):
+    pass
+
+
+class _Parser(object):
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def _match(self, pattern):
+        self.pos = _SPACE.match(self.text, self.pos).end()
+        match = pattern.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+        return match
+
+    def _error(self, expected):
+        raise QueryError("expected {} at {!r}".format(expected, self.text[self.pos:]))
+
+    def parse(self):
+        node = self._or()
+        if _SPACE.match(self.text, self.pos).end() != len(self.text):
+            self._error("end of filter")
+        return node
+
+    def _or(self):
+        node = self._and()
+        while self._match(_OR):
+            node = ("or", node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._match(_AND):
+            node = ("and", node, self._not())
+        return node
+
+    def _not(self):
+        if self._match(_NOT):
+            return ("not", self._not())
+        return self._atom()
+
+    def _atom(self):
+        if self._match(_OPEN):
+            node = self._or()
+            if not self._match(_CLOSE):
+                self._error("')'")
+            return node
+        left = self._operand()
+        unary = self._match(_UNARY)
+        if unary:
+            return ("is", unary.group(1).lower(), left)
+        relational = self._match(_RELATIONAL)
+        if not relational:
+            self._error("an operator")
+        return ("compare", _OPERATORS[relational.group(0).lower()], left, self._operand())
+
+    def _operand(self):
+        match = self._match(_OPERAND)
+        if not match:
+            self._error("a column or value")
+        function, argument, single, double, word = match.groups()
+        if function == "num":
+            try:
+                return ("value", float(argument))
+            except ValueError:
+                raise QueryError("num({}) is not a number".format(argument))
+        if function == "str":
+            return ("value", argument)
+        if single is not None or double is not None:
+            return ("value", single if single is not None else double)
+        return ("column", word)
+
+
+def parse(expression):
+    """Syntax tree of a filter expression; raises QueryError if it is not valid."""
+    return _Parser(expression).parse()
+
+
+def _primes(values):
+    values = np.where(np.isfinite(values), values, 0)
+    whole = (values == np.floor(values)) & (values >= 2)
+    candidates = values[whole].astype(np.int64)
+    prime = np.ones(len(candidates), dtype=bool)
+    largest = candidates.max() if len(candidates) else 0
+    for divisor in range(2, int(np.sqrt(largest)) + 1):
+        prime &= (candidates % divisor != 0) | (candidates == divisor)
+    out = np.zeros(len(values), dtype=bool)
+    out[np.flatnonzero(whole)[prime]] = True
+    return out
+
+
+class IndexedTable(object):
+    """One frame served a page at a time, with a sorted index per column."""
+
+    def __init__(self, frame, cache_size=64):
+        self.frame = frame.reset_index(drop=True)
+        self.columns = list(self.frame.columns)
+        self.cache_size = cache_size
+        self._indexes = {}
+        self._masks = collections.OrderedDict()
+        self._rows = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _numeric(self, column):
+        return self.frame[column].dtype.kind in "biuf"
+
+    def _index(self, column):
+        """(row order, sorted values, non-null count, dense rank per row) for one column."""
+        if column not in self._indexes:
+            series = self.frame[column]
+            if not self._numeric(column):
+                series = series.astype(str).where(series.notnull())
+            order = series.sort_values(kind="mergesort", na_position="last").index.values
+            valid = int(series.notnull().sum())
+            ordered = series.values[order[:valid]]
+            rank = np.full(len(series), valid, dtype=np.int64)
+            rank[order[:valid]] = np.r_[0, np.cumsum(ordered[1:] != ordered[:-1])] if valid else []
+            self._indexes[column] = order, ordered, valid, rank
+        return self._indexes[column]
+
+    def prepare(self, columns=None):
+        """Build the sorted index of `columns` (default all) now rather than on first use."""
+        for column in self.columns if columns is None else columns:
+            self._index(column)
+
+    def _column(self, name):
+        if name not in self.columns:
+            raise QueryError("no column {!r}".format(name))
+        return name
+
+    def _rows_mask(self, rows):
+        mask = np.zeros(len(self.frame), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def _compare_value(self, column, op, value):
+        order, ordered, valid, rank = self._index(column)
+        if self._numeric(column):
+            try:
+                value = float(value)
+            except ValueError:
+                value = None
+        elif isinstance(value, float):
+            value = None
+        if value is None:
+            # a value of the wrong type only satisfies ne
+            return self._rows_mask(order[:valid]) if op == "ne" else np.zeros(len(self.frame), dtype=bool)
+        lo = np.searchsorted(ordered, value, side="left")
+        hi = np.searchsorted(ordered, value, side="right")
+        rows = dict(
+            eq=order[lo:hi],
+            ne=np.r_[order[:lo], order[hi:valid]],
+            gt=order[hi:valid],
+            ge=order[lo:valid],
+            lt=order[:lo],
+            le=order[:hi],
+        )[op]
+        return self._rows_mask(rows)
+
+    def _evaluate(self, node):
+        kind = node[0]
+        if kind == "and":
+            return self._evaluate(node[1]) & self._evaluate(node[2])
+        if kind == "or":
+            return self._evaluate(node[1]) | self._evaluate(node[2])
+        if kind == "not":
+            return ~self._evaluate(node[1])
+        if kind == "is":
+            return self._is(node[1], node[2])
+        op, left, right = node[1:]
+        if left[0] == "value" and right[0] == "column":
+            op, left, right = _FLIPPED[op], right, left
+        if left[0] == "column" and right[0] == "value":
+            return self._compare_value(self._column(left[1]), op, right[1])
+        if left[0] == "value":
+            try:
+                return np.full(len(self.frame), bool(getattr(operator, op)(left[1], right[1])))
+            except TypeError:
+                return np.zeros(len(self.frame), dtype=bool)
+        # column against column
+        try:
+            return getattr(operator, op)(self.frame[self._column(left[1])], self.frame[self._column(right[1])]).values
+        except TypeError:
+            return np.zeros(len(self.frame), dtype=bool)
+
+    def _is(self, check, operand):
+        if operand[0] == "value":
+            return np.full(len(self.frame), check == "nil" and operand[1] is None)
+        column = self._column(operand[1])
+        series = self.frame[column]
+        if check == "nil":
+            return series.isnull().values
+        if check == "bool":
+            return np.full(len(series), series.dtype.kind == "b")
+        if check == "object":
+            return np.zeros(len(series), dtype=bool)
+        if check == "str":
+            return series.notnull().values & (not self._numeric(column))
+        if not self._numeric(column):
+            return np.zeros(len(series), dtype=bool)
+        values = series.values.astype(float)
+        if check == "num":
+            return ~np.isnan(values)
+        if check == "prime":
+            return _primes(values)
+        with np.errstate(invalid="ignore"):
+            return np.mod(values, 2) == (1 if check == "odd" else 0)
+
+    def _cached(self, cache, key, compute):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = compute()
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def mask(self, filtering):
+        """Boolean row mask for a filter expression; an empty or invalid filter keeps every row."""
+        filtering = (filtering or "").strip()
+
+        def compute():
+            if not filtering:
+                return np.ones(len(self.frame), dtype=bool)
+            try:
+                return self._evaluate(parse(filtering))
+            except QueryError:
+                return np.ones(len(self.frame), dtype=bool)
+        return self._cached(self._masks, filtering, compute)
+
+    def rows(self, filtering=None, sorting=None):
+        """Positions of the filtered rows in sorted order; nulls sort last either way."""
+        keys = tuple((s["column_id"], s["direction"]) for s in sorting or [] if s.get("column_id") in self.columns)
+
+        def compute():
+            rows = np.flatnonzero(self.mask(filtering))
+            if not keys:
+                return rows
+            lexkeys = []
+            for column, direction in reversed(keys):
+                order, ordered, valid, rank = self._index(column)
+                key = rank[rows]
+                if direction == "desc":
+                    key = np.where(key < valid, valid - 1 - key, key)
+                lexkeys.append(key)
+            return rows[np.lexsort(lexkeys)]
+        return self._cached(self._rows, ((filtering or "").strip(), keys), compute)
+
+    def count(self, filtering=None):
+        return int(self.mask(filtering).sum())
+
+    def page(self, page=0, page_size=25, sorting=None, filtering=None):
+        """Records of one page of the filtered, sorted table."""
+        rows = self.rows(filtering, sorting)
+        start = page * page_size
+        return self.frame.iloc[rows[start:start + page_size]].to_dict("records")